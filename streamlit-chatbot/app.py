@@ -1,298 +1,734 @@
 import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import uuid
+import copy
+import functools
+import os
 import random
-from groq import Groq # Moved this import here, at the top
+import re
+import tempfile
+import time
+from context_window import ContextWindow, count_tokens, format_usage
+from streaming import StreamRenderer, format_stream_stats
+from llm_client import SharedLLMClient, format_pool_stats
+from transcript import new_message, compact_messages, cached_markdown, prepare_markdown, forget_rendered_messages, render_transcript, render_message_context
+from storage import DEFAULT_SQLITE_PATH, create_conversation_store
+from learner_archive import ArchiveError, import_archive, write_archive
+from learner_state import LEARNER_STATE_FIELDS, DEFAULT_CACHE_TTL, VersionConflict, LearnerStateStore, create_learner_state_backend, format_learner_state_stats
+from response_cache import ResponseCache, replay_text, format_cache_stats
+from resilience import ResilientCaller, format_resilience_stats
+from llm_gateway import LLMGateway, GatewayError, GatewayBusy, RequestTimeout, format_gateway_stats
+from quiz_pool import QuizPool, quiz_prompt, format_quiz_question, normalize_answer, is_correct_answer
+from metrics import MetricsRegistry, MetricsExporter, TOKEN_BUCKETS, format_metrics_summary
+from intent_router import IntentRouter, format_router_stats
+from compaction import SUMMARY_MAX_TOKENS, Compactor, compaction_prompt, format_memories, format_compaction_stats
+from games import (DIFFICULTIES, GUESS_RANGES, RPS_EMOJI, RPS_HISTORY, RPS_MOVES, C4_CELLS, C4_WIDTH, ConnectFourEngine, TicTacToeEngine,
+                   c4_aligned, c4_can_play, c4_cells, c4_play, guess_hint, guess_limit, rps_bot_move, rps_result, ttt_winner,
+                   format_game_stats)
+from session_memory import SessionMemoryGovernor, format_session_memory_stats
+from reminder_scheduler import (DEFAULT_DAY_SECONDS, QUIZ_CORRECT_QUALITY, QUIZ_WRONG_QUALITY, REVISION_DONE_QUALITY,
+                                ReminderQueue, new_reminder, review, format_due)
 
 # --- Groq API Client Initialization ---
-# Initialize the Groq client using your secret API key
+@st.cache_resource
+def get_shared_llm_client(api_key, **client_settings):
+    """Creates the Groq client and its connection pool once per process, shared by all sessions and reruns."""
+    return SharedLLMClient(api_key, **client_settings)
+
+@st.cache_resource
+def get_resilient_caller(api_key, **resilience_settings):
+    """Wraps the shared client with rate limiting, retries and model fallback (one per process)."""
+    return ResilientCaller(get_shared_llm_client(api_key, **st.secrets.get("llm_client", {})).client, **resilience_settings)
+
+@st.cache_resource
+def get_llm_gateway(api_key, **gateway_settings):
+    """Creates the process-wide gateway that runs every model request on one event loop."""
+    return LLMGateway(get_resilient_caller(api_key, **st.secrets.get("resilience", {})), **gateway_settings)
+
+# Initialize the Groq client using your secret API key. Pool size, timeouts and HTTP/2
+# can be tuned in an optional [llm_client] section of secrets.toml, rate limits, retries
+# and fallback models in [resilience], concurrency, deadlines and coalescing
+# of identical in-flight requests in [llm_gateway].
 try:
-    client = Groq(
-        api_key=st.secrets["GROQ_API_KEY"],
-    )
+    shared_llm_client = get_shared_llm_client(st.secrets["GROQ_API_KEY"], **st.secrets.get("llm_client", {}))
+    resilient_caller = get_resilient_caller(st.secrets["GROQ_API_KEY"], **st.secrets.get("resilience", {}))
+    llm_gateway = get_llm_gateway(st.secrets["GROQ_API_KEY"], **st.secrets.get("llm_gateway", {}))
 except KeyError:
     st.error("Error: GROQ_API_KEY not found in Streamlit secrets. Please add your Groq API key.")
     st.stop()
 
+# Identifies this browser session to the gateway, so a new prompt cancels this session's previous one
+if "gateway_session_id" not in st.session_state:
+    st.session_state.gateway_session_id = uuid.uuid4().hex
+
+# --- Response Cache ---
+@st.cache_resource
+def get_response_cache(**cache_settings):
+    """Creates the process-wide cache of tutor and quiz answers."""
+    return ResponseCache(**cache_settings)
+
+# Size, TTL and similarity matching (semantic = true, off by default) can be tuned in an optional
+# [response_cache] section of secrets.toml
+response_cache = get_response_cache(**st.secrets.get("response_cache", {}))
+
+def stream_chat_completion(renderer, model, messages):
+    """Streams a completion into the renderer, replaying repeated prompts from the response cache.
+
+    Returns the response text, which is partial or empty if the gateway could not finish the request.
+    """
+    mode = st.session_state.get("app_mode", "Home")
+    cached_answer = response_cache.get(model, messages)
+    if cached_answer is not None:
+        full_response_content = renderer.render(replay_text(cached_answer))
+        record_llm_metrics(mode, "cache", renderer.stats, messages, full_response_content)
+        return full_response_content
+    try:
+        request = llm_gateway.submit(st.session_state.gateway_session_id, model=model, messages=messages)
+        # Show the learner's place in line while all upstream slots are busy
+        request.wait_for_slot(lambda position: renderer.placeholder.markdown(f"⏳ Lots of friends are asking questions right now. You're number {position} in line..."))
+        full_response_content = renderer.render(request.chunks())
+    except GatewayError as e:
+        full_response_content = renderer.finish()
+        if isinstance(e, GatewayBusy):
+            st.warning("I'm helping lots of friends right now. Please try again in a moment! 🙏")
+        elif isinstance(e, RequestTimeout):
+            st.warning("That took too long, so I stopped. Please try asking again! ⏰")
+        else:
+            st.warning(f"Sorry, I couldn't finish that answer: {e}")
+        metrics.inc("llm_errors", mode=mode, error=type(e).__name__, help_text="Model requests the gateway could not finish")
+        return full_response_content
+    record_llm_metrics(mode, "model", renderer.stats, messages, full_response_content)
+    response_cache.put(model, messages, full_response_content)
+    return full_response_content
+
+# --- Intent Router ---
+@st.cache_resource
+def get_intent_router(**router_settings):
+    """Creates the process-wide router that decides which prompts need which model."""
+    return IntentRouter(**router_settings)
+
+# Models, the short-question word limit and enabled = false can be set in an optional [intent_router] section
+intent_router = get_intent_router(**st.secrets.get("intent_router", {}))
+
+def answer_prompt(renderer, prompt, messages):
+    """Answers small talk and arithmetic locally and sends the rest to the model the router picks.
+
+    Returns the route and the response text.
+    """
+    route = intent_router.route(prompt)
+    if route.tier == "local":
+        full_response_content = renderer.render(replay_text(route.answer))
+    else:
+        full_response_content = stream_chat_completion(renderer, route.model, messages)
+    total = renderer.stats["total"]
+    intent_router.record_latency(route, total)
+    metrics.inc("routed_prompts", tier=route.tier, intent=route.intent, help_text="Chat and study prompts by routing decision")
+    metrics.observe("routed_answer_seconds", total, tier=route.tier, mode=st.session_state.get("app_mode", "Home"),
+                    help_text="Time until a routed prompt was answered, per tier")
+    return route, full_response_content
+
+# --- Quiz Question Pool ---
+QUIZ_WAIT_TIMEOUT = 20 # Seconds to wait for a refill when a subject's pool is empty
+
+def generate_quiz_batch(subject_name, count):
+    """Asks the model for several quiz questions in one call (runs on the pool's worker thread)."""
+    messages = quiz_prompt(subject_name, count)
+    started_at = time.perf_counter()
+    quiz_request = llm_gateway.submit(
+        model="llama3-8b-8192", # Use a lighter model for quizzes
+        messages=messages,
+        max_tokens=150 * count,
+    )
+    chunks = []
+    ttft = None
+    for chunk in quiz_request.chunks():
+        if ttft is None:
+            ttft = time.perf_counter() - started_at
+        chunks.append(chunk)
+    text = "".join(chunks)
+    record_llm_metrics("Quiz Time", "model", {"ttft": ttft, "total": time.perf_counter() - started_at}, messages, text)
+    return text
+
+@st.cache_resource
+def get_quiz_pool():
+    """Creates the process-wide quiz pool and its refill worker."""
+    return QuizPool(generate_quiz_batch)
+
+quiz_pool = get_quiz_pool()
+
+# --- Metrics ---
+@st.cache_resource
+def get_metrics(**exporter_settings):
+    """Creates the process-wide metrics registry and starts its exporter, if one is configured."""
+    registry = MetricsRegistry()
+    # Component stats are exported as gauges, read at scrape time
+    registry.add_collector("pool", shared_llm_client.pool_stats)
+    registry.add_collector("gateway", llm_gateway.stats)
+    registry.add_collector("resilience", resilient_caller.stats)
+    registry.add_collector("cache", response_cache.stats)
+    registry.add_collector("router", intent_router.stats)
+    MetricsExporter(registry, **exporter_settings)
+    return registry
+
+# Serve Prometheus metrics with e.g. port = 9464, or write them to a file with path = "metrics.prom",
+# in an optional [metrics] section of secrets.toml
+metrics = get_metrics(**st.secrets.get("metrics", {}))
+# Every timing of this run is labelled with the section the learner is in
+run_mode = st.session_state.get("app_mode", "Home")
+
+def record_llm_metrics(mode, source, stats, messages, response_text):
+    """Records latency and token counts of one model answer (source is "model" or "cache")."""
+    metrics.inc("llm_requests", mode=mode, source=source, help_text="Model answers by mode and source")
+    metrics.observe("llm_ttft_seconds", stats["ttft"], mode=mode, source=source, help_text="Time to first token")
+    metrics.observe("llm_duration_seconds", stats["total"], mode=mode, source=source, help_text="Time until the answer was complete")
+    metrics.observe("llm_prompt_tokens", sum(count_tokens(m["content"]) for m in messages), buckets=TOKEN_BUCKETS,
+                    mode=mode, help_text="Estimated prompt tokens sent")
+    metrics.observe("llm_completion_tokens", count_tokens(response_text), buckets=TOKEN_BUCKETS,
+                    mode=mode, help_text="Estimated tokens received")
+
 # --- Streamlit Page Configuration ---
+page_setup_started_at = time.perf_counter()
 st.set_page_config(page_title="🫒live Chatbot - Learning Companion", layout="wide", initial_sidebar_state="expanded")
 
 # --- Custom CSS for Olive Theme and Layout ---
-st.markdown(
+THEME_CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "olive_theme.css")
+
+@st.cache_resource
+def load_theme_css(path):
+    """Reads and minifies the theme stylesheet once per process."""
+    with open(path, encoding="utf-8") as f:
+        css = f.read()
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL) # Comments
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css) # Whitespace around punctuation
+    css = re.sub(r"\s+", " ", css).strip()
+    return f"<style>{css}</style>"
+
+# Style-only HTML goes to Streamlit's event container, so it takes no space in the layout. Fragment
+# reruns (most interactions, see below) don't resend it at all.
+st.html(load_theme_css(THEME_CSS_PATH))
+metrics.observe("phase_seconds", time.perf_counter() - page_setup_started_at, phase="page_setup", mode=run_mode,
+                help_text="Script time spent per phase of a run")
+
+# --- Conversation Storage ---
+@st.cache_resource
+def get_conversation_store(backend, path, url=None, shared=False):
+    """Opens the storage backend once per process; it is shared by all sessions."""
+    return create_conversation_store(backend, path, url, shared)
+
+@st.cache_resource
+def get_learner_state_store(backend, path, url=None, cache_ttl=DEFAULT_CACHE_TTL):
+    """Opens the shared learner state backend and its local read cache once per process."""
+    store = LearnerStateStore(create_learner_state_backend(backend, path, url), cache_ttl=cache_ttl)
+    metrics.add_collector("learner_state", store.stats)
+    return store
+
+# Backend ("sqlite", "memory" or "redis"), database file or Redis url can be set in an optional [storage]
+# section of secrets.toml. Several workers can share a SQLite file with shared = true, or a Redis server,
+# so any worker can serve any learner without sticky sessions.
+storage_settings = st.secrets.get("storage", {})
+storage_backend = storage_settings.get("backend", "sqlite")
+storage_path = storage_settings.get("path", DEFAULT_SQLITE_PATH)
+conversation_store = get_conversation_store(storage_backend, storage_path, storage_settings.get("url"), storage_settings.get("shared", False))
+learner_state_store = get_learner_state_store(storage_backend, storage_path, storage_settings.get("url"),
+                                              storage_settings.get("state_cache_ttl", DEFAULT_CACHE_TTL))
+
+# --- Conversation Compaction ---
+COMPACTION_INTERVAL = 3600 # Seconds between compaction runs
+MEMORY_TOKENS = 384        # Newest summaries of archived turns sent with each prompt
+
+def summarize_for_compaction(transcript):
+    """Asks the small model to summarize archived turns (runs on the compactor's threads)."""
+    request = llm_gateway.submit(model=intent_router.small_model, messages=compaction_prompt(transcript), max_tokens=SUMMARY_MAX_TOKENS)
+    return request.text()
+
+@st.cache_resource
+def get_compactor(backend, path, url=None, shared=False, **compaction_settings):
+    """Starts the process-wide background job that compacts cold conversations."""
+    compactor = Compactor(get_conversation_store(backend, path, url, shared), summarize_for_compaction, **compaction_settings)
+    metrics.add_collector("compaction", compactor.stats)
+    return compactor
+
+# Off by default. Enable with enabled = true in an optional [compaction] section of secrets.toml, which can
+# also set interval (seconds), idle_seconds, keep_messages, chunk_messages, max_concurrency and processes.
+compaction_settings = dict(st.secrets.get("compaction", {}))
+compactor = None
+if compaction_settings.pop("enabled", False):
+    compaction_settings.setdefault("interval", COMPACTION_INTERVAL)
+    compactor = get_compactor(storage_backend, storage_path, storage_settings.get("url"), storage_settings.get("shared", False),
+                              **compaction_settings)
+
+# --- Session Memory ---
+@st.cache_resource
+def get_session_governor(**memory_settings):
+    """Starts the process-wide governor that keeps the memory held by sessions in budget."""
+    governor = SessionMemoryGovernor(is_active=lambda session_id: not Runtime.exists() or Runtime.instance().is_active_session(session_id),
+                                     **memory_settings)
+    metrics.add_collector("session_memory", governor.stats)
+    return governor
+
+# Per-session and per-process budgets (bytes), idle time before eviction, sweep and measure intervals (seconds) and the
+# directory for spilled sessions can be set in an optional [memory] section of secrets.toml
+# (session_budget, process_budget, idle_seconds, sweep_interval, measure_interval, spill_dir).
+session_governor = get_session_governor(**st.secrets.get("memory", {}))
+
+def restore_session_state():
+    """Brings back state the memory governor spilled to disk, so an evicted session resumes where it left off.
+
+    Also marks the session as running, so the governor doesn't evict it until track_session_memory().
     """
-    <style>
-    /* Olive Color Palette */
-    :root {
-        --olive-dark: #3a503e;   /* Darker olive for accents/text */
-        --olive-medium: #55725c; /* Medium olive for primary elements */
-        --olive-light: #8da18b;  /* Lighter olive for backgrounds */
-        --olive-accent: #a3b899; /* Even lighter, more muted green */
-        --cream-white: #f5f5dc;  /* Creamy white for main content background */
-        --text-dark: #333333;    /* Dark grey for general text */
-        --text-light: #ffffff;   /* White for text on dark backgrounds */
-        --olive-background: #8da18b; /* Explicitly set for main page background */
-    }
-
-    /* Overall App Background */
-    .stApp {
-        background-color: var(--olive-background);
-        color: var(--text-dark);
-    }
-
-    /* Sidebar Styling - Making it fixed and prominent */
-    .st-emotion-cache-1jmve0f { /* Targeting the sidebar container */
-        background-color: var(--olive-medium);
-        border-right: 1px solid var(--olive-dark);
-        color: var(--text-light);
-        width: 300px !important; /* Fixed width for sidebar */
-        min-width: 300px !important;
-        max-width: 300px !important;
-    }
-    .st-emotion-cache-1jmve0f .st-emotion-cache-16txt4v { /* Sidebar header/title */
-        color: var(--text-light);
-    }
-    .st-emotion-cache-1jmve0f .st-emotion-cache-v01mih { /* Sidebar radio button labels */
-        color: var(--text-light) !important;
-    }
-    .st-emotion-cache-1jmve0f .st-emotion-cache-199z13k { /* Active radio button in sidebar */
-        background-color: var(--olive-dark) !important;
-        border-radius: 5px;
-    }
-    .st-emotion-cache-1jmve0f .st-emotion-cache-v01mih p { /* Text within sidebar */
-        color: var(--text-light);
-    }
-    /* Hide the sidebar expander button as sidebar is always expanded */
-    [data-testid="stSidebarExpander"] {
-        display: none !important;
-    }
-
-    /* Main Content Styling */
-    h1, h2, h3, h4, h5, h6 {
-        color: var(--olive-dark);
-    }
-    .stButton>button {
-        background-color: var(--olive-medium);
-        color: var(--text-light);
-        border: none;
-        border-radius: 8px;
-        padding: 10px 20px;
-        font-size: 16px;
-        transition: background-color 0.2s ease-in-out;
-    }
-    .stButton>button:hover {
-        background-color: var(--olive-dark);
-        color: var(--text-light);
-    }
-    .stTextInput>div>div>input {
-        border-color: var(--olive-medium);
-        color: var(--text-dark); /* Ensure text input color is dark */
-    }
-    .stTextInput>div>div>input:focus {
-        border-color: var(--olive-dark);
-        box-shadow: 0 0 0 0.2rem rgba(85, 114, 92, 0.25); /* Medium olive with transparency */
-    }
-
-    /* Fix for radio button labels in main content area */
-    .st-emotion-cache-v01mih p { /* This targets all paragraph text in Streamlit components */
-        color: var(--text-dark); /* Make text dark for visibility on light backgrounds */
-    }
-    /* Specific targeting for radio button labels if needed for more precision */
-    .st-emotion-cache-199z13k + div p { /* This targets the text next to radio buttons/checkboxes */
-        color: var(--text-dark) !important;
-    }
-
-
-    /* Chat Messages - User */
-    .stChatMessage.st-emotion-cache-1c7y2c1.user { /* Targeting user message container */
-        background-color: var(--olive-accent); /* Lighter olive background */
-        color: var(--text-dark);
-        border-radius: 15px 15px 5px 15px; /* Rounded corners, less rounded at bottom-right */
-        padding: 15px;
-        margin-bottom: 10px;
-    }
-    .stChatMessage.st-emotion-cache-1c7y2c1.user .st-emotion-cache-zt5igk { /* User message text */
-        color: var(--text-dark);
-    }
-
-    /* Chat Messages - Assistant */
-    .stChatMessage.st-emotion-cache-1c7y2c1.assistant { /* Targeting assistant message container */
-        background-color: var(--olive-light); /* Slightly lighter olive background */
-        color: var(--text-dark);
-        border-radius: 15px 15px 15px 5px; /* Rounded corners, less rounded at bottom-left */
-        padding: 15px;
-        margin-bottom: 10px;
-    }
-    .stChatMessage.st-emotion-cache-1c7y2c1.assistant .st-emotion-cache-zt5igk { /* Assistant message text */
-        color: var(--text-dark);
-    }
-
-
-    /* Avatar Selection Screen CSS */
-    .centered-container {
-        display: flex;
-        flex-direction: column;
-        align-items: center;
-        justify-content: center;
-        text-align: center;
-        min-height: 80vh; /* Take up most of the viewport height */
-        padding: 20px;
-        background-color: var(--olive-background); /* Ensure consistency for this container */
-    }
-    .avatar-display {
-        font-size: 150px; /* Large emoji size */
-        margin-bottom: 20px;
-    }
-    .emoji-button-container {
-        display: flex;
-        flex-wrap: wrap;
-        gap: 10px;
-        justify-content: center;
-        margin-top: 20px;
-        max-width: 600px; /* Limit width of emoji grid */
-    }
-    .emoji-button {
-        background-color: var(--cream-white);
-        border: 1px solid var(--olive-accent);
-        border-radius: 8px;
-        padding: 10px 15px;
-        font-size: 30px;
-        cursor: pointer;
-        transition: all 0.2s ease-in-out;
-        color: var(--text-dark);
-    }
-    .emoji-button:hover {
-        background-color: var(--olive-accent);
-        border-color: var(--olive-dark);
-    }
-    /* Hide the default Streamlit header/footer for a cleaner initial look */
-    header { visibility: hidden; }
-    footer { visibility: hidden; }
-    .st-emotion-cache-z5fcl4 { padding-top: 2rem; } /* Adjust top padding if header is hidden */
-    </style>
-    """,
-    unsafe_allow_html=True
-)
-
-# --- Session State Initialization (No Persistence) ---
-# Default subjects will be created fresh each session
-if "user_subjects" not in st.session_state:
-    st.session_state.user_subjects = [
-        {"id": "general", "name": "General Chat", "emoji": "💬"},
-        {"id": str(uuid.uuid4()), "name": "Science", "emoji": "🔬"},
-        {"id": str(uuid.uuid4()), "name": "Maths", "emoji": "➕"},
-        {"id": str(uuid.uuid4()), "name": "Social Studies", "emoji": "🌍"},
-        {"id": str(uuid.uuid4()), "name": "Language", "emoji": "🗣️"},
-    ]
-
-# Chat histories for each subject (in-memory for the current session only)
-if "chat_histories_in_session" not in st.session_state:
-    st.session_state.chat_histories_in_session = {subj["id"]: [] for subj in st.session_state.user_subjects}
-
-# Learning progress (in-memory for the current session only)
-if "learning_progress" not in st.session_state:
-    st.session_state.learning_progress = {"lessons_completed": 0}
-
-# Reminders (in-memory for the current session only)
-if "user_reminders" not in st.session_state:
-    st.session_state.user_reminders = []
-
-# App mode and selected subject for the current session
-if "user_avatar" not in st.session_state:
-    st.session_state["user_avatar"] = "😀"
-if "app_mode" not in st.session_state:
-    st.session_state["app_mode"] = "Home"
-if "selected_subject_id" not in st.session_state:
-    st.session_state["selected_subject_id"] = "general" # Default to general chat
-
-
-# --- Functions (In-memory, no persistence) ---
-def add_message_to_session_history(subject_id, role, content):
-    """Adds a message to the specified chat history in session state."""
-    if subject_id not in st.session_state.chat_histories_in_session:
-        st.session_state.chat_histories_in_session[subject_id] = []
-    st.session_state.chat_histories_in_session[subject_id].append({"role": role, "content": content})
-
-def load_chat_history_from_session(subject_id):
-    """Loads chat history for a subject from session state."""
-    return st.session_state.chat_histories_in_session.get(subject_id, [])
+    ctx = get_script_run_ctx()
+    session_governor.touch(ctx.session_id, ctx.session_state) # First, so no eviction can start after the check below
+    session_governor.rehydrate(ctx.session_id, ctx.session_state)
+
+def session_value(key, factory):
+    """Returns a session-state value the governor may have evicted, creating it with factory() if missing."""
+    restore_session_state()
+    if key not in st.session_state:
+        st.session_state[key] = factory()
+    return st.session_state[key]
+
+def track_session_memory():
+    """Ends a run for the governor and measures this session's state now and then (its caches are dropped if it is
+    over budget)."""
+    ctx = get_script_run_ctx()
+    session_governor.track(ctx.session_id, ctx.session_state)
+
+def track_fragment_run():
+    """Ends a fragment-only run for the governor; full runs end with the call at the bottom of the script."""
+    if get_script_run_ctx().fragment_ids_this_run:
+        track_session_memory()
+
+restore_session_state() # This run has started
+
+# Only this many messages per conversation are kept in session memory; older ones are loaded on demand
+HOT_TAIL_MESSAGES = 200
+SEARCH_RESULTS = 10          # Hits listed under the search box
+SEARCH_CONTEXT_MESSAGES = 3  # Messages shown before and after a search hit
+
+# Spaced-repetition reminders. The length of a schedule "day" (shorten it to try the schedule out) and how
+# often the reminders panel checks for due ones can be set in an optional [reminders] section of secrets.toml.
+reminder_settings = st.secrets.get("reminders", {})
+REMINDER_DAY_SECONDS = reminder_settings.get("day_seconds", DEFAULT_DAY_SECONDS)
+REMINDER_TICK_SECONDS = reminder_settings.get("tick_seconds", 30)
+UPCOMING_REMINDERS = 3       # Not-yet-due reminders listed under the due ones
+
+# --- Session State Initialization ---
+# Each learner's data is keyed by an id kept in the URL, so a browser refresh (or a reconnect to
+# another worker) finds it again
+if "user_id" not in st.session_state:
+    st.session_state.user_id = st.query_params.get("learner") or uuid.uuid4().hex
+    st.query_params["learner"] = st.session_state.user_id
+
+# Conversation tails ("chat_histories_in_session", "study_messages"), memories of archived turns
+# ("conversation_memories"), context windows and stream stats are created on first use through
+# session_value(), since the memory governor may evict them between runs.
+
+def apply_learner_state(version, document):
+    """Copies a learner state document into session state (subjects, progress, reminders, avatar, quiz subject)."""
+    for field in LEARNER_STATE_FIELDS:
+        if st.session_state.get(field) != document[field]:
+            st.session_state[field] = document[field] # Unchanged values keep their objects (the reminder queue indexes them)
+    st.session_state.learner_state_version = version
+    # What this session last saw, to detect its own changes (documents saved by older versions may have more fields)
+    st.session_state.learner_state_base = copy.deepcopy({field: document[field] for field in LEARNER_STATE_FIELDS})
+
+def sync_learner_state():
+    """Saves this session's changes to the shared learner state and picks up changes made elsewhere."""
+    ours = {field: st.session_state[field] for field in LEARNER_STATE_FIELDS}
+    base = st.session_state.learner_state_base
+    if ours != base:
+        try:
+            version, document = learner_state_store.save(st.session_state.user_id, st.session_state.learner_state_version, base, copy.deepcopy(ours))
+        except VersionConflict:
+            # Other tabs or workers keep winning the race: keep our changes and try again on the next run
+            metrics.inc("learner_state_save_conflicts", help_text="Learner state saves postponed after repeated conflicts")
+            return
+    else:
+        version, document = learner_state_store.get(st.session_state.user_id)
+    if version == st.session_state.learner_state_version:
+        return
+    if any(document[field] != ours[field] for field in LEARNER_STATE_FIELDS):
+        # Another worker or tab changed this learner: drop cached conversation tails so they reload from storage
+        st.session_state.chat_histories_in_session = {}
+        st.session_state.study_messages = {}
+        st.session_state.conversation_memories = {}
+    apply_learner_state(version, document)
+
+# Subjects, progress, reminders, avatar and quiz subject come from the shared learner state
+if "learner_state_version" not in st.session_state:
+    version, document = learner_state_store.get(st.session_state.user_id)
+    if document is None:
+        # New learner, or one saved before learner state existed: start from what the conversation store has
+        subjects = conversation_store.load_subjects(st.session_state.user_id) or [
+            {"id": "general", "name": "General Chat", "emoji": "💬"},
+            {"id": str(uuid.uuid4()), "name": "Science", "emoji": "🔬"},
+            {"id": str(uuid.uuid4()), "name": "Maths", "emoji": "➕"},
+            {"id": str(uuid.uuid4()), "name": "Social Studies", "emoji": "🌍"},
+            {"id": str(uuid.uuid4()), "name": "Language", "emoji": "🗣️"},
+        ]
+        document = {
+            "user_subjects": subjects,
+            "learning_progress": conversation_store.load_progress(st.session_state.user_id),
+            "user_reminders": conversation_store.load_reminders(st.session_state.user_id),
+            "user_avatar": "😀",
+            "quiz_subject_id": "general",
+        }
+        try:
+            # If another worker created it first, its document wins
+            version, document = learner_state_store.save(st.session_state.user_id, 0, document, document)
+        except VersionConflict:
+            version, document = learner_state_store.get(st.session_state.user_id, max_age=0)
+    apply_learner_state(version, document)
+    # Section and selected subject belong to this tab, not to the learner
+    st.session_state.setdefault("app_mode", "Home")
+    st.session_state.setdefault("selected_subject_id", "general") # Default to general chat
+    # Have quiz questions ready for this learner's subjects before they are needed
+    quiz_pool.warm(s["name"] for s in st.session_state.user_subjects if s["id"] != "general")
+else:
+    sync_learner_state() # Saves changes from the last fragment runs and picks up other workers' changes
+
+
+# --- Functions (Session state, persisted through the conversation store) ---
+def _session_conversations(kind):
+    """Returns the session-state dict holding the recent messages of each chat ("chat") or Study Time ("study")
+    conversation, filled lazily from storage."""
+    return session_value("chat_histories_in_session" if kind == "chat" else "study_messages", dict)
+
+def add_message_to_session_history(subject_id, role, content, kind="chat"):
+    """Adds a message to the specified conversation, persists it and returns it."""
+    history = load_chat_history_from_session(subject_id, kind)
+    message = new_message(role, content)
+    conversation_store.append_message(st.session_state.user_id, subject_id, message, kind)
+    history.append(message)
+    if len(history) > HOT_TAIL_MESSAGES:
+        del history[:len(history) - HOT_TAIL_MESSAGES] # Older turns stay in storage only
+    return message
+
+def load_chat_history_from_session(subject_id, kind="chat"):
+    """Returns the recent messages of a conversation, loading them from storage on first access."""
+    conversations = _session_conversations(kind)
+    if subject_id not in conversations:
+        # Archived turns are only decompressed when the learner scrolls back; prompts use their memories
+        conversations[subject_id] = compact_messages(conversation_store.load_messages(
+            st.session_state.user_id, subject_id, kind, limit=HOT_TAIL_MESSAGES, include_archived=False))
+    return conversations[subject_id]
+
+def load_conversation_memory(subject_id, kind="chat"):
+    """Returns the summaries of a conversation's archived turns, loading them once per session."""
+    memories = session_value("conversation_memories", dict)
+    key = f"{kind}:{subject_id}"
+    if key not in memories:
+        memories[key] = format_memories(conversation_store.load_memories(st.session_state.user_id, subject_id, kind), MEMORY_TOKENS)
+    return memories[key]
+
+def count_conversation_messages(subject_id, kind="chat"):
+    """Returns the total number of messages in a conversation, including those only in storage."""
+    return conversation_store.count_messages(st.session_state.user_id, subject_id, kind)
+
+def load_older_messages(subject_id, count, kind="chat"):
+    """Prepends up to `count` older messages from storage to the in-memory conversation."""
+    history = load_chat_history_from_session(subject_id, kind)
+    before_seq = history[0]["seq"] if history else None
+    history[:0] = compact_messages(conversation_store.load_messages(st.session_state.user_id, subject_id, kind, limit=count,
+                                                                    before_seq=before_seq))
+    return history
+
+def get_context_window(conversation_key):
+    """Returns the token-budgeted context window for a conversation (e.g. "chat:<subject_id>"), creating it on first use."""
+    context_windows = session_value("context_windows", dict)
+    if conversation_key not in context_windows:
+        context_windows[conversation_key] = ContextWindow()
+    return context_windows[conversation_key]
+
+def show_request_stats(conversation_key, placeholder):
+    """Shows token usage and streaming speed of the last request for a conversation in a placeholder."""
+    usage = get_context_window(conversation_key).last_usage
+    stats_text = " · ".join(filter(None, [format_usage(usage), format_stream_stats(session_value("stream_stats", dict).get(conversation_key))]))
+    if stats_text:
+        placeholder.caption(stats_text)
+
+def request_page_rerun():
+    """Asks for a whole-page rerun from a button callback inside a fragment (st.rerun() can't be called there)."""
+    st.session_state.page_rerun_requested = True
+
+def rerun_page_if_requested():
+    """Reruns the whole page if a callback of this fragment run asked for it."""
+    if st.session_state.pop("page_rerun_requested", False):
+        st.rerun()
+
+def open_search_hit(hit):
+    """Switches to the conversation a search hit is in (button callback, so the navigation widgets can be updated)."""
+    st.session_state["app_mode"] = "Study Time" if hit["kind"] == "study" else "Chat with Bot"
+    st.session_state["app_mode_radio"] = st.session_state["app_mode"]
+    st.session_state.selected_subject_id = hit["subject_id"]
+    st.session_state.pop("subject_chat_selector", None) # Recreated with the hit's subject selected
+    st.session_state.search_jump = hit
+    request_page_rerun() # The section and subject change
+
+def leave_search_hit():
+    """Goes back from a search hit to the latest messages."""
+    st.session_state.pop("search_jump", None)
+
+def show_search_hit(conversation_key, subject_id, kind="chat"):
+    """Shows only the messages around the opened search hit, if it is in this conversation; returns whether it did."""
+    hit = st.session_state.get("search_jump")
+    if hit is None:
+        return False
+    if (hit["kind"], hit["subject_id"]) != (kind, subject_id):
+        leave_search_hit() # The learner moved on to another conversation
+        return False
+    st.button("⬇️ Back to the latest messages", key=f"leave_search_{conversation_key}", on_click=leave_search_hit)
+    # Loaded straight from storage, so the rest of the transcript is neither loaded nor rendered
+    messages = conversation_store.load_messages(st.session_state.user_id, subject_id, kind, limit=2 * SEARCH_CONTEXT_MESSAGES + 1,
+                                                before_seq=hit["seq"] + SEARCH_CONTEXT_MESSAGES + 1)
+    render_message_context(messages, hit["seq"], st.session_state["user_avatar"])
+    return True
 
 def add_subject_to_session(subject_name, emoji):
     """Adds a new subject to session state."""
     new_subject_id = str(uuid.uuid4())
     new_subject_data = {"id": new_subject_id, "name": subject_name, "emoji": emoji}
     st.session_state.user_subjects.append(new_subject_data)
-    st.session_state.chat_histories_in_session[new_subject_id] = [] # Initialize new subject chat history
+    quiz_pool.warm([subject_name])
+    _session_conversations("chat")[new_subject_id] = [] # Initialize new subject chat history
     st.session_state.selected_subject_id = new_subject_id # Automatically select new subject
+    sync_learner_state()
     st.toast(f"'{subject_name}' added! 🥳")
-    st.rerun() # Rerun to update the sidebar subject list
 
 def update_learning_progress_session(lessons_to_add=1):
     """Updates the user's learning progress in session state."""
     current_lessons = st.session_state.learning_progress.get("lessons_completed", 0)
     st.session_state.learning_progress["lessons_completed"] = current_lessons + lessons_to_add
-
-def add_reminder_to_session(reminder_text, reminder_type="Quiz"):
-    """Adds a new reminder to session state."""
-    new_reminder_id = str(uuid.uuid4()) # Still use UUID for unique key in session
-    reminder_data = {
-        "id": new_reminder_id,
-        "text": reminder_text,
-        "type": reminder_type,
-        "completed": False
-    }
+    sync_learner_state()
+    if current_lessons < GAME_UNLOCK_THRESHOLD <= current_lessons + lessons_to_add:
+        st.rerun() # Games just unlocked; rerun the whole page so the right panel and sidebar show it
+
+def get_reminder_queue():
+    """Returns the due queue over the learner's reminders, rebuilt when the reminders came from another worker or tab."""
+    queue = st.session_state.get("reminder_queue")
+    if queue is None or queue.source is not st.session_state.user_reminders:
+        queue = st.session_state.reminder_queue = ReminderQueue(st.session_state.user_reminders)
+    return queue
+
+def add_reminder_to_session(reminder_text, reminder_type="Quiz", subject_id=None):
+    """Adds a spaced-repetition reminder for a subject, unless one of that type is already scheduled."""
+    queue = get_reminder_queue()
+    scheduled = next((r for r in queue.for_subject(subject_id) if r["type"] == reminder_type), None) if subject_id else None
+    if scheduled is not None:
+        st.toast(f"Already on your list: {scheduled['text']} ({format_due(scheduled['due_at'], time.time())}) 🔔")
+        return
+    reminder_data = new_reminder(reminder_text, reminder_type, subject_id, time.time(), REMINDER_DAY_SECONDS)
     st.session_state.user_reminders.append(reminder_data)
+    queue.schedule(reminder_data)
+    sync_learner_state()
     st.toast(f"Reminder added: {reminder_text}! 🔔")
-    st.rerun() # Rerun to display new reminder
+
+def review_subject_reminders(subject_id, correct):
+    """Reschedules a subject's reminders from a quiz answer (SM-2).
+
+    Due reminders count the answer as their review; a wrong answer also sends a reminder that was
+    already spaced out back to the start.
+    """
+    now = time.time()
+    queue = get_reminder_queue()
+    reviewed = False
+    for reminder in queue.for_subject(subject_id):
+        if reminder["due_at"] <= now or (not correct and reminder.get("repetitions", 0) > 0):
+            review(reminder, QUIZ_CORRECT_QUALITY if correct else QUIZ_WRONG_QUALITY, now, REMINDER_DAY_SECONDS)
+            queue.schedule(reminder)
+            reviewed = True
+    if reviewed:
+        sync_learner_state()
+
+def finish_revision(reminder):
+    """Marks a due revision as done, which schedules the next one (button callback)."""
+    review(reminder, REVISION_DONE_QUALITY, time.time(), REMINDER_DAY_SECONDS)
+    get_reminder_queue().schedule(reminder)
+    sync_learner_state()
+    st.session_state.reminder_toast = f"Great job! Next time: {format_due(reminder['due_at'], time.time())} 🌟" # Shown by the fragment
+
+def open_reminder(reminder):
+    """Opens the quiz or study session a due reminder is about (button callback)."""
+    if reminder["type"] == "Quiz":
+        st.session_state["app_mode"] = "Quiz Time"
+        st.session_state["quiz_subject_id"] = reminder["subject_id"]
+    else:
+        st.session_state["app_mode"] = st.session_state["app_mode_radio"] = "Study Time"
+        st.session_state.selected_subject_id = reminder["subject_id"]
+        st.session_state.pop("subject_chat_selector", None) # Recreated with the reminder's subject selected
+    request_page_rerun()
 
 
 # --- Layout Structure ---
 # Create 3 columns for main content layout: sidebar content (hidden by default, handled by Streamlit), main chat, and right panel
 main_col, right_panel_col = st.columns([0.7, 0.3]) # Adjust ratios as needed
 
+# Interactions that only affect one part of the page (picking an emoji, typing a subject name, sending a
+# message, paging the transcript, answering a quiz) rerun just that part's fragment. Only changes that
+# affect several parts (switching section or subject, adding a subject or reminder) rerun the whole page.
+GAME_UNLOCK_THRESHOLD = 3 # Example: unlock after 3 lessons/chats
+
+def show_sidebar_avatar():
+    """Draws the learner's avatar in its sidebar slot (also from the avatar picker fragment)."""
+    sidebar_avatar_slot.markdown(f'<div style="font-size: 50px; text-align: center;">{st.session_state["user_avatar"]}</div>', unsafe_allow_html=True)
+
+@st.fragment(run_every=10)
+def render_debug_stats():
+    """Operator stats, refreshed every few seconds without rerunning the page."""
+    st.caption(format_pool_stats(shared_llm_client.pool_stats()))
+    st.caption(format_cache_stats(response_cache.stats()))
+    st.caption(format_gateway_stats(llm_gateway.stats()))
+    st.caption(format_resilience_stats(resilient_caller.stats()))
+    st.caption(format_router_stats(intent_router.stats()))
+    st.caption(format_learner_state_stats(learner_state_store.stats()))
+    if compactor is not None:
+        st.caption(format_compaction_stats(compactor.stats()))
+    if "game" in st.session_state: # Engines are only built once someone plays
+        st.caption(format_game_stats(get_game_engines()[1].stats()))
+    st.caption(format_session_memory_stats(session_governor.stats()))
+    with st.expander("Performance"):
+        st.markdown("**Run phases**\n" + (format_metrics_summary(metrics.summary("phase_seconds"), ("mode", "phase")) or "No data yet"))
+        st.markdown("**Time to first token**\n" + (format_metrics_summary(metrics.summary("llm_ttft_seconds"), ("mode", "source")) or "No data yet"))
+        st.markdown("**Full answer**\n" + (format_metrics_summary(metrics.summary("llm_duration_seconds"), ("mode", "source")) or "No data yet"))
+        st.markdown("**Answer by routing tier**\n" + (format_metrics_summary(metrics.summary("routed_answer_seconds"), ("mode", "tier")) or "No data yet"))
+        st.markdown("**Search**\n" + (format_metrics_summary(metrics.summary("search_seconds"), ("backend",)) or "No data yet"))
+        st.markdown("**Game bot moves**\n" + (format_metrics_summary(metrics.summary("game_move_seconds"), ("game", "difficulty")) or "No data yet"))
+        st.markdown("**Answer tokens**\n" + (format_metrics_summary(metrics.summary("llm_completion_tokens"), ("mode",), unit="tokens") or "No data yet"))
+
+@st.fragment
+def render_search():
+    """Search box over all of the learner's chats and study sessions; typing only reruns this fragment."""
+    rerun_page_if_requested() # A hit was opened
+    query = st.text_input("🔎 Search your chats", key="search_query", placeholder="e.g. volcanoes")
+    if not query.strip():
+        return
+    with metrics.timer("search_seconds", backend=storage_backend):
+        hits = conversation_store.search_messages(st.session_state.user_id, query, SEARCH_RESULTS)
+    subjects = {s["id"]: s for s in st.session_state.user_subjects}
+    hits = [hit for hit in hits if hit["subject_id"] in subjects]
+    if not hits:
+        st.caption("Nothing found. Try another word!")
+        return
+    for i, hit in enumerate(hits):
+        subject = subjects[hit["subject_id"]]
+        section = "Study Time" if hit["kind"] == "study" else "Chat"
+        st.button(f"{subject['emoji']} {subject['name']} · {section}", key=f"search_hit_{i}", use_container_width=True,
+                  on_click=open_search_hit, args=(hit,))
+        st.caption(prepare_markdown(hit["snippet"]))
+
+def reset_learner_session():
+    """Drops this session's copies of the learner's conversations, progress and reminders (after they changed in storage)."""
+    st.session_state["chat_histories_in_session"] = {}
+    st.session_state["study_messages"] = {}
+    st.session_state["conversation_memories"] = {}
+    st.session_state["learning_progress"] = {"lessons_completed": 0}
+    st.session_state["user_reminders"] = []
+    st.session_state.pop("reminder_queue", None)
+    st.session_state["context_windows"] = {}
+    st.session_state["stream_stats"] = {}
+    st.session_state.pop("search_jump", None)
+    forget_rendered_messages()
+
+# --- Save and Load (Learner Archives) ---
+def export_learner_data(user_id):
+    """Writes the learner's archive to a temporary file; runs only when the download button is clicked.
+
+    The archive is built in constant memory, but download_button reads the file into Streamlit's in-memory media
+    storage, so the compressed archive is held in memory while it is downloaded. Whole classes and very long
+    histories are exported with the command line instead (python learner_archive.py export).
+    """
+    archive = tempfile.TemporaryFile()
+    with metrics.timer("archive_seconds", operation="export", backend=storage_backend):
+        write_archive(archive, [user_id], conversation_store, learner_state_store)
+    archive.seek(0)
+    return archive
+
+def load_learner_data():
+    """Replaces the learner's data with the uploaded archive (button callback)."""
+    upload = st.session_state.get("archive_upload")
+    if upload is None:
+        return
+    try:
+        with metrics.timer("archive_seconds", operation="import", backend=storage_backend):
+            report = import_archive(upload, conversation_store, learner_state_store, replace=True, user_id=st.session_state.user_id)
+    except ArchiveError as error:
+        st.session_state.archive_notice = f"Couldn't load that file: {error}"
+        return
+    reset_learner_session()
+    st.session_state.pop("learner_state_version", None) # Reloaded from the imported learner state on this run
+    st.session_state.pop("subject_chat_selector", None)
+    st.session_state.archive_notice = f"Loaded your subjects, reminders and {report['messages']} messages!"
+
 # --- Sidebar for Navigation (Chat History and Mode Selection) ---
-with st.sidebar:
+with st.sidebar, metrics.timer("phase_seconds", phase="sidebar", mode=run_mode):
     st.title("🫒live Bot")
     st.markdown("---") # Separator
 
     st.subheader("Your Avatar")
-    st.markdown(f'<div style="font-size: 50px; text-align: center;">{st.session_state["user_avatar"]}</div>', unsafe_allow_html=True)
+    sidebar_avatar_slot = st.empty()
+    show_sidebar_avatar()
     if st.button("Change Friend", key="change_avatar_sidebar"):
         st.session_state["app_mode"] = "Home"
-        # Reset current chat messages and history cache when changing avatar
-        st.session_state["chat_histories_in_session"] = {subj["id"]: [] for subj in st.session_state.user_subjects}
-        st.session_state["learning_progress"] = {"lessons_completed": 0}
-        st.session_state["user_reminders"] = []
+        # Reset chat and study messages, progress and reminders (in storage too) when changing avatar
+        conversation_store.clear_learning_data(st.session_state.user_id)
+        reset_learner_session()
         st.rerun()
+    with st.expander("💾 Save or move my data"):
+        # Built only on click, so ordinary reruns never read the learner's whole history
+        st.download_button("Download my data", data=functools.partial(export_learner_data, st.session_state.user_id),
+                           file_name="olive-learner.jsonl.gz", mime="application/gzip", key="archive_download",
+                           on_click="ignore", use_container_width=True)
+        st.caption("Download before you Change Friend to keep your chats, subjects and reminders.")
+        st.file_uploader("Load saved data", type=["gz", "zst"], key="archive_upload")
+        st.button("Load", key="archive_load", on_click=load_learner_data, use_container_width=True,
+                  disabled=st.session_state.get("archive_upload") is None)
+        if "archive_notice" in st.session_state:
+            st.caption(st.session_state.pop("archive_notice"))
     st.markdown("---")
 
+    # Navigation stays outside fragments: switching section or subject changes the main view
     st.subheader("What do you want to do?")
-    selected_mode = st.radio(
+    def on_app_mode_change():
+        """Switches section only when the learner picks one, so Home and Quiz Time aren't overridden on every run."""
+        st.session_state["app_mode"] = st.session_state["app_mode_radio"]
+
+    st.radio(
         "Choose a section:",
         ("Chat with Bot", "Study Time", "Game Corner"),
-        key="app_mode_radio"
+        key="app_mode_radio",
+        on_change=on_app_mode_change,
     )
-    st.session_state["app_mode"] = selected_mode # Update app_mode in session state
 
     st.markdown("---")
     st.subheader("Chat History")
     # Display subject-based chat history for easy switching
     subject_names = {subj["id"]: subj["name"] for subj in st.session_state.user_subjects}
-    subject_emojis = {subj["id"]: subj["emoji"] for subj in st.session_state.user_subjects}
+    subject_emojis_by_name = {subj["name"]: subj["emoji"] for subj in st.session_state.user_subjects}
 
     selected_subject_name = st.radio(
         "Select Subject Chat:",
         options=[s["name"] for s in st.session_state.user_subjects],
         index=[s["name"] for s in st.session_state.user_subjects].index(subject_names.get(st.session_state.selected_subject_id, "General Chat")),
-        format_func=lambda name: f"{subject_emojis[[s['name'] for s in st.session_state.user_subjects].index(name)]} {name}",
+        format_func=lambda name: f"{subject_emojis_by_name.get(name, '')} {name}",
         key="subject_chat_selector"
     )
     st.session_state.selected_subject_id = next(s["id"] for s in st.session_state.user_subjects if s["name"] == selected_subject_name)
 
+    render_search()
+
+    # Connection pool stats for operators (enable with show_debug_stats = true in secrets.toml)
+    if st.secrets.get("show_debug_stats", False):
+        st.markdown("---")
+        render_debug_stats()
+
 
 # --- Right Panel for Subjects, Games Icon, Reminders ---
-with right_panel_col:
+@st.fragment
+def render_right_panel():
+    """Games icon and subjects."""
     # Games Icon (Top Right) - Conditional Access
     learning_progress_val = st.session_state.learning_progress.get("lessons_completed", 0)
-    GAME_UNLOCK_THRESHOLD = 3 # Example: unlock after 3 lessons/chats
 
     if learning_progress_val >= GAME_UNLOCK_THRESHOLD:
         st.markdown(f'<div style="text-align: right; font-size: 40px; cursor: pointer;" title="Games unlocked!"><a href="#" onclick="window.parent.document.querySelector(\'[data-testid=\"stSidebarUserContent\"]\').scrollTop = 0; window.parent.document.querySelector(\'input[type=\"radio\"][value=\"Game Corner\"]\').click(); return false;">🎮</a></div>', unsafe_allow_html=True)
@@ -307,230 +743,507 @@ with right_panel_col:
         st.markdown(f'{subject["emoji"]} {subject["name"]}')
 
     with st.expander("Add New Subject"):
-        new_subject_name = st.text_input("Subject Name (e.g., Chess)")
-        new_subject_emoji = st.text_input("Emoji (e.g., ♟️)", max_chars=2)
-        if st.button("Add Subject") and new_subject_name:
-            add_subject_to_session(new_subject_name, new_subject_emoji)
-
-    st.markdown("---")
+        # A form, so typing the name and emoji doesn't rerun anything until the subject is added
+        with st.form("add_subject_form", clear_on_submit=True, border=False):
+            new_subject_name = st.text_input("Subject Name (e.g., Chess)")
+            new_subject_emoji = st.text_input("Emoji (e.g., ♟️)", max_chars=2)
+            if st.form_submit_button("Add Subject") and new_subject_name:
+                add_subject_to_session(new_subject_name, new_subject_emoji)
+                st.rerun() # Rerun the whole page to update the sidebar subject list
+
+@st.fragment(run_every=REMINDER_TICK_SECONDS)
+def render_reminders():
+    """Due and upcoming reminders; checks the due queue every few seconds without rerunning the page."""
+    rerun_page_if_requested() # A reminder was opened
     st.subheader("Reminders")
-    if st.session_state.user_reminders:
-        for reminder in st.session_state.user_reminders:
-            status = "✅" if reminder.get("completed", False) else "⏰"
-            st.info(f"{status} {reminder['text']} ({reminder.get('type', '')})")
-    else:
+    now = time.time()
+    queue = get_reminder_queue()
+    if "reminder_toast" in st.session_state:
+        st.toast(st.session_state.pop("reminder_toast"))
+    announce = queue.ticked # Not for reminders that were already due when the page loaded
+    for reminder in queue.tick(now):
+        if announce:
+            st.toast(f"⏰ {reminder['text']}")
+    due = queue.due()
+    subject_ids = {s["id"] for s in st.session_state.user_subjects}
+    for reminder in due:
+        st.warning(f"⏰ {reminder['text']} ({reminder.get('type', '')})")
+        if reminder.get("subject_id") not in subject_ids:
+            continue # Reminders from before scheduling (or of a removed subject) have nothing to open
+        open_col, done_col = st.columns(2)
+        open_col.button("📝 Quiz me" if reminder["type"] == "Quiz" else "📖 Revise", key=f"open_reminder_{reminder['id']}",
+                        on_click=open_reminder, args=(reminder,))
+        if reminder["type"] == "Revision":
+            done_col.button("✅ Done", key=f"finish_reminder_{reminder['id']}", on_click=finish_revision, args=(reminder,))
+    for reminder in queue.upcoming(UPCOMING_REMINDERS):
+        st.info(f"🔔 {reminder['text']} ({reminder.get('type', '')}) · {format_due(reminder['due_at'], now)}")
+    if not len(queue):
         st.info("No reminders set yet for this session.")
+    elif len(queue) > len(due) + UPCOMING_REMINDERS:
+        st.caption(f"+ {len(queue) - len(due) - UPCOMING_REMINDERS} more scheduled")
 
+with right_panel_col, metrics.timer("phase_seconds", phase="right_panel", mode=run_mode):
+    render_right_panel()
+    st.markdown("---")
+    render_reminders()
+
+
+# --- Main Content Sections ---
+def pick_avatar(emoji):
+    """Sets the learner's avatar (button callback, so the picker shows it in the same rerun)."""
+    st.session_state["user_avatar"] = emoji
+    st.session_state["custom_emoji_input"] = emoji
+    sync_learner_state()
+
+def on_custom_emoji_change():
+    """Uses a typed emoji as the avatar."""
+    if st.session_state["custom_emoji_input"]:
+        st.session_state["user_avatar"] = st.session_state["custom_emoji_input"]
+        sync_learner_state()
+
+@st.fragment
+def render_avatar_picker():
+    """Home screen: picking an emoji only reruns the picker and redraws the sidebar avatar in place."""
+    st.markdown('<div class="centered-container">', unsafe_allow_html=True)
+    st.title("Hey, I'm 🫒live! Choose Your Chat Friend!") # Updated greeting
+
+    # Display current selected emoji (large)
+    st.markdown(f'<div class="avatar-display">{st.session_state["user_avatar"]}</div>', unsafe_allow_html=True)
+    show_sidebar_avatar()
+
+    # Text input for custom emoji (optional)
+    if "custom_emoji_input" not in st.session_state:
+        st.session_state["custom_emoji_input"] = st.session_state["user_avatar"]
+    st.text_input(
+        "Or type your own emoji below:",
+        key="custom_emoji_input",
+        on_change=on_custom_emoji_change,
+        max_chars=2, # Restrict to typically 1-2 characters for an emoji
+        help="Paste any emoji here!"
+    )
 
-# --- Main Content Display ---
-with main_col:
-    # Display Home Screen (Avatar Selection)
-    if st.session_state["app_mode"] == "Home":
-        st.markdown('<div class="centered-container">', unsafe_allow_html=True)
-        st.title("Hey, I'm 🫒live! Choose Your Chat Friend!") # Updated greeting
-
-        # Display current selected emoji (large)
-        st.markdown(f'<div class="avatar-display">{st.session_state["user_avatar"]}</div>', unsafe_allow_html=True)
-
-        # Text input for custom emoji (optional)
-        custom_emoji = st.text_input(
-            "Or type your own emoji below:",
-            value=st.session_state["user_avatar"],
-            max_chars=2, # Restrict to typically 1-2 characters for an emoji
-            help="Paste any emoji here!"
-        )
-        if custom_emoji and custom_emoji != st.session_state["user_avatar"]:
-            st.session_state["user_avatar"] = custom_emoji
-            st.rerun() # Rerun to update the displayed large emoji
+    st.markdown("### Or pick from these:")
 
-        st.markdown("### Or pick from these:")
+    # Grid of common emojis as buttons
+    common_emojis = ["😀", "😊", "🥳", "😎", "👾", "🤖", "🚀", "😺", "🐶", "🦉", "🦁", "🦄", "🌈", "☀️", "🌟", "💡", "🍔", "🍕", "🎈", "📚", "🧪", "📐", "🗺️", "🗣️"]
 
-        # Grid of common emojis as buttons
-        common_emojis = ["😀", "😊", "🥳", "😎", "👾", "🤖", "🚀", "😺", "🐶", "🦉", "🦁", "🦄", "🌈", "☀️", "🌟", "💡", "🍔", "🍕", "🎈", "📚", "🧪", "📐", "🗺️", "🗣️"]
+    cols = st.columns(6) # Adjust number of columns as needed
+    for i, emoji in enumerate(common_emojis):
+        with cols[i % 6]:
+            st.button(emoji, key=f"emoji_btn_{emoji}", use_container_width=True, on_click=pick_avatar, args=(emoji,))
 
-        cols = st.columns(6) # Adjust number of columns as needed
-        for i, emoji in enumerate(common_emojis):
-            with cols[i % 6]:
-                if st.button(emoji, key=f"emoji_btn_{emoji}", use_container_width=True):
-                    st.session_state["user_avatar"] = emoji
-                    st.rerun() # Rerun to update the displayed large emoji
+    st.markdown("</div>", unsafe_allow_html=True) # Close centered-container
 
-        st.markdown("</div>", unsafe_allow_html=True) # Close centered-container
+    st.markdown("---") # Separator before the button
+    if st.button("Start Chat!", type="primary", use_container_width=True, key="start_chat_btn"):
+        st.session_state["app_mode"] = "Chat with Bot" # Automatically switch to Chat mode after choosing avatar
+        st.session_state["selected_subject_id"] = "general" # Ensure 'General Chat' is selected
+        st.rerun() # Rerun to switch to chat mode
 
-        st.markdown("---") # Separator before the button
-        if st.button("Start Chat!", type="primary", use_container_width=True, key="start_chat_btn"):
-            st.session_state["app_mode"] = "Chat with Bot" # Automatically switch to Chat mode after choosing avatar
-            st.session_state["selected_subject_id"] = "general" # Ensure 'General Chat' is selected
-            st.rerun() # Rerun to switch to chat mode
+@st.fragment
+def render_chat():
+    """Chat with Bot: the transcript and input of the selected subject."""
+    st.title(f"Let's Chat about {next((s['name'] for s in st.session_state.user_subjects if s['id'] == st.session_state.selected_subject_id), 'General Chat')}!")
 
-    # --- Chat with Bot Section ---
-    elif st.session_state["app_mode"] == "Chat with Bot":
-        st.title(f"Let's Chat about {next((s['name'] for s in st.session_state.user_subjects if s['id'] == st.session_state.selected_subject_id), 'General Chat')}!")
-
-        chat_history = load_chat_history_from_session(st.session_state.selected_subject_id)
-
-        # Display chat messages for this mode
-        for message in chat_history:
-            avatar = "🫒" if message["role"] == "assistant" else st.session_state["user_avatar"]
-            with st.chat_message(message["role"], avatar=avatar):
-                st.markdown(message["content"])
-
-        # Chat Input and Logic
-        if prompt := st.chat_input("What do you want to talk about?"):
-            add_message_to_session_history(st.session_state.selected_subject_id, "user", prompt)
-
-            with st.chat_message("user", avatar=st.session_state["user_avatar"]):
-                st.markdown(prompt)
-
-            messages_for_api = [
-                {"role": m["role"], "content": m["content"]}
-                for m in load_chat_history_from_session(st.session_state.selected_subject_id) # Use the loaded history for API context
-            ]
-
-            with st.chat_message("assistant", avatar="🫒"):
-                placeholder = st.empty()
-                full_response_content = ""
-                stream = client.chat.completions.create(
-                    model="llama3-70b-8192",
-                    messages=messages_for_api,
-                    stream=True,
-                )
-                for chunk in stream:
-                    if chunk.choices[0].delta.content is not None:
-                        full_response_content += chunk.choices[0].delta.content
-                        placeholder.markdown(full_response_content + "▌") # Add blinking cursor for effect
-
-                placeholder.markdown(full_response_content) # Display final content without cursor
+    conversation_key = f"chat:{st.session_state.selected_subject_id}"
+    if show_search_hit(conversation_key, st.session_state.selected_subject_id):
+        return
+    chat_history = load_chat_history_from_session(st.session_state.selected_subject_id)
+
+    # Display the most recent chat messages for this mode (older ones are paged in on demand)
+    with metrics.timer("phase_seconds", phase="transcript", mode=run_mode):
+        render_transcript(
+            chat_history, conversation_key, st.session_state["user_avatar"],
+            total_messages=count_conversation_messages(st.session_state.selected_subject_id),
+            load_older=lambda count: load_older_messages(st.session_state.selected_subject_id, count),
+        )
+
+    # Token usage and speed of the last request for this subject
+    stats_placeholder = st.empty()
+    show_request_stats(conversation_key, stats_placeholder)
+
+    # Chat Input and Logic
+    if prompt := st.chat_input("What do you want to talk about?"):
+        user_message = add_message_to_session_history(st.session_state.selected_subject_id, "user", prompt)
+
+        with st.chat_message("user", avatar=st.session_state["user_avatar"]):
+            st.markdown(cached_markdown(user_message))
 
+        # Only the most recent turns that fit the token budget are sent; older ones are summarized
+        context_window = get_context_window(conversation_key)
+        messages_for_api = context_window.build(load_chat_history_from_session(st.session_state.selected_subject_id),
+                                                memory=load_conversation_memory(st.session_state.selected_subject_id))
+
+        with st.chat_message("assistant", avatar="🫒"):
+            renderer = StreamRenderer(st.empty()) # Redraws in batches, with a cursor while streaming
+            # Greetings and sums are answered locally, short questions by the small model
+            route, full_response_content = answer_prompt(renderer, prompt, messages_for_api)
+        session_value("stream_stats", dict)[conversation_key] = renderer.stats
+        show_request_stats(conversation_key, stats_placeholder)
+
+        # The new turn is already on screen, so no rerun is needed; the next run renders it from history
+        if full_response_content: # Nothing to keep if the request failed before any text arrived
             add_message_to_session_history(st.session_state.selected_subject_id, "assistant", full_response_content)
-            update_learning_progress_session(lessons_to_add=1) # Increment learning progress
-            st.rerun() # Rerun to refresh the chat history display
+            if route.intent != "small_talk": # Saying hi isn't a lesson
+                update_learning_progress_session(lessons_to_add=1) # Increment learning progress
+        track_session_memory() # The conversation grew without a full-page run
+
+@st.fragment
+def render_study():
+    """Study Time: a tutor conversation about the selected subject, and what to do next."""
+    st.title("📚 Study Time!")
+    st.markdown("---")
+    st.subheader(f"Learning in: {next((s['name'] for s in st.session_state.user_subjects if s['id'] == st.session_state.selected_subject_id), 'General Chat')}")
 
-    # --- Study Time Section ---
-    elif st.session_state["app_mode"] == "Study Time":
-        st.title("📚 Study Time!")
-        st.markdown("---")
-        st.subheader(f"Learning in: {next((s['name'] for s in st.session_state.user_subjects if s['id'] == st.session_state.selected_subject_id), 'General Chat')}")
+    if st.session_state.selected_subject_id == "general":
+        st.warning("Please select a specific subject from the sidebar to begin Study Time!")
+        return
 
-        if st.session_state.selected_subject_id == "general":
-            st.warning("Please select a specific subject from the sidebar to begin Study Time!")
-        else:
-            current_study_subject = next(s for s in st.session_state.user_subjects if s["id"] == st.session_state.selected_subject_id)
-            
-            # Use specific session state for study messages to keep them separate from general chat
-            if current_study_subject["id"] not in st.session_state["study_messages"]:
-                st.session_state["study_messages"][current_study_subject["id"]] = []
-                initial_greeting = f"Hello! I'm your friendly {current_study_subject['name']} tutor. What would you like to learn about today?"
-                st.session_state["study_messages"][current_study_subject["id"]].append({"role": "assistant", "content": initial_greeting})
-
-            for message in st.session_state["study_messages"][current_study_subject["id"]]:
-                avatar = "🫒" if message["role"] == "assistant" else st.session_state["user_avatar"]
-                with st.chat_message(message["role"], avatar=avatar):
-                    st.markdown(message["content"])
-
-            if prompt := st.chat_input(f"Ask me about {current_study_subject['name']}..."):
-                st.session_state["study_messages"][current_study_subject["id"]].append({"role": "user", "content": prompt})
-                with st.chat_message("user", avatar=st.session_state["user_avatar"]):
-                    st.markdown(prompt)
-
-                system_prompt = f"You are a kind, patient, and knowledgeable tutor for kids learning about {current_study_subject['name']}. Explain concepts clearly, use simple language, and provide examples. Keep responses concise and engaging for a young audience. If the question is not about {current_study_subject['name']}, gently guide them back."
-
-                messages_for_api = [{"role": "system", "content": system_prompt}] + \
-                                   [{"role": m["role"], "content": m["content"]} for m in st.session_state["study_messages"][current_study_subject["id"]]]
-
-                with st.chat_message("assistant", avatar="🫒"):
-                    placeholder = st.empty()
-                    full_response_content = ""
-                    stream = client.chat.completions.create(
-                        model="llama3-70b-8192",
-                        messages=messages_for_api,
-                        stream=True,
-                    )
-                    for chunk in stream:
-                        if chunk.choices[0].delta.content is not None:
-                            full_response_content += chunk.choices[0].delta.content
-                            placeholder.markdown(full_response_content + "▌")
-                    placeholder.markdown(full_response_content)
-                st.session_state["study_messages"][current_study_subject["id"]].append({"role": "assistant", "content": full_response_content})
-                update_learning_progress_session(lessons_to_add=1) # Increment for study lessons
-                
-                # Post-learning actions (reminders will not persist across sessions)
-                st.markdown("---")
-                st.subheader("What's next?")
-                col_post_learn_1, col_post_learn_2 = st.columns(2)
-                with col_post_learn_1:
-                    if st.button(f"Give me a Quiz on {current_study_subject['name']}!"):
-                        st.session_state["app_mode"] = "Quiz Time"
-                        st.session_state["quiz_subject_id"] = current_study_subject["id"]
-                        add_reminder_to_session(f"Quiz time for {current_study_subject['name']}!", "Quiz")
-                        st.rerun()
-                with col_post_learn_2:
-                    if st.button(f"Remind me to revise {current_study_subject['name']} later"):
-                        add_reminder_to_session(f"Revise {current_study_subject['name']}", "Revision")
-                        st.rerun()
+    current_study_subject = next(s for s in st.session_state.user_subjects if s["id"] == st.session_state.selected_subject_id)
 
+    conversation_key = f"study:{current_study_subject['id']}"
+    if show_search_hit(conversation_key, current_study_subject["id"], kind="study"):
+        return
 
-    # --- Quiz Time Section ---
-    elif st.session_state["app_mode"] == "Quiz Time":
-        st.title("📝 Quiz Time!")
+    # Use specific session state for study messages to keep them separate from general chat
+    study_history = load_chat_history_from_session(current_study_subject["id"], kind="study")
+    if not study_history:
+        initial_greeting = f"Hello! I'm your friendly {current_study_subject['name']} tutor. What would you like to learn about today?"
+        add_message_to_session_history(current_study_subject["id"], "assistant", initial_greeting, kind="study")
+
+    with metrics.timer("phase_seconds", phase="transcript", mode=run_mode):
+        render_transcript(
+            study_history, conversation_key, st.session_state["user_avatar"],
+            total_messages=count_conversation_messages(current_study_subject["id"], kind="study"),
+            load_older=lambda count: load_older_messages(current_study_subject["id"], count, kind="study"),
+        )
+
+    stats_placeholder = st.empty()
+    show_request_stats(conversation_key, stats_placeholder)
+
+    if prompt := st.chat_input(f"Ask me about {current_study_subject['name']}..."):
+        user_message = add_message_to_session_history(current_study_subject["id"], "user", prompt, kind="study")
+        with st.chat_message("user", avatar=st.session_state["user_avatar"]):
+            st.markdown(cached_markdown(user_message))
+
+        system_prompt = f"You are a kind, patient, and knowledgeable tutor for kids learning about {current_study_subject['name']}. Explain concepts clearly, use simple language, and provide examples. Keep responses concise and engaging for a young audience. If the question is not about {current_study_subject['name']}, gently guide them back."
+
+        context_window = get_context_window(conversation_key)
+        messages_for_api = context_window.build(study_history, system_prompt=system_prompt,
+                                                memory=load_conversation_memory(current_study_subject["id"], kind="study"))
+
+        with st.chat_message("assistant", avatar="🫒"):
+            renderer = StreamRenderer(st.empty())
+            route, full_response_content = answer_prompt(renderer, prompt, messages_for_api)
+        session_value("stream_stats", dict)[conversation_key] = renderer.stats
+        show_request_stats(conversation_key, stats_placeholder)
+        if full_response_content:
+            add_message_to_session_history(current_study_subject["id"], "assistant", full_response_content, kind="study")
+            if route.intent != "small_talk":
+                update_learning_progress_session(lessons_to_add=1) # Increment for study lessons
+        track_session_memory()
+
+    # Post-learning actions, shown once the learner has asked something (outside the prompt
+    # block so the buttons still exist on the rerun their click triggers)
+    if len(study_history) > 1:
         st.markdown("---")
-        quiz_subject_name = next((s['name'] for s in st.session_state.user_subjects if s['id'] == st.session_state.get('quiz_subject_id', 'general')), 'General Knowledge')
-        st.subheader(f"Quiz on: {quiz_subject_name}")
-
-        # Simplified Quiz Logic: Ask a random question based on chat history or subject
-        if "quiz_question" not in st.session_state or st.button("New Quiz Question"):
-            st.session_state.quiz_question = None
-            st.session_state.quiz_answer = None
-
-            messages_for_quiz_prompt = [
-                {"role": "system", "content": f"You are a quiz master for kids. Generate a single, simple quiz question about '{quiz_subject_name}' with 3 multiple-choice options (A, B, C) and indicate the correct answer. Format: 'Question: ... A) ... B) ... C) ... Correct: [A/B/C]'"},
-                {"role": "user", "content": f"Generate a quiz question about {quiz_subject_name}."}
-            ]
-            try:
-                quiz_response = client.chat.completions.create(
-                    model="llama3-8b-8192", # Use a lighter model for quizzes if preferred
-                    messages=messages_for_quiz_prompt,
-                    max_tokens=150
-                )
-                raw_quiz_content = quiz_response.choices[0].message.content
-                st.session_state.quiz_question = raw_quiz_content
-                st.session_state.quiz_answer = None # Reset answer
-            except Exception as e:
-                st.error(f"Error generating quiz question: {e}")
-                st.session_state.quiz_question = "Could not generate a quiz question at this time. Please try again."
-
-        if st.session_state.quiz_question:
-            st.markdown(st.session_state.quiz_question)
-            user_quiz_answer = st.text_input("Your Answer (e.g., A, B, or C)")
-            if st.button("Submit Answer"):
-                # Simple check for demo. In a real app, you'd parse Groq's output to verify.
-                # This basic check assumes the model will output "Correct: [A/B/C]" somewhere in the response.
-                if st.session_state.quiz_question and user_quiz_answer:
-                    if f"Correct: {user_quiz_answer.upper()}" in st.session_state.quiz_question.replace(" ", ""): # Remove spaces for robust check
-                        st.success("Correct! 🎉")
-                    else:
-                        st.error("Not quite! Keep trying or ask for a new question.")
+        st.subheader("What's next?")
+        col_post_learn_1, col_post_learn_2 = st.columns(2)
+        with col_post_learn_1:
+            if st.button(f"Give me a Quiz on {current_study_subject['name']}!"):
+                st.session_state["app_mode"] = "Quiz Time"
+                st.session_state["quiz_subject_id"] = current_study_subject["id"]
+                add_reminder_to_session(f"Quiz time for {current_study_subject['name']}!", "Quiz", current_study_subject["id"])
+                st.rerun() # Rerun the whole page to switch section and show the reminder
+        with col_post_learn_2:
+            if st.button(f"Remind me to revise {current_study_subject['name']} later"):
+                add_reminder_to_session(f"Revise {current_study_subject['name']}", "Revision", current_study_subject["id"])
+                st.rerun() # Rerun the whole page to show the reminder in the right panel
+
+@st.fragment
+def render_quiz():
+    """Quiz Time: one question from the subject's pool at a time."""
+    st.title("📝 Quiz Time!")
+    st.markdown("---")
+    quiz_subject_name = next((s['name'] for s in st.session_state.user_subjects if s['id'] == st.session_state.get('quiz_subject_id', 'general')), 'General Knowledge')
+    st.subheader(f"Quiz on: {quiz_subject_name}")
+    restore_session_state() # The current question, if this session was evicted
+
+    # Questions come from a pre-generated pool per subject, so getting a new one doesn't wait for the model
+    if "quiz_question" not in st.session_state or st.session_state.get("quiz_question_subject") != quiz_subject_name or st.button("New Quiz Question"):
+        with metrics.timer("phase_seconds", phase="quiz_question", mode=run_mode):
+            st.session_state.quiz_question = quiz_pool.pop(quiz_subject_name)
+            if st.session_state.quiz_question is None:
+                with st.spinner("The quiz master is writing new questions..."):
+                    st.session_state.quiz_question = quiz_pool.pop(quiz_subject_name, timeout=QUIZ_WAIT_TIMEOUT)
+        st.session_state.quiz_question_subject = quiz_subject_name
+        st.session_state.quiz_answer = None # Reset answer
+
+    if st.session_state.quiz_question:
+        st.markdown(format_quiz_question(st.session_state.quiz_question))
+        user_quiz_answer = st.text_input("Your Answer (e.g., A, B, or C)")
+        if st.button("Submit Answer"):
+            if user_quiz_answer and normalize_answer(user_quiz_answer):
+                correct = is_correct_answer(st.session_state.quiz_question, user_quiz_answer)
+                review_subject_reminders(st.session_state.get("quiz_subject_id", "general"), correct)
+                if correct:
+                    st.success("Correct! 🎉")
                 else:
-                    st.warning("Please provide an answer.")
+                    st.error("Not quite! Keep trying or ask for a new question.")
+            else:
+                st.warning("Please answer with A, B, or C.")
+    else:
+        quiz_error = quiz_pool.last_error(quiz_subject_name)
+        st.error(f"Error generating quiz question: {quiz_error}" if quiz_error else "Could not generate a quiz question at this time. Please try again.")
+
+    if st.button("Back to Study Time"):
+        st.session_state["app_mode"] = "Study Time"
+        st.rerun()
+    track_fragment_run()
+
+
+# --- Game Corner ---
+GAMES = ("Tic-Tac-Toe", "Connect Four", "Guess the Number", "Rock-Paper-Scissors")
+GAME_MODES = ("1 Player vs Bot", "2 Players")
+GAME_MOVE_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.1) # Seconds; bot moves take a few ms
+TTT_MARKS = {"X": "❌", "O": "⭕"}
+C4_STONES = ("⚪", "🔴", "🟡")
+
+@st.cache_resource
+def get_game_engines():
+    """Solves Tic-Tac-Toe and builds the Connect Four opening book once per process; all sessions share them."""
+    engines = TicTacToeEngine(), ConnectFourEngine()
+    metrics.add_collector("games", engines[1].stats)
+    return engines
+
+def current_game():
+    """Returns the game being played, restoring it first if the memory governor spilled this session."""
+    restore_session_state()
+    return st.session_state.get("game")
+
+def new_game(name=None, mode=None, difficulty=None):
+    """Starts a fresh game (also the "New game" button callback, which keeps the current settings)."""
+    previous = current_game() or {}
+    name, mode, difficulty = name or previous["name"], mode or previous["mode"], difficulty or previous["difficulty"]
+    game = {"name": name, "mode": mode, "difficulty": difficulty, "result": None}
+    if name == "Tic-Tac-Toe":
+        game.update(x=0, o=0, line=0)
+    elif name == "Connect Four":
+        game.update(position=0, mask=0, moves=0) # Bitboard: stones of the player to move, and all stones
+    elif name == "Guess the Number":
+        maximum = GUESS_RANGES[difficulty]
+        game.update(maximum=maximum, tries=guess_limit(maximum), guesses=[],
+                    secret=random.randint(1, maximum) if mode == GAME_MODES[0] else None) # Player 1 picks it otherwise
+    else:
+        game.update(history=[], score={"win": 0, "lose": 0, "draw": 0}, last=None, pending=None)
+    st.session_state.game = game
+    return game
+
+def game_players(game):
+    """Names of the first and second player."""
+    return ("You", "Olive 🫒") if game["mode"] == GAME_MODES[0] else ("Player 1", "Player 2")
+
+def turn_caption(player, mark):
+    """Whose move it is, e.g. "Your turn (❌)"."""
+    return f"Your turn ({mark})" if player == "You" else f"{player}'s turn ({mark})"
+
+def bot_move(game, choose):
+    """Runs a bot's move choice and records how long it took."""
+    started_at = time.perf_counter()
+    move = choose()
+    metrics.observe("game_move_seconds", time.perf_counter() - started_at, buckets=GAME_MOVE_BUCKETS,
+                    help_text="Time a Game Corner bot takes to pick a move", game=game["name"], difficulty=game["difficulty"])
+    return move
+
+def play_tic_tac_toe(cell):
+    """Marks a cell for the player to move, then lets the bot answer (button callback)."""
+    game = current_game()
+    if game["result"] or (game["x"] | game["o"]) >> cell & 1:
+        return
+    mark = "x" if bin(game["x"]).count("1") == bin(game["o"]).count("1") else "o"
+    game[mark] |= 1 << cell
+    game["result"], game["line"] = ttt_winner(game["x"], game["o"])
+    if game["result"] is None and game["mode"] == GAME_MODES[0]:
+        tic_tac_toe = get_game_engines()[0]
+        game["o"] |= 1 << bot_move(game, lambda: tic_tac_toe.best_move(game["o"], game["x"], game["difficulty"]))
+        game["result"], game["line"] = ttt_winner(game["x"], game["o"])
+
+def play_connect_four(column):
+    """Drops a stone for the player to move, then lets the bot answer (button callback)."""
+    game = current_game()
+    for turn in range(2 if game["mode"] == GAME_MODES[0] else 1):
+        if game["result"] or not c4_can_play(game["mask"], column):
+            return
+        game["position"], game["mask"] = c4_play(game["position"], game["mask"], column)
+        game["moves"] += 1
+        if c4_aligned(game["position"] ^ game["mask"]): # The stones of the player who just moved
+            game["result"] = "first" if game["moves"] % 2 else "second"
+        elif game["moves"] == C4_CELLS:
+            game["result"] = "draw"
+        elif turn == 0 and game["mode"] == GAME_MODES[0]:
+            connect_four = get_game_engines()[1]
+            column = bot_move(game, lambda: connect_four.best_move(game["position"], game["mask"], game["moves"], game["difficulty"]))
+
+def hide_secret_number():
+    """Stores Player 1's secret number (form callback)."""
+    game = current_game()
+    secret = st.session_state["guess_secret_input"].strip()
+    if secret.isdigit() and 1 <= int(secret) <= game["maximum"]:
+        game["secret"] = int(secret)
+    else:
+        st.session_state["game_warning"] = f"Pick a whole number from 1 to {game['maximum']}."
+
+def guess_number():
+    """Checks a guess against the secret number (form callback)."""
+    game = current_game()
+    guess = st.session_state["guess_input"]
+    if guess is None or game["result"]:
+        return
+    hint = guess_hint(game["secret"], int(guess))
+    game["guesses"].append((int(guess), hint))
+    if hint == "correct":
+        game["result"] = "won"
+    elif len(game["guesses"]) >= game["tries"]:
+        game["result"] = "lost"
+
+def play_rock_paper_scissors(move):
+    """Plays a hand; against the bot it answers at once, two players pick in turn (button callback)."""
+    game = current_game()
+    if game["mode"] == GAME_MODES[0]:
+        first, second = move, bot_move(game, lambda: rps_bot_move(game["history"], game["difficulty"]))
+        game["history"] = (game["history"] + [move])[-RPS_HISTORY:]
+    elif game["pending"] is None:
+        game["pending"] = move # Hidden until Player 2 has picked too
+        return
+    else:
+        first, second = game["pending"], move
+        game["pending"] = None
+    result = rps_result(first, second)
+    game["score"][result] += 1
+    game["last"] = (first, second, result)
+
+def render_tic_tac_toe(game):
+    first, second = game_players(game)
+    for row in range(3):
+        for col, cell in zip(st.columns(3), range(row * 3, row * 3 + 3)):
+            mark = "X" if game["x"] >> cell & 1 else "O" if game["o"] >> cell & 1 else None
+            col.button(TTT_MARKS.get(mark, "⬜"), key=f"ttt_{cell}", use_container_width=True,
+                       type="primary" if game["line"] >> cell & 1 else "secondary",
+                       disabled=mark is not None or game["result"] is not None, on_click=play_tic_tac_toe, args=(cell,))
+    if game["result"] == "draw":
+        st.info("It's a draw! 🤝")
+    elif game["result"]:
+        st.success(f"{first if game['result'] == 'X' else second} won! 🎉")
+    else:
+        x_turn = bin(game["x"]).count("1") == bin(game["o"]).count("1")
+        st.caption(turn_caption(first if x_turn else second, TTT_MARKS["X" if x_turn else "O"]))
+
+def render_connect_four(game):
+    first, second = game_players(game)
+    board = "\n".join("".join(C4_STONES[cell] for cell in row) for row in c4_cells(game["position"], game["mask"], game["moves"]))
+    st.markdown(f'<div style="font-size: 32px; line-height: 1.15; text-align: center; white-space: pre;">{board}</div>', unsafe_allow_html=True)
+    for column, col in enumerate(st.columns(C4_WIDTH)):
+        col.button("⬇️", key=f"c4_{column}", use_container_width=True, on_click=play_connect_four, args=(column,),
+                   disabled=game["result"] is not None or not c4_can_play(game["mask"], column))
+    if game["result"] == "draw":
+        st.info("The board is full: it's a draw! 🤝")
+    elif game["result"]:
+        st.success(f"{first if game['result'] == 'first' else second} won! 🎉")
+    else:
+        first_turn = game["moves"] % 2 == 0
+        st.caption(turn_caption(first if first_turn else second, C4_STONES[1 if first_turn else 2]))
+
+def render_guess_the_number(game):
+    if game["secret"] is None:
+        st.markdown(f"**Player 1**, pick a secret number from 1 to {game['maximum']} (Player 2, look away!)")
+        if "game_warning" in st.session_state:
+            st.warning(st.session_state.pop("game_warning"))
+        with st.form("guess_secret_form", clear_on_submit=True, border=False):
+            st.text_input("Secret number", type="password", key="guess_secret_input")
+            st.form_submit_button("Hide it!", on_click=hide_secret_number)
+        return
+    guesser = "You" if game["mode"] == GAME_MODES[0] else "Player 2"
+    thinker = "I'm" if game["mode"] == GAME_MODES[0] else "Player 1 is"
+    st.markdown(f"{thinker} thinking of a number from 1 to {game['maximum']}. {guesser}: {game['tries'] - len(game['guesses'])} guesses left!")
+    for guess, hint in game["guesses"]:
+        st.write(f"{guess}: " + {"higher": "⬆️ Higher!", "lower": "⬇️ Lower!", "correct": "🎯 Got it!"}[hint])
+    if game["result"] == "won":
+        st.success(f"{guesser} found it in {len(game['guesses'])} guesses! 🎉")
+    elif game["result"] == "lost":
+        st.error(f"Out of guesses! The number was {game['secret']}.")
+    else:
+        with st.form("guess_form", clear_on_submit=True, border=False):
+            st.number_input("Your guess", min_value=1, max_value=game["maximum"], step=1, value=None, key="guess_input")
+            st.form_submit_button("Guess!", on_click=guess_number)
+
+def render_rock_paper_scissors(game):
+    first, second = game_players(game)
+    if game["mode"] == GAME_MODES[1]:
+        st.markdown(f"**{second if game['pending'] else first}**, pick your hand (no peeking!)")
+    for move, col in zip(RPS_MOVES, st.columns(3)):
+        col.button(f"{RPS_EMOJI[move]} {move.capitalize()}", key=f"rps_{move}", use_container_width=True,
+                   on_click=play_rock_paper_scissors, args=(move,))
+    if game["last"] and not game["pending"]:
+        first_move, second_move, result = game["last"]
+        outcome = {"win": f"{first} won!", "lose": f"{second} won!", "draw": "It's a draw!"}[result]
+        st.info(f"{first}: {RPS_EMOJI[first_move]} · {second}: {RPS_EMOJI[second_move]} → {outcome}")
+    score = game["score"]
+    st.caption(f"Score: {first} {score['win']} · {second} {score['lose']} · draws {score['draw']}")
+
+GAME_RENDERERS = {
+    "Tic-Tac-Toe": render_tic_tac_toe,
+    "Connect Four": render_connect_four,
+    "Guess the Number": render_guess_the_number,
+    "Rock-Paper-Scissors": render_rock_paper_scissors,
+}
+
+@st.fragment
+def render_game_corner():
+    """Game Corner: games run locally (no model calls) and every move only reruns this fragment."""
+    learning_progress_val = st.session_state.learning_progress.get("lessons_completed", 0)
+    st.title("🎮 Game Corner!")
+    st.markdown("---")
+    if learning_progress_val < GAME_UNLOCK_THRESHOLD:
+        st.warning(f"Games are currently locked. Complete {GAME_UNLOCK_THRESHOLD - learning_progress_val} more lessons to unlock them! Current progress: {learning_progress_val}/{GAME_UNLOCK_THRESHOLD}")
+        return
+
+    game_col, mode_col, level_col = st.columns(3)
+    name = game_col.selectbox("Game", GAMES, key="game_name")
+    mode = mode_col.radio("Players", GAME_MODES, key="game_mode")
+    difficulty = level_col.select_slider("Bot level", DIFFICULTIES, value="Medium", key="game_difficulty",
+                                         disabled=mode != GAME_MODES[0] and name != "Guess the Number")
+    game = current_game()
+    if game is None or (game["name"], game["mode"], game["difficulty"]) != (name, mode, difficulty):
+        game = new_game(name, mode, difficulty)
+
+    st.markdown("---")
+    GAME_RENDERERS[name](game)
+    st.button("🔄 New game", key="new_game_btn", on_click=new_game)
+    track_fragment_run()
+
 
-        if st.button("Back to Study Time"):
-            st.session_state["app_mode"] = "Study Time"
-            st.rerun()
+# --- Main Content Display ---
+with main_col:
+    # Display Home Screen (Avatar Selection)
+    if st.session_state["app_mode"] == "Home":
+        render_avatar_picker()
+
+    # --- Chat with Bot Section ---
+    elif st.session_state["app_mode"] == "Chat with Bot":
+        render_chat()
+
+    # --- Study Time Section ---
+    elif st.session_state["app_mode"] == "Study Time":
+        render_study()
+
+    # --- Quiz Time Section ---
+    elif st.session_state["app_mode"] == "Quiz Time":
+        render_quiz()
 
     # --- Game Corner Section ---
     elif st.session_state["app_mode"] == "Game Corner":
-        st.title("🎮 Game Corner!")
-        st.markdown("---")
-        st.subheader("Welcome to the Game Corner!")
-        st.markdown("This is where we'll add fun games to play.")
-        st.markdown("---")
-
-        if learning_progress_val >= GAME_UNLOCK_THRESHOLD:
-            st.success("Games are unlocked! Choose one below:")
-            st.write("- **One Player vs Bot:** Like a simple 'Guess the Number' or 'Rock-Paper-Scissors' with the computer.")
-            st.write("- **Two Player Games:** Where two friends can play together on the same screen (e.g., Tic-Tac-Toe).")
-            st.info("Actual game logic to be implemented here!")
-        else:
-            st.warning(f"Games are currently locked. Complete {GAME_UNLOCK_THRESHOLD - learning_progress_val} more lessons to unlock them! Current progress: {learning_progress_val}/{GAME_UNLOCK_THRESHOLD}")
+        render_game_corner()
 
-        st.markdown("Stay tuned! If you have ideas for a game, let me know in the chat!")
+# Save this run's changes to subjects, progress, reminders, avatar and quiz subject, so every tab and worker sees them
+sync_learner_state()
+track_session_memory()
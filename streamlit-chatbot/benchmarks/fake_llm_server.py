@@ -0,0 +1,208 @@
+"""Local stand-in for the Groq (OpenAI-compatible) chat completions API.
+
+Streams made-up answers with a configurable time-to-first-token and token rate,
+and can inject rate limits, server errors and dropped streams. Point the app at
+it with base_url in the [llm_client] secrets section (or GROQ_BASE_URL):
+
+    python benchmarks/fake_llm_server.py --port 8787 --ttft 0.3 --tokens-per-sec 80
+"""
+import argparse
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COMPLETIONS_PATH = "/openai/v1/chat/completions"
+WORDS = ("olive", "learning", "is", "fun", "and", "every", "question", "helps", "you", "grow", "a", "little", "more")
+_QUIZ_COUNT_RE = re.compile(r"Generate (\d+)")
+
+
+class FakeLLMSettings:
+    """Behaviour of the fake API; can be changed while the server runs."""
+
+    def __init__(self, ttft=0.2, tokens_per_sec=200.0, reply_tokens=60, error_rate=0.0, rate_limit_rate=0.0,
+                 drop_rate=0.0, requests_per_minute=0, seed=None):
+        self.ttft = ttft                          # Seconds before the first token
+        self.tokens_per_sec = tokens_per_sec      # Streaming speed after the first token
+        self.reply_tokens = reply_tokens          # Words in a chat answer
+        self.error_rate = error_rate              # Share of requests answered with a 500
+        self.rate_limit_rate = rate_limit_rate    # Share of requests answered with a 429
+        self.drop_rate = drop_rate                # Share of streams cut off halfway through
+        self.requests_per_minute = requests_per_minute  # Enforced quota (0 = unlimited)
+        self.random = random.Random(seed)
+
+
+def _answer_text(messages, settings):
+    """Quiz prompts get parseable questions; everything else gets filler words."""
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    if "quiz master" in system.lower():
+        match = _QUIZ_COUNT_RE.search(system)
+        count = int(match.group(1)) if match else 1
+        return "\n\n".join(
+            f"Question: Fake question {uuid.uuid4().hex[:8]}: what comes after {n}?\nA) {n}\nB) {n + 1}\nC) {n + 2}\nCorrect: B"
+            for n in range(count)
+        )
+    return " ".join(settings.random.choice(WORDS) for _ in range(settings.reply_tokens)) + "."
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so the app's connection pool behaves as in production
+    server_version = "FakeLLM/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path != COMPLETIONS_PATH:
+            self._send_json(404, {"error": {"message": "Unknown path", "type": "invalid_request_error"}})
+            return
+        server = self.server
+        settings = server.settings
+        server.count("requests")
+        remaining = server.take_quota()
+        rate_headers = {
+            "x-ratelimit-limit-requests": str(settings.requests_per_minute or 14400),
+            "x-ratelimit-remaining-requests": str(remaining),
+            "x-ratelimit-reset-requests": "2s",
+            "x-ratelimit-remaining-tokens": "100000",
+            "x-ratelimit-reset-tokens": "1s",
+        }
+        roll = settings.random.random()
+        if remaining < 0 or roll < settings.rate_limit_rate:
+            server.count("rate_limited")
+            rate_headers.update({"retry-after": "1", "x-ratelimit-remaining-requests": "0"})
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                            rate_headers)
+            return
+        if roll < settings.rate_limit_rate + settings.error_rate:
+            server.count("errors")
+            self._send_json(500, {"error": {"message": "Injected server error", "type": "internal_server_error"}})
+            return
+
+        model = body.get("model", "fake-model")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        words = _answer_text(body.get("messages", []), settings).split(" ")
+        words = [word + " " for word in words[:-1]] + words[-1:]
+        time.sleep(settings.ttft)
+
+        if not body.get("stream"):
+            server.count("completed")
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(words), "total_tokens": len(words)},
+            }, rate_headers)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in rate_headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        drop_at = len(words) // 2 if settings.random.random() < settings.drop_rate else None
+        try:
+            for i, word in enumerate(words):
+                if i == drop_at:
+                    server.count("dropped")
+                    self.connection.shutdown(socket.SHUT_RDWR)  # Cut the stream off mid-answer
+                    return
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"role": "assistant", "content": word}, "finish_reason": None}]}
+                self._write_chunk(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+                if settings.tokens_per_sec:
+                    time.sleep(1 / settings.tokens_per_sec)
+            done = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            self._write_chunk(b"data: " + json.dumps(done).encode() + b"\n\ndata: [DONE]\n\n")
+            self._write_chunk(b"")
+            server.count("completed")
+        except (BrokenPipeError, ConnectionResetError):
+            server.count("client_disconnects")  # The app cancelled the request
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """Threaded fake API server; start() serves it from a daemon thread."""
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, settings=None):
+        super().__init__((host, port), _Handler)
+        self.settings = settings or FakeLLMSettings()
+        self._lock = threading.Lock()
+        self._recent_requests = deque()
+        self.counters = {"requests": 0, "completed": 0, "rate_limited": 0, "errors": 0, "dropped": 0, "client_disconnects": 0}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def take_quota(self):
+        """Returns the requests left this minute after this one (negative when over quota)."""
+        limit = self.settings.requests_per_minute
+        if not limit:
+            return 14400
+        now = time.monotonic()
+        with self._lock:
+            while self._recent_requests and now - self._recent_requests[0] > 60:
+                self._recent_requests.popleft()
+            if len(self._recent_requests) >= limit:
+                return -1
+            self._recent_requests.append(now)
+            return limit - len(self._recent_requests)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-llm-server", daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--ttft", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests failing with a 429")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="share of streams cut off halfway")
+    parser.add_argument("--requests-per-minute", type=int, default=0, help="enforced quota, 0 for none")
+    args = parser.parse_args()
+    settings = FakeLLMSettings(args.ttft, args.tokens_per_sec, args.reply_tokens, args.error_rate,
+                               args.rate_limit_rate, args.drop_rate, args.requests_per_minute)
+    server = FakeLLMServer(args.host, args.port, settings)
+    print(f"Fake LLM API on {server.base_url} (set base_url in [llm_client] or GROQ_BASE_URL)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
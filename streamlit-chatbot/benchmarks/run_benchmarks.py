@@ -0,0 +1,493 @@
+"""Headless load test and benchmark suite for the learning companion app.
+
+Drives app.py through Streamlit's AppTest (one AppTest per simulated learner,
+all in this process, sharing its caches, gateway and storage like real sessions
+do) against the local fake LLM server. Reports rerun latency percentiles per
+step, memory per session and the most concurrent sessions one process can serve
+within the latency SLO. Results can be saved as a baseline and compared later.
+
+    python benchmarks/run_benchmarks.py                   # run and print the report
+    python benchmarks/run_benchmarks.py --save-baseline   # ... and store it as the baseline
+    python benchmarks/run_benchmarks.py --compare         # exit 1 on regressions vs. the baseline
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.runtime.secrets import Secrets
+from streamlit.testing.v1 import AppTest
+
+from fake_llm_server import FakeLLMServer, FakeLLMSettings, WORDS
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # The app's own modules
+from games import DIFFICULTIES, ConnectFourEngine, c4_aligned, c4_can_play, c4_play
+from learner_archive import import_archive, write_archive
+from learner_state import LearnerStateStore, create_learner_state_backend
+from storage import create_conversation_store
+from transcript import new_message
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(os.path.dirname(BENCHMARK_DIR), "app.py")
+BASELINE_DIR = os.path.join(BENCHMARK_DIR, "baselines")
+RUN_TIMEOUT = 120               # Seconds a single rerun may take before AppTest gives up
+NOISE_FLOOR_MS = 50             # Latency changes smaller than this never count as regressions
+STUDY_SUBJECT = "Science"
+SEARCH_QUERIES = ("volcano", "lava rock", "olive learning", "term42", "zebra")
+
+
+# --- Measurements ---
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+class LatencyRecorder:
+    """Collects rerun latencies (ms) per flow step from many session threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}  # step -> [ms]
+        self.errors = []
+
+    def record(self, step, elapsed_ms, error=None):
+        with self._lock:
+            self.latencies.setdefault(step, []).append(elapsed_ms)
+            if error:
+                self.errors.append(f"{step}: {error}")
+
+    def record_error(self, step, error):
+        with self._lock:
+            self.errors.append(f"{step}: {error}")
+
+    def all_latencies(self):
+        with self._lock:
+            return [ms for values in self.latencies.values() for ms in values]
+
+    def summary(self):
+        """Returns {step: {count, p50, p95, p99, max}} in ms, plus an "all" row."""
+        with self._lock:
+            rows = dict(self.latencies)
+        rows["all"] = [ms for values in rows.values() for ms in values]
+        return {step: {"count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95),
+                       "p99": percentile(values, 99), "max": max(values)}
+                for step, values in rows.items() if values}
+
+
+# --- Learner Flow ---
+def allow_concurrent_app_tests(secrets):
+    """AppTest swaps the global secrets and mock Runtime in for each run and restores them afterwards,
+    which breaks runs still going in other threads. Install the secrets once, and keep the last
+    Runtime available instead."""
+    # Each run also compiles app.py, and ast.parse isn't thread-safe on older Pythons (CPython gh-106905)
+    compile_lock = threading.Lock()
+    get_bytecode = ScriptCache.get_bytecode
+
+    def locked_get_bytecode(self, script_path):
+        with compile_lock:
+            return get_bytecode(self, script_path)
+
+    ScriptCache.get_bytecode = locked_get_bytecode
+    shared_secrets = Secrets()
+    shared_secrets._secrets = secrets
+    st.secrets = shared_secrets
+    last_runtime = []
+
+    def current(cls):
+        if cls._instance is not None:
+            last_runtime[:] = [cls._instance]
+        return cls._instance or (last_runtime[0] if last_runtime else None)
+
+    def instance(cls):
+        runtime = current(cls)
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: current(cls) is not None)
+
+
+class StepFailed(Exception):
+    """A rerun raised or timed out (already recorded)."""
+
+
+def run_step(at, recorder, step):
+    """Reruns the app (after a widget interaction) and records how long the rerun took."""
+    started_at = time.perf_counter()
+    try:
+        at.run(timeout=RUN_TIMEOUT)
+        error = at.exception[0].message if at.exception else None
+    except Exception as e:  # AppTest raises on timeouts
+        error = repr(e)
+    recorder.record(step, (time.perf_counter() - started_at) * 1000, error)
+    if error:
+        raise StepFailed(error)
+
+
+def find_button(at, label_prefix):
+    return next(button for button in at.button if button.label.startswith(label_prefix))
+
+
+def learner_flow(session_index, recorder, chat_turns):
+    """One learner: picks an avatar, chats, studies a subject and answers a quiz question. Returns the AppTest."""
+    at = AppTest.from_file(APP_PATH, default_timeout=RUN_TIMEOUT)
+    run_step(at, recorder, "load")
+    at.button(key="emoji_btn_🦉").click()
+    run_step(at, recorder, "pick_avatar")
+    at.button(key="start_chat_btn").click()
+    run_step(at, recorder, "start_chat")
+    for turn in range(chat_turns):
+        # Distinct prompts per learner, so the response cache doesn't answer everything
+        at.chat_input[0].set_value(f"Learner {session_index} asks question {turn}: why is the sky blue?")
+        run_step(at, recorder, "chat_turn")
+    at.sidebar.radio(key="subject_chat_selector").set_value(STUDY_SUBJECT)
+    run_step(at, recorder, "switch_subject")
+    at.sidebar.radio(key="app_mode_radio").set_value("Study Time")
+    run_step(at, recorder, "open_study")
+    at.chat_input[0].set_value(f"Learner {session_index}: how do plants make food?")
+    run_step(at, recorder, "study_turn")
+    find_button(at, "Give me a Quiz").click()
+    run_step(at, recorder, "open_quiz")
+    next(field for field in at.text_input if field.label.startswith("Your Answer")).set_value("B")
+    find_button(at, "Submit Answer").click()
+    run_step(at, recorder, "answer_quiz")
+    return at
+
+
+def run_sessions(count, recorder, chat_turns, keep=None, first_index=0):
+    """Runs `count` learner flows at the same time, one thread each."""
+    def target(session_index):
+        try:
+            at = learner_flow(session_index, recorder, chat_turns)
+            if keep is not None:
+                keep.append(at)
+        except StepFailed:
+            pass
+        except Exception as e:  # E.g. a widget the flow expects is missing
+            recorder.record_error("flow", repr(e))
+
+    threads = [threading.Thread(target=target, args=(first_index + i,), name=f"learner-{first_index + i}")
+               for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+# --- Benchmarks ---
+def benchmark_latency(sessions, chat_turns):
+    """Sequential learners: rerun latency per step without contention."""
+    recorder = LatencyRecorder()
+    for session_index in range(sessions):
+        run_sessions(1, recorder, chat_turns, first_index=session_index)
+    return {"steps": recorder.summary(), "errors": recorder.errors}
+
+
+def benchmark_memory(sessions, chat_turns, first_index):
+    """Memory held per live session (session state, transcripts, rendered markdown), measured with tracemalloc."""
+    run_sessions(1, LatencyRecorder(), chat_turns, first_index=first_index)  # Warm process-wide caches first
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        live_sessions = []
+        recorder = LatencyRecorder()
+        for i in range(sessions):
+            run_sessions(1, recorder, chat_turns, keep=live_sessions, first_index=first_index + 1 + i)
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return {
+        "sessions": len(live_sessions),
+        "kib_per_session": (after - before) / 1024 / max(1, len(live_sessions)),
+        "errors": recorder.errors,
+    }
+
+
+def benchmark_capacity(max_sessions, chat_turns, slo_ms, first_index):
+    """Doubles the number of simultaneous learners until p95 rerun latency breaks the SLO or errors appear."""
+    levels = []
+    best = 0
+    concurrency = 1
+    while concurrency <= max_sessions:
+        recorder = LatencyRecorder()
+        started_at = time.perf_counter()
+        run_sessions(concurrency, recorder, chat_turns, first_index=first_index)
+        first_index += concurrency
+        p95 = percentile(recorder.all_latencies(), 95)
+        ok = not recorder.errors and p95 is not None and p95 <= slo_ms
+        levels.append({"sessions": concurrency, "p95_ms": p95, "p99_ms": percentile(recorder.all_latencies(), 99),
+                       "errors": len(recorder.errors), "wall_s": time.perf_counter() - started_at, "ok": ok})
+        if not ok:
+            break
+        best = concurrency
+        concurrency *= 2
+    return {"max_sessions": best, "slo_ms": slo_ms, "levels": levels}
+
+
+def benchmark_search(storage, path, messages):
+    """Full-text search latency over one learner's history of `messages` messages."""
+    store = create_conversation_store(storage, path)
+    # Zipf-distributed vocabulary, like real text: a few very common words and a long tail
+    vocabulary = list(WORDS) + [f"term{i}" for i in range(5000)]
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    topics = ("volcanoes erupt with hot lava", "the volcano is a mountain", "lava cools into rock")
+    rnd = random.Random(7)
+    started_at = time.perf_counter()
+    for i in range(messages):
+        text = " ".join(rnd.choices(vocabulary, weights, k=rnd.randint(5, 60)))
+        if i % 100 == 0:
+            text += " " + rnd.choice(topics)
+        store.append_message("search-learner", f"subject-{i % 8}", new_message("user" if i % 2 else "assistant", text),
+                             "study" if i % 4 == 0 else "chat")
+    store.flush()
+    index_seconds = time.perf_counter() - started_at
+    latencies = []
+    for _ in range(20):
+        for query in SEARCH_QUERIES:
+            started_at = time.perf_counter()
+            store.search_messages("search-learner", query)
+            latencies.append((time.perf_counter() - started_at) * 1000)
+    store.close()
+    return {"messages": messages, "index_s": index_seconds, "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95), "max_ms": max(latencies)}
+
+
+def benchmark_games(positions):
+    """Connect Four bot move latency per level, over `positions` random mid-game positions."""
+    started_at = time.perf_counter()
+    engine = ConnectFourEngine()
+    book_seconds = time.perf_counter() - started_at
+    rnd = random.Random(11)
+    boards = []
+    while len(boards) < positions:
+        position = mask = moves = 0
+        for _ in range(rnd.randint(0, 24)):
+            column = rnd.choice([c for c in range(7) if c4_can_play(mask, c)])
+            child_position, child_mask = c4_play(position, mask, column)
+            if c4_aligned(child_position ^ child_mask):
+                break
+            position, mask, moves = child_position, child_mask, moves + 1
+        boards.append((position, mask, moves))
+    levels = {}
+    for difficulty in DIFFICULTIES:
+        latencies = []
+        for position, mask, moves in boards:
+            started_at = time.perf_counter()
+            engine.best_move(position, mask, moves, difficulty, rnd)
+            latencies.append((time.perf_counter() - started_at) * 1000)
+        levels[difficulty] = {"p50_ms": percentile(latencies, 50), "p95_ms": percentile(latencies, 95), "max_ms": max(latencies)}
+    return {"positions": positions, "book_s": book_seconds, "levels": levels}
+
+
+def benchmark_archive(storage, data_dir, learners, messages):
+    """Moves a class of `learners` learners with `messages` messages each to a fresh store through one archive."""
+    source = os.path.join(data_dir, "class.sqlite3")
+    store = create_conversation_store(storage, source)
+    state_store = LearnerStateStore(create_learner_state_backend(storage, source))
+    rnd = random.Random(13)
+    user_ids = [f"class-learner-{i}" for i in range(learners)]
+    for user_id in user_ids:
+        subjects = [{"id": "general", "name": "General Chat", "emoji": "💬"}, {"id": "science", "name": "Science", "emoji": "🔬"}]
+        document = {"user_subjects": subjects, "learning_progress": {"lessons_completed": 3}, "user_reminders": [],
+                    "user_avatar": "😀", "quiz_subject_id": "general"}
+        state_store.save(user_id, 0, document, document)
+        for i in range(messages):
+            store.append_message(user_id, subjects[i % 2]["id"], new_message("user" if i % 2 else "assistant",
+                                                                            " ".join(rnd.choices(WORDS, k=rnd.randint(5, 60)))),
+                                 "study" if i % 4 == 0 else "chat")
+    store.flush()
+
+    def move(target):
+        with tempfile.TemporaryFile() as archive:
+            started_at = time.perf_counter()
+            size = write_archive(archive, user_ids, store, state_store)
+            export_seconds = time.perf_counter() - started_at
+            archive.seek(0)
+            moved = create_conversation_store(storage, target)
+            started_at = time.perf_counter()
+            report = import_archive(archive, moved, LearnerStateStore(create_learner_state_backend(storage, target)))
+            moved.close()
+            return report, size, export_seconds, time.perf_counter() - started_at
+
+    report, size, export_seconds, import_seconds = move(os.path.join(data_dir, "moved.sqlite3"))
+    # Again under tracemalloc (which slows it down) for the peak, which shouldn't grow with the history
+    tracemalloc.start()
+    move(os.path.join(data_dir, "traced.sqlite3"))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    store.close()
+    return {"learners": report["learners"], "messages": report["messages"], "archive_kib": size / 1024,
+            "export_s": export_seconds, "import_s": import_seconds, "peak_kib": peak / 1024}
+
+
+# --- Baselines ---
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def find_regressions(results, baseline, tolerance):
+    """Lists the metrics that got worse than the baseline by more than `tolerance` (a fraction)."""
+    regressions = []
+    if results["config"] != baseline.get("config"):
+        print("Note: benchmark settings differ from the baseline's, so comparisons may not be meaningful.")
+    for step, row in results["latency"]["steps"].items():
+        old = baseline.get("latency", {}).get("steps", {}).get(step)
+        if old and row["p95"] > old["p95"] * (1 + tolerance) and row["p95"] - old["p95"] > NOISE_FLOOR_MS:
+            regressions.append(f"{step} p95 {old['p95']:.0f} ms -> {row['p95']:.0f} ms")
+    old_memory = baseline.get("memory", {}).get("kib_per_session")
+    new_memory = results["memory"]["kib_per_session"]
+    if old_memory and new_memory > old_memory * (1 + tolerance):
+        regressions.append(f"memory per session {old_memory:.0f} KiB -> {new_memory:.0f} KiB")
+    old_search = baseline.get("search", {}).get("p95_ms")
+    new_search = results["search"]["p95_ms"]
+    if old_search and new_search > old_search * (1 + tolerance) and new_search - old_search > 1:
+        regressions.append(f"search p95 {old_search:.1f} ms -> {new_search:.1f} ms")
+    for difficulty, row in results["games"]["levels"].items():
+        old = baseline.get("games", {}).get("levels", {}).get(difficulty)
+        if old and row["p95_ms"] > old["p95_ms"] * (1 + tolerance) and row["p95_ms"] - old["p95_ms"] > 1:
+            regressions.append(f"{difficulty} bot move p95 {old['p95_ms']:.1f} ms -> {row['p95_ms']:.1f} ms")
+    old_move = baseline.get("archive", {})
+    new_move = results["archive"]["export_s"] + results["archive"]["import_s"]
+    if old_move and new_move > (old_move["export_s"] + old_move["import_s"]) * (1 + tolerance):
+        regressions.append(f"class move {old_move['export_s'] + old_move['import_s']:.2f}s -> {new_move:.2f}s")
+    old_capacity = baseline.get("capacity", {}).get("max_sessions")
+    if old_capacity and results["capacity"]["max_sessions"] < old_capacity:
+        regressions.append(f"max concurrent sessions {old_capacity} -> {results['capacity']['max_sessions']}")
+    return regressions
+
+
+# --- Report ---
+def print_report(results):
+    print(f"\nRerun latency per step ({results['config']['latency_sessions']} learners, one at a time), ms")
+    print(f"{'step':<16}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for step, row in results["latency"]["steps"].items():
+        print(f"{step:<16}{row['count']:>7}{row['p50']:>9.0f}{row['p95']:>9.0f}{row['p99']:>9.0f}{row['max']:>9.0f}")
+    memory = results["memory"]
+    print(f"\nMemory: {memory['kib_per_session']:.0f} KiB per live session ({memory['sessions']} sessions)")
+    search = results["search"]
+    print(f"\nSearch over {search['messages']} messages: p50 {search['p50_ms']:.1f} ms, p95 {search['p95_ms']:.1f} ms, "
+          f"max {search['max_ms']:.1f} ms (indexed in {search['index_s']:.1f}s)")
+    games = results["games"]
+    print(f"\nConnect Four bot moves over {games['positions']} positions (opening book built in {games['book_s']:.2f}s)")
+    for difficulty, row in games["levels"].items():
+        print(f"  {difficulty:<8} p50 {row['p50_ms']:.1f} ms, p95 {row['p95_ms']:.1f} ms, max {row['max_ms']:.1f} ms")
+    archive = results["archive"]
+    print(f"\nClass move: {archive['learners']} learners, {archive['messages']} messages in a {archive['archive_kib']:.0f} KiB "
+          f"archive; export {archive['export_s']:.2f}s, import {archive['import_s']:.2f}s, peak {archive['peak_kib']:.0f} KiB")
+    capacity = results["capacity"]
+    print(f"\nConcurrent learners (SLO: p95 rerun <= {capacity['slo_ms']} ms)")
+    for level in capacity["levels"]:
+        status = "ok" if level["ok"] else "FAIL"
+        print(f"  {level['sessions']:>4} sessions: p95 {level['p95_ms'] or 0:>7.0f} ms, p99 {level['p99_ms'] or 0:>7.0f} ms, "
+              f"{level['errors']} errors, {level['wall_s']:.1f}s  {status}")
+    print(f"Max concurrent sessions per process: {capacity['max_sessions']}")
+    print(f"\nFake LLM server: {results['server']}")
+    errors = results["latency"]["errors"] + results["memory"]["errors"]
+    if errors:
+        print(f"\nErrors ({len(errors)}):", *errors[:10], sep="\n  ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless load test and benchmarks for app.py")
+    parser.add_argument("--latency-sessions", type=int, default=5, help="learners run one after another for latency")
+    parser.add_argument("--memory-sessions", type=int, default=10, help="learners kept alive for the memory measurement")
+    parser.add_argument("--max-sessions", type=int, default=32, help="highest concurrency level to try")
+    parser.add_argument("--chat-turns", type=int, default=3)
+    parser.add_argument("--slo-ms", type=float, default=2500, help="p95 rerun latency a concurrency level must meet")
+    parser.add_argument("--ttft", type=float, default=0.2, help="fake server time to first token (s)")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--storage", choices=("sqlite", "memory"), default="sqlite")
+    parser.add_argument("--search-messages", type=int, default=20000, help="messages in the search benchmark's history")
+    parser.add_argument("--game-positions", type=int, default=200, help="positions in the game bot benchmark")
+    parser.add_argument("--class-learners", type=int, default=30, help="learners moved in the archive benchmark")
+    parser.add_argument("--class-messages", type=int, default=1000, help="messages per learner in the archive benchmark")
+    parser.add_argument("--semantic-cache", action="store_true",
+                        help="let similar questions from different learners share cached answers")
+    parser.add_argument("--baseline", default="default", help="baseline name (benchmarks/baselines/<name>.json)")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="exit with status 1 on regressions vs. the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown/growth before it's a regression")
+    args = parser.parse_args()
+
+    # Learner threads touch session state outside a script run, which logs a warning every time
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(lambda record: False)
+    settings = FakeLLMSettings(ttft=args.ttft, tokens_per_sec=args.tokens_per_sec, reply_tokens=args.reply_tokens,
+                               error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, drop_rate=args.drop_rate)
+    server = FakeLLMServer(settings=settings).start()
+    with tempfile.TemporaryDirectory() as data_dir:
+        secrets = {
+            "GROQ_API_KEY": "benchmark",
+            "llm_client": {"base_url": server.base_url},
+            # The fake server has no quota, so the client-side limiter mustn't be the bottleneck
+            "resilience": {"requests_per_minute": 1_000_000, "tokens_per_minute": 1_000_000_000},
+            "storage": {"backend": args.storage, "path": os.path.join(data_dir, "benchmark.sqlite3")},
+            # Scripted learners ask near-identical questions, which the similarity lookup would answer from the cache
+            "response_cache": {"semantic": args.semantic_cache},
+        }
+        allow_concurrent_app_tests(secrets)
+        results = {
+            "config": {key: getattr(args, key) for key in ("latency_sessions", "memory_sessions", "max_sessions", "chat_turns",
+                                                           "slo_ms", "ttft", "tokens_per_sec", "reply_tokens", "error_rate",
+                                                           "rate_limit_rate", "drop_rate", "storage", "semantic_cache",
+                                                           "search_messages", "game_positions", "class_learners",
+                                                           "class_messages")},
+            "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        results["latency"] = benchmark_latency(args.latency_sessions, args.chat_turns)
+        # Every learner gets its own index, so no two ask the same questions
+        results["memory"] = benchmark_memory(args.memory_sessions, args.chat_turns, args.latency_sessions)
+        results["capacity"] = benchmark_capacity(args.max_sessions, args.chat_turns, args.slo_ms,
+                                                 args.latency_sessions + args.memory_sessions + 1)
+        results["search"] = benchmark_search(args.storage, os.path.join(data_dir, "search.sqlite3"), args.search_messages)
+        results["games"] = benchmark_games(args.game_positions)
+        results["archive"] = benchmark_archive(args.storage, data_dir, args.class_learners, args.class_messages)
+        results["server"] = dict(server.counters)
+    server.shutdown()
+    print_report(results)
+
+    status = 0
+    if args.compare:
+        path = baseline_path(args.baseline)
+        if not os.path.exists(path):
+            print(f"\nNo baseline at {path}; run with --save-baseline first.")
+            status = 1
+        else:
+            with open(path) as f:
+                regressions = find_regressions(results, json.load(f), args.tolerance)
+            if regressions:
+                print(f"\nRegressions vs. baseline '{args.baseline}':", *regressions, sep="\n  ")
+                status = 1
+            else:
+                print(f"\nNo regressions vs. baseline '{args.baseline}'.")
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path(args.baseline), "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved baseline to {baseline_path(args.baseline)}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from context_window import MESSAGE_OVERHEAD_TOKENS, SUMMARY_LINE_CHARS, count_tokens
+from message_search import tokenize
+from storage import DEFAULT_SQLITE_PATH, create_conversation_store, pack_messages
+
+# --- Conversation Compaction ---
+# Background job that shrinks cold conversations. The older turns of a conversation
+# nobody has written to for a while are summarized into a compact "memory" record
+# and archived in compressed form; only the newest turns stay live. The app sends
+# the memories with each prompt instead of the archived turns, and still decompresses
+# archived turns when the learner scrolls back. Packing, tokenizing and keyword
+# extraction run in a process pool; summaries come from the model with bounded
+# concurrency, or from a local extractive summarizer when the model is unavailable.
+
+DEFAULT_IDLE_SECONDS = 24 * 60 * 60  # Conversations without new messages for this long are cold
+DEFAULT_KEEP_MESSAGES = 40           # Newest messages of a conversation that always stay live
+DEFAULT_CHUNK_MESSAGES = 100         # Messages per archive chunk and memory record
+DEFAULT_MIN_CHUNK_MESSAGES = 20      # Fewer archivable messages than this are left alone
+DEFAULT_BATCH_SIZE = 8               # Chunks prepared and summarized per batch
+DEFAULT_MAX_CONCURRENCY = 2          # Summaries requested from the model at once
+DEFAULT_PROCESSES = min(4, os.cpu_count() or 1)
+SUMMARY_MAX_TOKENS = 160             # Reply limit for a model summary
+PROMPT_MAX_TOKENS = 3000             # Transcript sent to the model per chunk
+LOCAL_SUMMARY_SENTENCES = 5          # Sentences picked by the local summarizer
+MEMORY_KEYWORDS = 8
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_WHITESPACE_RE = re.compile(r"\s+")
+# Common words that say nothing about what a conversation was about
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in is it its me my no not of on or so "
+    "that the their them then there these they this to too was we were what when where which who why will with "
+    "you your yes just like about more some also very".split()
+)
+
+
+def compaction_prompt(transcript):
+    """Builds the messages asking the model to summarize archived turns into a memory."""
+    return [
+        {"role": "system", "content": (
+            "You keep notes for a friendly tutor of kids. Summarize the conversation below in at most 5 short "
+            "bullet points: the topics the learner asked about, what they understood, and what they struggled with. "
+            "Only write the bullet points."
+        )},
+        {"role": "user", "content": transcript},
+    ]
+
+
+def summarize_locally(messages, keywords, sentences=LOCAL_SUMMARY_SENTENCES):
+    """Extractive fallback summary: the learner's questions and the sentences richest in the chunk's keywords."""
+    weights = {word: len(keywords) - i for i, word in enumerate(keywords)}
+    candidates = []
+    for position, message in enumerate(messages):
+        for sentence in _SENTENCE_RE.split(_WHITESPACE_RE.sub(" ", message["content"]).strip()):
+            words = tokenize(sentence)
+            if len(words) < 3:
+                continue
+            score = sum(weights.get(word, 0) for word in words) / len(words) ** 0.5
+            if message["role"] == "user":
+                score *= 1.5  # What the learner asked matters most
+            candidates.append((score, position, message["role"], sentence[:SUMMARY_LINE_CHARS]))
+    best = sorted(sorted(candidates, key=lambda c: -c[0])[:sentences], key=lambda c: c[1])
+    lines = [f"- {'Learner asked' if role == 'user' else 'Tutor said'}: {sentence}" for _, _, role, sentence in best]
+    if keywords:
+        lines.append(f"- Topics: {', '.join(keywords)}")
+    return "\n".join(lines)
+
+
+def prepare_chunk(messages):
+    """Packs, counts and indexes one chunk of messages (runs in a worker process)."""
+    words = Counter(word for m in messages for word in tokenize(m["content"])
+                    if word not in _STOPWORDS and len(word) > 2 and not word.isdigit())
+    keywords = [word for word, _ in words.most_common(MEMORY_KEYWORDS)]
+    data = pack_messages(messages)
+    lines, transcript_tokens = [], 0
+    for message in messages:
+        text = _WHITESPACE_RE.sub(" ", message["content"]).strip()[:2 * SUMMARY_LINE_CHARS]
+        line = f"{'Learner' if message['role'] == 'user' else 'Tutor'}: {text}"
+        transcript_tokens += count_tokens(line)
+        if transcript_tokens > PROMPT_MAX_TOKENS:
+            break
+        lines.append(line)
+    return {
+        "first_seq": messages[0]["seq"],
+        "last_seq": messages[-1]["seq"],
+        "messages": len(messages),
+        "data": data,
+        "raw_bytes": sum(len(m["content"].encode("utf-8")) for m in messages),
+        "archive_bytes": len(data),
+        "tokens": sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages),
+        "keywords": keywords,
+        "transcript": "\n".join(lines),
+        "local_summary": summarize_locally(messages, keywords),
+    }
+
+
+def format_memories(memories, max_tokens):
+    """Joins the newest memory summaries that fit in `max_tokens`, oldest first; None if there are none."""
+    picked, tokens = [], 0
+    for memory in reversed(memories):
+        tokens += memory["tokens"]
+        if picked and tokens > max_tokens:
+            break
+        picked.append(memory["summary"])
+    return "\n".join(reversed(picked)) or None
+
+
+class Compactor:
+    """Finds cold conversations in a conversation store and compacts their older turns.
+
+    `summarize(transcript)` returns a model summary; without it (or when it fails) the local summary is used.
+    With `interval`, a background thread runs the job every `interval` seconds.
+    """
+
+    def __init__(self, store, summarize=None, idle_seconds=DEFAULT_IDLE_SECONDS, keep_messages=DEFAULT_KEEP_MESSAGES,
+                 chunk_messages=DEFAULT_CHUNK_MESSAGES, min_chunk_messages=DEFAULT_MIN_CHUNK_MESSAGES,
+                 batch_size=DEFAULT_BATCH_SIZE, max_concurrency=DEFAULT_MAX_CONCURRENCY, processes=DEFAULT_PROCESSES,
+                 interval=None):
+        self.store = store
+        self.summarize = summarize
+        self.idle_seconds = idle_seconds
+        self.keep_messages = max(1, keep_messages)
+        self.chunk_messages = chunk_messages
+        self.min_chunk_messages = min_chunk_messages
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.processes = processes  # 0 prepares chunks in this process
+        self._lock = threading.Lock()
+        self._running = threading.Lock()  # One run at a time
+        self._totals = {"runs": 0, "conversations": 0, "chunks": 0, "messages": 0, "bytes_saved": 0, "tokens_saved": 0,
+                        "model_summaries": 0, "local_summaries": 0}
+        self.last_report = None
+        if interval:
+            self._thread = threading.Thread(target=self._loop, args=(interval,), name="conversation-compaction", daemon=True)
+            self._thread.start()
+
+    def _loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.run()
+            except Exception:
+                logger.exception("Conversation compaction failed")
+
+    def _chunks(self, report):
+        """Yields (user_id, subject_id, kind, messages) for every chunk that can be archived."""
+        min_messages = self.keep_messages + self.min_chunk_messages
+        for user_id, subject_id, kind in self.store.cold_conversations(self.idle_seconds, min_messages):
+            memories = self.store.load_memories(user_id, subject_id, kind)
+            first_live = memories[-1]["last_seq"] + 1 if memories else 0
+            end = self.store.count_messages(user_id, subject_id, kind) - self.keep_messages
+            if end - first_live < self.min_chunk_messages:
+                continue
+            messages = self.store.load_messages(user_id, subject_id, kind, limit=end - first_live, before_seq=end,
+                                                include_archived=False)
+            if not messages:
+                continue
+            report["conversations"] += 1
+            for start in range(0, len(messages), self.chunk_messages):
+                chunk = messages[start:start + self.chunk_messages]
+                if len(chunk) >= self.min_chunk_messages:  # A short last piece stays live until it grows
+                    yield user_id, subject_id, kind, chunk
+
+    def _summarize(self, prepared):
+        """Returns (summary, source) for a prepared chunk, falling back to the local summary."""
+        if self.summarize is not None and prepared["transcript"]:
+            try:
+                summary = (self.summarize(prepared["transcript"]) or "").strip()
+            except Exception as e:
+                logger.warning("Model summary failed, using the local one: %s", e)
+            else:
+                if summary:
+                    return summary, "model"
+        return prepared["local_summary"], "local"
+
+    def run(self):
+        """Compacts every cold conversation once; returns a report of what was saved."""
+        with self._running:
+            started_at = time.perf_counter()
+            report = {"conversations": 0, "chunks": 0, "messages": 0, "raw_bytes": 0, "archive_bytes": 0,
+                      "summary_bytes": 0, "tokens_before": 0, "tokens_after": 0, "model_summaries": 0,
+                      "local_summaries": 0, "skipped_chunks": 0}
+            chunks = self._chunks(report)
+            processes = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn")) if self.processes else None
+            try:
+                with ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="compaction-summary") as summarizers:
+                    while True:
+                        batch = [chunk for _, chunk in zip(range(self.batch_size), chunks)]
+                        if not batch:
+                            break
+                        batch_messages = [messages for _, _, _, messages in batch]
+                        prepared = list(processes.map(prepare_chunk, batch_messages) if processes else map(prepare_chunk, batch_messages))
+                        summaries = list(summarizers.map(self._summarize, prepared))
+                        for (user_id, subject_id, kind, _), chunk, (summary, source) in zip(batch, prepared, summaries):
+                            self._archive(report, user_id, subject_id, kind, chunk, summary, source)
+            finally:
+                if processes is not None:
+                    processes.shutdown()
+            report["bytes_saved"] = report["raw_bytes"] - report["archive_bytes"] - report["summary_bytes"]
+            report["tokens_saved"] = report["tokens_before"] - report["tokens_after"]
+            report["seconds"] = time.perf_counter() - started_at
+        with self._lock:
+            self._totals["runs"] += 1
+            for key in ("conversations", "chunks", "messages", "bytes_saved", "tokens_saved", "model_summaries", "local_summaries"):
+                self._totals[key] += report[key]
+            self.last_report = report
+        logger.info("Compacted %d messages in %d chunks of %d conversations in %.1fs: %d bytes and %d tokens saved "
+                    "(%d model / %d local summaries)", report["messages"], report["chunks"], report["conversations"],
+                    report["seconds"], report["bytes_saved"], report["tokens_saved"], report["model_summaries"],
+                    report["local_summaries"])
+        return report
+
+    def _archive(self, report, user_id, subject_id, kind, chunk, summary, source):
+        memory = {
+            "first_seq": chunk["first_seq"],
+            "last_seq": chunk["last_seq"],
+            "summary": summary,
+            "source": source,
+            "keywords": chunk["keywords"],
+            "tokens": count_tokens(summary) + MESSAGE_OVERHEAD_TOKENS,
+            "archived_tokens": chunk["tokens"],
+            "created_at": time.time(),
+        }
+        if not self.store.archive_messages(user_id, subject_id, kind, memory, chunk["data"]):
+            report["skipped_chunks"] += 1  # Another worker got there first
+            return
+        report["chunks"] += 1
+        report["messages"] += chunk["messages"]
+        report["raw_bytes"] += chunk["raw_bytes"]
+        report["archive_bytes"] += chunk["archive_bytes"]
+        report["summary_bytes"] += len(summary.encode("utf-8"))
+        report["tokens_before"] += chunk["tokens"]
+        report["tokens_after"] += memory["tokens"]
+        report[f"{source}_summaries"] += 1
+
+    def stats(self):
+        """Returns totals over all runs."""
+        with self._lock:
+            return dict(self._totals)
+
+
+def format_compaction_stats(stats):
+    """Formats compaction stats for display."""
+    return (f"Compaction: {stats['runs']} runs · {stats['messages']} messages archived from {stats['conversations']} conversations · "
+            f"{stats['bytes_saved'] / 1024:.0f} KiB and {stats['tokens_saved']} tokens saved")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compacts cold conversations offline, with local summaries.")
+    parser.add_argument("--backend", default="sqlite", choices=("sqlite", "redis"))
+    parser.add_argument("--path", default=DEFAULT_SQLITE_PATH, help="SQLite database file")
+    parser.add_argument("--url", help="Redis url")
+    parser.add_argument("--idle-hours", type=float, default=DEFAULT_IDLE_SECONDS / 3600)
+    parser.add_argument("--keep", type=int, default=DEFAULT_KEEP_MESSAGES, help="Newest messages kept live")
+    parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    store = create_conversation_store(args.backend, args.path, args.url, shared=True)
+    report = Compactor(store, idle_seconds=args.idle_hours * 3600, keep_messages=args.keep, processes=args.processes).run()
+    store.close()
+    for key, value in report.items():
+        print(f"{key:>16}: {value:.2f}" if isinstance(value, float) else f"{key:>16}: {value}")
+
+
+if __name__ == "__main__":
+    main()
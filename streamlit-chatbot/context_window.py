@@ -0,0 +1,144 @@
+import re
+
+# --- Token-Budgeted Context Window ---
+# Keeps the messages sent to the model under a token budget. Older turns that no
+# longer fit are folded into a short running summary instead of being re-sent.
+# Turns archived by compaction are represented by their memory summaries.
+
+DEFAULT_CONTEXT_BUDGET = 6144  # Leaves ~2k tokens for the reply inside llama3's 8192 window
+DEFAULT_SUMMARY_BUDGET = 512   # Upper bound on the running summary of dropped turns
+CHARS_PER_TOKEN = 4            # Rough average for English text with llama3's tokenizer
+MESSAGE_OVERHEAD_TOKENS = 4    # Role markers and separators added per message
+SUMMARY_LINE_CHARS = 160       # How much of each dropped turn survives in the summary
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def count_tokens(text):
+    """Estimates the number of tokens in a piece of text."""
+    if not text:
+        return 0
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def message_tokens(message):
+    """Returns the token count of a message, computing and caching it on first use."""
+    tokens = message.get("tokens")
+    if tokens is None:
+        tokens = count_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+        message["tokens"] = tokens
+    return tokens
+
+
+def _summary_line(message):
+    """Condenses a single turn into one line for the running summary."""
+    text = _WHITESPACE_RE.sub(" ", message.get("content", "")).strip()
+    if len(text) > SUMMARY_LINE_CHARS:
+        text = text[:SUMMARY_LINE_CHARS - 1].rstrip() + "…"
+    return f"- {message['role']}: {text}"
+
+
+class ContextWindow:
+    """Rolling, token-budgeted view over one conversation's history."""
+
+    def __init__(self, budget=DEFAULT_CONTEXT_BUDGET, summary_budget=DEFAULT_SUMMARY_BUDGET):
+        self.budget = budget
+        self.summary_budget = summary_budget
+        self.summary_lines = []   # Each entry is (line, tokens)
+        self.summary_tokens = 0
+        self.folded = 0           # Number of history messages already folded into the summary
+        self.folded_seq = -1      # Sequence number of the newest folded message
+        self.last_usage = None
+
+    def reset(self):
+        """Forgets the running summary, e.g. after the history was cleared."""
+        self.summary_lines = []
+        self.summary_tokens = 0
+        self.folded = 0
+        self.folded_seq = -1
+        self.last_usage = None
+
+    def _fold(self, messages):
+        """Adds dropped turns to the summary, trimming the oldest lines to stay in budget."""
+        for message in messages:
+            line = _summary_line(message)
+            tokens = count_tokens(line) + 1
+            self.summary_lines.append((line, tokens))
+            self.summary_tokens += tokens
+        while self.summary_lines and self.summary_tokens + MESSAGE_OVERHEAD_TOKENS > self.summary_budget:
+            _, tokens = self.summary_lines.pop(0)
+            self.summary_tokens -= tokens
+
+    def summary_message(self, memory=None):
+        """Returns the memory and running summary as a system message, or None if there is neither."""
+        if not self.summary_lines and not memory:
+            return None
+        lines = "\n".join(filter(None, [memory] + [line for line, _ in self.summary_lines]))
+        return {"role": "system", "content": f"Summary of the earlier conversation:\n{lines}"}
+
+    def build(self, history, system_prompt=None, memory=None):
+        """Returns the messages to send for this turn, always keeping the system prompt.
+
+        `history` may be just the in-memory tail of a conversation; messages are matched
+        by their "seq" number (falling back to list position) rather than by index.
+        `memory` summarizes turns that were archived by compaction and are not in `history`.
+        """
+        seqs = [m.get("seq", i) for i, m in enumerate(history)]
+        if not history or seqs[-1] <= self.folded_seq:
+            self.reset()  # History was cleared or replaced since the last request
+
+        # First message that hasn't been folded into the summary yet
+        first_unfolded = len(history)
+        while first_unfolded > 0 and seqs[first_unfolded - 1] > self.folded_seq:
+            first_unfolded -= 1
+
+        system_tokens = 0
+        if system_prompt:
+            system_tokens = count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+        memory_tokens = count_tokens(memory) + 1 if memory else 0
+        available = self.budget - system_tokens - self.summary_budget - memory_tokens
+
+        # Walk back from the newest message until the budget is used up (always keep the last one)
+        start = len(history)
+        history_tokens = 0
+        while start > first_unfolded:
+            tokens = message_tokens(history[start - 1])
+            if history_tokens + tokens > available and start < len(history):
+                break
+            history_tokens += tokens
+            start -= 1
+
+        if start > first_unfolded:
+            self._fold(history[first_unfolded:start])
+            self.folded += start - first_unfolded
+            self.folded_seq = seqs[start - 1]
+
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        summary = self.summary_message(memory)
+        if summary:
+            messages.append(summary)
+        messages.extend({"role": m["role"], "content": m["content"]} for m in history[start:])
+
+        summary_tokens = self.summary_tokens + memory_tokens + MESSAGE_OVERHEAD_TOKENS if summary else 0
+        self.last_usage = {
+            "system": system_tokens,
+            "summary": summary_tokens,
+            "history": history_tokens,
+            "total": system_tokens + summary_tokens + history_tokens,
+            "budget": self.budget,
+            "kept_messages": len(history) - start,
+            "folded_messages": self.folded,
+        }
+        return messages
+
+
+def format_usage(usage):
+    """Formats a usage report for display under the chat."""
+    if not usage:
+        return ""
+    text = f"Context: {usage['total']} / {usage['budget']} tokens ({usage['kept_messages']} recent messages"
+    if usage["folded_messages"]:
+        text += f", {usage['folded_messages']} older ones summarized"
+    return text + ")"
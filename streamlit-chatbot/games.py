@@ -0,0 +1,334 @@
+import math
+import random
+import threading
+import time
+from collections import Counter
+
+# --- Game Corner Engines ---
+# Local game logic for Tic-Tac-Toe, Connect Four, Guess the Number and
+# Rock-Paper-Scissors; no model calls. Boards are bitboards (one int per player).
+# Tic-Tac-Toe is solved once per process into a table of every reachable position;
+# Connect Four bots run an iterative-deepening alpha-beta search under a time budget,
+# with a transposition table shared by all sessions so positions searched for one
+# learner are free for the next.
+
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+MISTAKE_CHANCE = {"Easy": 0.5, "Medium": 0.2, "Hard": 0.0}  # Chance the bot plays a random move instead
+RPS_RANDOM_CHANCE = {"Easy": 1.0, "Medium": 0.5, "Hard": 0.0}  # Chance the Rock-Paper-Scissors bot ignores the history
+
+# Tic-Tac-Toe: cell i (0-8, row by row) is bit i
+TTT_FULL = (1 << 9) - 1
+TTT_LINES = tuple(sum(1 << cell for cell in line) for line in (
+    (0, 1, 2), (3, 4, 5), (6, 7, 8), (0, 3, 6), (1, 4, 7), (2, 5, 8), (0, 4, 8), (2, 4, 6)))
+
+# Connect Four: column c holds bits c*7 .. c*7+5 (bottom to top); the 7th bit of each column stays empty
+C4_WIDTH = 7
+C4_HEIGHT = 6
+C4_CELLS = C4_WIDTH * C4_HEIGHT
+_C4_COLUMN_BITS = C4_HEIGHT + 1
+_C4_BOTTOM = sum(1 << (c * _C4_COLUMN_BITS) for c in range(C4_WIDTH))
+_C4_BOARD = _C4_BOTTOM * ((1 << C4_HEIGHT) - 1)
+_C4_ORDER = (3, 2, 4, 1, 5, 0, 6)  # Center columns first: they take part in the most lines
+C4_WIN_SCORE = 1000                 # Minus the number of moves played, so quicker wins score higher
+C4_MAX_DEPTH = {"Easy": 2, "Medium": 5, "Hard": C4_CELLS}
+C4_TIME_BUDGET = {"Easy": 0.001, "Medium": 0.002, "Hard": 0.004}  # Seconds of search per bot move
+C4_BOOK_PLIES = 2                  # Opening positions searched ahead of time, with a longer budget
+C4_BOOK_TIME_BUDGET = 0.03
+C4_TABLE_SIZE = 500_000            # Transposition table entries kept before it is cleared
+_EXACT, _LOWER, _UPPER = 0, 1, 2
+_DEADLINE_CHECK_NODES = 64         # Nodes searched between clock checks
+
+# Guess the Number: secret range and number of guesses per level
+GUESS_RANGES = {"Easy": 20, "Medium": 50, "Hard": 100}
+GUESS_SPARE_TRIES = 2              # Guesses allowed beyond what a binary search needs
+
+# Rock-Paper-Scissors
+RPS_MOVES = ("rock", "paper", "scissors")
+RPS_EMOJI = {"rock": "🪨", "paper": "📄", "scissors": "✂️"}
+RPS_BEATS = {"rock": "scissors", "paper": "rock", "scissors": "paper"}
+RPS_COUNTER = {beaten: move for move, beaten in RPS_BEATS.items()}  # The move that beats each move
+RPS_HISTORY = 50                   # Learner moves remembered to predict the next one
+
+
+# --- Tic-Tac-Toe ---
+def ttt_winner(x, o):
+    """Returns ("X" or "O", line mask) for a finished game, ("draw", 0) for a full board, or (None, 0)."""
+    for line in TTT_LINES:
+        if x & line == line:
+            return "X", line
+        if o & line == line:
+            return "O", line
+    if x | o == TTT_FULL:
+        return "draw", 0
+    return None, 0
+
+
+class TicTacToeEngine:
+    """Perfect Tic-Tac-Toe, precomputed: every reachable position and the score of each of its moves."""
+
+    def __init__(self):
+        self._table = {}  # (player to move, opponent) -> (best score, ((cell, score), ...))
+        self._solve(0, 0)
+
+    def _solve(self, me, other):
+        key = (me, other)
+        if key in self._table:
+            return self._table[key][0]
+        filled = me | other
+        if filled == TTT_FULL:
+            self._table[key] = (0, ())
+            return 0
+        scores = []
+        for cell in range(9):
+            bit = 1 << cell
+            if filled & bit:
+                continue
+            mine = me | bit
+            if any(mine & line == line for line in TTT_LINES):
+                score = 10 - bin(filled).count("1")  # Win now; sooner is better
+            else:
+                score = -self._solve(other, mine)
+            scores.append((cell, score))
+        best = max(score for _, score in scores)
+        self._table[key] = (best, tuple(scores))
+        return best
+
+    def __len__(self):
+        return len(self._table)
+
+    def best_move(self, me, other, difficulty="Hard", rng=random):
+        """Picks a cell for the player whose stones are `me`; weaker levels sometimes play a random cell."""
+        best, scores = self._table[(me, other)]
+        if rng.random() < MISTAKE_CHANCE[difficulty]:
+            return rng.choice(scores)[0]
+        return rng.choice([cell for cell, score in scores if score == best])
+
+
+# --- Connect Four ---
+def c4_can_play(mask, column):
+    return not mask & (1 << (C4_HEIGHT - 1 + column * _C4_COLUMN_BITS))
+
+
+def c4_play(position, mask, column):
+    """Drops a stone for the player to move (`position` are their stones); returns the next (position, mask)."""
+    return position ^ mask, mask | (mask + (1 << (column * _C4_COLUMN_BITS)))
+
+
+def c4_aligned(stones):
+    """True if `stones` contain four in a row in any direction."""
+    for shift in (1, _C4_COLUMN_BITS, _C4_COLUMN_BITS - 1, _C4_COLUMN_BITS + 1):
+        pairs = stones & (stones >> shift)
+        if pairs & (pairs >> (2 * shift)):
+            return True
+    return False
+
+
+def c4_cells(position, mask, moves):
+    """Returns rows (top first) of 0 for empty, 1 for the first player's stones and 2 for the second's."""
+    first = position if moves % 2 == 0 else position ^ mask
+    return [[0 if not mask >> (c * _C4_COLUMN_BITS + row) & 1 else 1 if first >> (c * _C4_COLUMN_BITS + row) & 1 else 2
+             for c in range(C4_WIDTH)] for row in reversed(range(C4_HEIGHT))]
+
+
+def _c4_threats(stones, mask):
+    """Empty cells that would complete four in a row for `stones`."""
+    found = (stones << 1) & (stones << 2) & (stones << 3)  # Vertical: only on top of three
+    for shift in (_C4_COLUMN_BITS, _C4_COLUMN_BITS - 1, _C4_COLUMN_BITS + 1):
+        pair = (stones << shift) & (stones << 2 * shift)
+        found |= pair & (stones << 3 * shift)
+        found |= pair & (stones >> shift)
+        pair = (stones >> shift) & (stones >> 2 * shift)
+        found |= pair & (stones << shift)
+        found |= pair & (stones >> 3 * shift)
+    return found & (_C4_BOARD ^ mask)
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+class _Search:
+    """One bot move's alpha-beta search, against the engine's shared transposition table."""
+
+    def __init__(self, table, deadline):
+        self.table = table
+        self.deadline = deadline
+        self.nodes = 0
+        self.hits = 0
+
+    def negamax(self, position, mask, moves, depth, alpha, beta):
+        """Score of the position for the player to move, searched `depth` plies deep."""
+        self.nodes += 1
+        if self.nodes % _DEADLINE_CHECK_NODES == 0 and time.perf_counter() > self.deadline:
+            raise _OutOfTime
+        if moves == C4_CELLS:
+            return 0
+        playable = [c for c in _C4_ORDER if c4_can_play(mask, c)]
+        for column in playable:
+            if c4_aligned(position | ((mask + (1 << (column * _C4_COLUMN_BITS))) & _C4_BOARD & ~mask)):
+                return C4_WIN_SCORE - moves - 1
+        if depth == 0:
+            return self.evaluate(position, mask)
+
+        key = position + mask  # Unique per position
+        entry = self.table.get(key)
+        first = None
+        if entry is not None:
+            self.hits += 1
+            entry_depth, value, flag, first = entry
+            if entry_depth >= depth:
+                if flag == _EXACT:
+                    return value
+                if flag == _LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+        if first is not None:
+            playable.remove(first)
+            playable.insert(0, first)
+
+        original_alpha = alpha
+        best, best_column = -C4_WIN_SCORE, playable[0]
+        for column in playable:
+            child_position, child_mask = c4_play(position, mask, column)
+            score = -self.negamax(child_position, child_mask, moves + 1, depth - 1, -beta, -alpha)
+            if score > best:
+                best, best_column = score, column
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+        flag = _UPPER if best <= original_alpha else _LOWER if best >= beta else _EXACT
+        self.table[key] = (depth, best, flag, best_column)
+        return best
+
+    @staticmethod
+    def evaluate(position, mask):
+        """Heuristic for an undecided position: open threats, then stones in the center column."""
+        opponent = position ^ mask
+        threats = bin(_c4_threats(position, mask)).count("1") - bin(_c4_threats(opponent, mask)).count("1")
+        center = 0x7F << (3 * _C4_COLUMN_BITS)
+        return 4 * threats + bin(position & center).count("1") - bin(opponent & center).count("1")
+
+
+class ConnectFourEngine:
+    """Connect Four bot: iterative-deepening alpha-beta with a transposition table shared by all sessions.
+
+    The first `book_plies` plies are searched once, with a longer budget, when the engine is built.
+    """
+
+    def __init__(self, table_size=C4_TABLE_SIZE, book_plies=C4_BOOK_PLIES, book_time_budget=C4_BOOK_TIME_BUDGET):
+        self.table_size = table_size
+        self._table = {}
+        self._book = {}  # (position, mask) -> column
+        self._lock = threading.Lock()
+        self._stats = {"moves": 0, "book_moves": 0, "nodes": 0, "table_hits": 0, "max_depth": 0, "table_clears": 0}
+        self._build_book(0, 0, 0, book_plies, book_time_budget)
+
+    def _build_book(self, position, mask, moves, plies, time_budget):
+        if moves >= plies:
+            return
+        self._book[(position, mask)] = self._search(position, mask, moves, C4_CELLS, time_budget)[0]
+        for column in range(C4_WIDTH):
+            self._build_book(*c4_play(position, mask, column), moves + 1, plies, time_budget)
+
+    def _search(self, position, mask, moves, max_depth, time_budget):
+        """Returns (column, depth reached) from an iterative-deepening search that stops at the deadline."""
+        if len(self._table) > self.table_size:
+            self._table.clear()  # Cheaper than LRU bookkeeping on every node; it refills within a few moves
+            with self._lock:
+                self._stats["table_clears"] += 1
+        search = _Search(self._table, time.perf_counter() + time_budget)
+        playable = [c for c in _C4_ORDER if c4_can_play(mask, c)]
+        best_column, reached = playable[0], 0
+        for depth in range(1, min(max_depth, C4_CELLS - moves) + 1):
+            try:
+                alpha, column = -C4_WIN_SCORE - 1, playable[0]
+                for candidate in playable:
+                    child_position, child_mask = c4_play(position, mask, candidate)
+                    if c4_aligned(child_position ^ child_mask):
+                        score = C4_WIN_SCORE - moves - 1
+                    else:
+                        score = -search.negamax(child_position, child_mask, moves + 1, depth - 1, -C4_WIN_SCORE - 1, -alpha)
+                    if score > alpha:
+                        alpha, column = score, candidate
+            except _OutOfTime:
+                break
+            best_column, reached = column, depth
+            if abs(alpha) >= C4_WIN_SCORE - C4_CELLS:
+                break  # Forced win or loss found; deeper search won't change it
+            # Search the best move first next time
+            playable.remove(column)
+            playable.insert(0, column)
+        with self._lock:
+            self._stats["nodes"] += search.nodes
+            self._stats["table_hits"] += search.hits
+            self._stats["max_depth"] = max(self._stats["max_depth"], reached)
+        return best_column, reached
+
+    def best_move(self, position, mask, moves, difficulty="Hard", rng=random):
+        """Picks a column for the player to move (`position` are their stones)."""
+        playable = [c for c in range(C4_WIDTH) if c4_can_play(mask, c)]
+        with self._lock:
+            self._stats["moves"] += 1
+        if rng.random() < MISTAKE_CHANCE[difficulty]:
+            return rng.choice(playable)
+        if difficulty == "Hard" and (position, mask) in self._book:
+            with self._lock:
+                self._stats["book_moves"] += 1
+            return self._book[(position, mask)]
+        return self._search(position, mask, moves, C4_MAX_DEPTH[difficulty], C4_TIME_BUDGET[difficulty])[0]
+
+    def stats(self):
+        """Returns search counters and the transposition table size."""
+        with self._lock:
+            return dict(self._stats, table_entries=len(self._table), book_positions=len(self._book))
+
+
+def format_game_stats(stats):
+    """Formats Connect Four engine stats for display."""
+    return (f"Games: {stats['moves']} bot moves ({stats['book_moves']} from the opening book) · "
+            f"{stats['nodes']} nodes searched, max depth {stats['max_depth']} · {stats['table_entries']} positions cached")
+
+
+# --- Guess the Number ---
+def guess_limit(max_number):
+    """Guesses allowed for a secret between 1 and `max_number`."""
+    return math.ceil(math.log2(max_number)) + GUESS_SPARE_TRIES
+
+
+def guess_hint(secret, guess):
+    """Returns "higher", "lower" or "correct" for a guess."""
+    if guess < secret:
+        return "higher"
+    if guess > secret:
+        return "lower"
+    return "correct"
+
+
+# --- Rock-Paper-Scissors ---
+def rps_result(move, other):
+    """Returns "win", "lose" or "draw" for `move` against `other`."""
+    if move == other:
+        return "draw"
+    return "win" if RPS_BEATS[move] == other else "lose"
+
+
+def rps_bot_move(history, difficulty="Hard", rng=random):
+    """Picks the bot's move from the learner's earlier moves (oldest first).
+
+    Hard predicts the learner's next move from what followed their last two moves before, Medium plays
+    against their favourite move half of the time and at random otherwise, and Easy always plays at random.
+    """
+    if not history or rng.random() < RPS_RANDOM_CHANCE[difficulty]:
+        return rng.choice(RPS_MOVES)
+    predicted = None
+    if difficulty == "Hard" and len(history) > 2:
+        recent = tuple(history[-2:])
+        followers = Counter(history[i + 2] for i in range(len(history) - 2) if tuple(history[i:i + 2]) == recent)
+        if followers:
+            predicted = followers.most_common(1)[0][0]
+    if predicted is None:
+        predicted = Counter(history[-10:]).most_common(1)[0][0]
+    return RPS_COUNTER[predicted]
@@ -0,0 +1,195 @@
+import ast
+import logging
+import operator
+import re
+import threading
+
+# --- Intent Router ---
+# Classifies each chat/study prompt with cheap local rules before any model call.
+# Small talk and plain arithmetic are answered locally, short factual questions go
+# to the small model, and everything else (explanations, stories, follow-ups that
+# need reasoning) to the large one.
+
+DEFAULT_SMALL_MODEL = "llama3-8b-8192"
+DEFAULT_LARGE_MODEL = "llama3-70b-8192"
+DEFAULT_MAX_SMALL_WORDS = 12  # Longer prompts always go to the large model
+MAX_EXPRESSION_LENGTH = 64    # Characters of arithmetic we are willing to parse
+MAX_EXPONENT = 12             # Keeps "9 ** 999999" from hanging the script
+MAX_MAGNITUDE = 10 ** 15      # Larger intermediate results are left to the model
+
+logger = logging.getLogger(__name__)
+
+_SMALL_TALK = (
+    (re.compile(r"(hi|hello|hey|hiya|howdy|yo|good (morning|afternoon|evening))( there)?( olive| bot)?"),
+     "Hi there, friend! 👋 What would you like to learn about today?"),
+    (re.compile(r"(thanks|thank you|thank u|thx|ty)( so much| a lot| very much)?( olive| bot)?"),
+     "You're very welcome! 😊 Ask me anything else you're curious about."),
+    (re.compile(r"(bye|goodbye|see you|see ya|good night)( later| soon)?( olive| bot)?"),
+     "Bye for now! 👋 Come back soon to learn something new."),
+    (re.compile(r"(ok|okay|cool|nice|great|awesome|yay|wow)"),
+     "Yay! 🎉 What shall we explore next?"),
+    (re.compile(r"how are you( doing| today)?( olive| bot)?"),
+     "I'm doing great, thanks for asking! 🫒 How can I help you learn today?"),
+)
+_SMALL_TALK_STRIP_RE = re.compile(r"[\s!.,?😊🙂👋]+$")
+
+_ARITHMETIC_PREFIX_RE = re.compile(r"^(what('s| is)|whats|calculate|compute|solve|how much is|tell me)\s+", re.IGNORECASE)
+_ARITHMETIC_WORDS = (
+    (re.compile(r"\b(times|multiplied by)\b|[x×✕]"), "*"),
+    (re.compile(r"\b(divided by|over)\b|÷"), "/"),
+    (re.compile(r"\bplus\b"), "+"),
+    (re.compile(r"\bminus\b|−"), "-"),
+    (re.compile(r"\bto the power of\b|\^"), "**"),
+    (re.compile(r"\bsquared\b"), "**2"),
+)
+_ARITHMETIC_CHARS_RE = re.compile(r"[\d\s.+\-*/%()]+")
+_OPERATOR_RE = re.compile(r"\d\s*(\*\*|[+\-*/%])\s*\(?\s*-?\d")
+
+# Prompts that need explanation or reasoning, so the small model is not enough
+_COMPLEX_RE = re.compile(
+    r"\b(why|how|explain|describe|compare|difference|differences|story|poem|essay|write|example|examples|"
+    r"step|steps|prove|summar\w*|understand|help|teach|reason|because|imagine|plan|code|program)\b",
+    re.IGNORECASE,
+)
+
+_OPERATORS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+    ast.USub: operator.neg, ast.UAdd: operator.pos,
+}
+
+
+class UnsafeExpression(ValueError):
+    """The text is not plain arithmetic the router is willing to evaluate."""
+
+
+def _evaluate(node):
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_evaluate(node.operand))
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        left, right = _evaluate(node.left), _evaluate(node.right)
+        if isinstance(node.op, ast.Pow) and abs(right) > MAX_EXPONENT:
+            raise UnsafeExpression("Exponent too large")
+        try:
+            value = _OPERATORS[type(node.op)](left, right)
+        except ArithmeticError as error:  # Division by zero, float overflow
+            raise UnsafeExpression(str(error))
+        if isinstance(value, complex) or abs(value) > MAX_MAGNITUDE:
+            raise UnsafeExpression("Result out of range")
+        return value
+    raise UnsafeExpression(f"Unsupported syntax: {type(node).__name__}")
+
+
+def evaluate_arithmetic(expression):
+    """Evaluates numbers, parentheses and + - * / // % ** only; anything else raises UnsafeExpression."""
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise UnsafeExpression("Expression too long")
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError:
+        raise UnsafeExpression("Not an expression")
+    return _evaluate(tree.body)
+
+
+def extract_arithmetic(prompt):
+    """Returns the arithmetic expression a prompt like "what is 7 x 8?" asks about, or None."""
+    text = _ARITHMETIC_PREFIX_RE.sub("", prompt.strip().lower()).rstrip(" ?!.=")
+    for pattern, symbol in _ARITHMETIC_WORDS:
+        text = pattern.sub(symbol, text)
+    if not text or not _ARITHMETIC_CHARS_RE.fullmatch(text) or not _OPERATOR_RE.search(text):
+        return None
+    return " ".join(text.split())
+
+
+def format_number(value):
+    """Formats a result to six significant digits without float noise (56, 2.5, 0.333333).
+
+    Returns None for results that would need an exponent (0.00001, 1234567.5), which are left to the model.
+    """
+    if isinstance(value, float):
+        if value.is_integer():
+            return str(int(value))
+        text = f"{value:.6g}"
+        return None if "e" in text else text
+    return str(value)
+
+
+class Route:
+    """Where a prompt goes: tier is "local", "small" or "large"; local routes carry the answer."""
+
+    def __init__(self, tier, intent, model=None, answer=None):
+        self.tier = tier
+        self.intent = intent
+        self.model = model
+        self.answer = answer
+
+
+class IntentRouter:
+    """Rule-based prompt classifier, shared by all sessions."""
+
+    def __init__(self, small_model=DEFAULT_SMALL_MODEL, large_model=DEFAULT_LARGE_MODEL,
+                 max_small_words=DEFAULT_MAX_SMALL_WORDS, enabled=True):
+        self.small_model = small_model
+        self.large_model = large_model
+        self.max_small_words = max_small_words
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._decisions = {"local": 0, "small": 0, "large": 0}
+        self._latency = {"local": 0.0, "small": 0.0, "large": 0.0}  # Total answer seconds per tier
+
+    def classify(self, prompt):
+        """Returns the Route for a prompt."""
+        if not self.enabled:
+            return Route("large", "disabled", model=self.large_model)
+        text = " ".join(prompt.lower().split())
+        small_talk = _SMALL_TALK_STRIP_RE.sub("", text)
+        for pattern, answer in _SMALL_TALK:
+            if pattern.fullmatch(small_talk):
+                return Route("local", "small_talk", answer=answer)
+        expression = extract_arithmetic(text)
+        if expression is not None:
+            try:
+                value = evaluate_arithmetic(expression)
+            except UnsafeExpression:
+                value = None  # Too big or odd for us; the model can explain it
+            number = None if value is None else format_number(value)
+            if number is not None:
+                shown = expression.replace("**", "^").replace("*", "×").replace("/", "÷")
+                return Route("local", "arithmetic", answer=f"{shown} = **{number}** 🎉")
+        if len(text.split()) <= self.max_small_words and not _COMPLEX_RE.search(text):
+            return Route("small", "short_question", model=self.small_model)
+        return Route("large", "open_question", model=self.large_model)
+
+    def route(self, prompt):
+        """Classifies a prompt, counts and logs the decision."""
+        route = self.classify(prompt)
+        with self._lock:
+            self._decisions[route.tier] += 1
+        logger.info("Routed prompt (%d chars) to %s tier: %s%s", len(prompt), route.tier, route.intent,
+                    f" via {route.model}" if route.model else "")
+        return route
+
+    def record_latency(self, route, seconds):
+        """Adds the time it took to answer a routed prompt."""
+        with self._lock:
+            self._latency[route.tier] += seconds
+        logger.info("Answered %s tier (%s) in %.0f ms", route.tier, route.intent, seconds * 1000)
+
+    def stats(self):
+        """Returns decisions and mean answer time per tier, and the share answered without the large model."""
+        with self._lock:
+            decisions = dict(self._decisions)
+            latency = dict(self._latency)
+        total = sum(decisions.values())
+        stats = {f"{tier}_routed": count for tier, count in decisions.items()}
+        stats.update({f"{tier}_mean_seconds": latency[tier] / count if count else 0.0 for tier, count in decisions.items()})
+        stats["offload_ratio"] = (decisions["local"] + decisions["small"]) / total if total else 0.0
+        return stats
+
+
+def format_router_stats(stats):
+    """Formats router stats for display."""
+    return (f"Router: {stats['local_routed']} local, {stats['small_routed']} small, {stats['large_routed']} large · "
+            f"{stats['offload_ratio']:.0%} kept off the large model")
@@ -0,0 +1,381 @@
+import argparse
+import hashlib
+import json
+import logging
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+from learner_state import LEARNER_STATE_FIELDS, LearnerStateStore, create_learner_state_backend
+from storage import DEFAULT_SQLITE_PATH, create_conversation_store
+
+# --- Learner Archives ---
+# Export and import of learners' full data (learner state with subjects, progress and
+# reminders, plus every chat and study conversation) as a compressed JSONL stream, so
+# a learner can be saved before "Change Friend", moved to another server, or a whole
+# class exported in one go. One JSON record per line:
+#
+#   header        {"type": "header", "format": ARCHIVE_FORMAT, "version": 1, "created_at": ...}
+#   learner       {"type": "learner", "user_id": ..., "state": <learner state document>}
+#   conversation  {"type": "conversation", "subject_id": ..., "kind": "chat"|"study"}
+#   message       {"type": "message", "id": ..., "role": ..., "content": ...}      (oldest first)
+#   end_conversation {"type": "end_conversation", "messages": n}
+#   end_learner   {"type": "end_learner", "user_id": ..., "messages": total, "sha256": ...}
+#   footer        {"type": "footer", "learners": ..., "messages": ...}
+#
+# Counts are written after the records they count, since a conversation can change
+# while it is exported. The checksum covers the learner's message lines. Export is a generator of compressed
+# chunks that pages through the conversation store, and import decompresses, parses
+# and appends in batches, so memory stays flat whatever the size of the history. Import
+# reads the archive twice, verifying all of it before any learner is cleared or written.
+# Archived turns are exported with the live ones; their summaries are not, the
+# compaction job recreates them.
+
+ARCHIVE_FORMAT = "olive-learner-archive"
+ARCHIVE_VERSION = 1                 # Bumped on incompatible schema changes; newer archives are refused
+COMPRESSIONS = ("gzip", "zstd")
+DEFAULT_BATCH_SIZE = 500            # Messages read from, or appended to, the conversation store at a time
+CHUNK_BYTES = 64 * 1024             # Uncompressed bytes gathered before compressing, and read size on import
+KINDS = ("chat", "study")
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveError(Exception):
+    """The archive is malformed, truncated, corrupted, of an unknown version, or would overwrite a learner."""
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ArchiveError("zstd archives need the optional zstandard package (pip install zstandard)") from None
+    return zstandard
+
+
+def _compressor(compression):
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    if compression == "zstd":
+        return _zstandard().ZstdCompressor(level=3).compressobj()
+    raise ArchiveError(f"Unknown compression {compression!r}, expected one of {', '.join(COMPRESSIONS)}")
+
+
+def _decompressor(magic):
+    if magic.startswith(_GZIP_MAGIC):
+        return zlib.decompressobj(31)
+    if magic.startswith(_ZSTD_MAGIC):
+        return _zstandard().ZstdDecompressor().decompressobj()
+    raise ArchiveError("Not a learner archive (expected gzip or zstd data)")
+
+
+def _record(**fields):
+    return json.dumps(fields, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+
+
+def learner_document(user_id, conversation_store, learner_state_store):
+    """Returns a learner's state document, or one built from the conversation store for learners saved before
+    learner state existed; None for unknown learners."""
+    document = learner_state_store.get(user_id, max_age=0)[1]
+    if document is not None:
+        return document
+    subjects = conversation_store.load_subjects(user_id)
+    if not subjects:
+        return None
+    return {"user_subjects": subjects, "learning_progress": conversation_store.load_progress(user_id),
+            "user_reminders": conversation_store.load_reminders(user_id), "user_avatar": "😀", "quiz_subject_id": "general"}
+
+
+def iter_archive_records(user_ids, conversation_store, learner_state_store, batch_size=DEFAULT_BATCH_SIZE):
+    """Yields the archive's JSONL lines (bytes) for the given learners; unknown learners are skipped."""
+    yield _record(type="header", format=ARCHIVE_FORMAT, version=ARCHIVE_VERSION, created_at=time.time())
+    learners = total = 0
+    for user_id in user_ids:
+        document = learner_document(user_id, conversation_store, learner_state_store)
+        if document is None:
+            logger.warning("No data for learner %s, skipped", user_id)
+            continue
+        yield _record(type="learner", user_id=user_id, state=document)
+        digest, count = hashlib.sha256(), 0
+        subject_ids = dict.fromkeys(["general"] + [subject["id"] for subject in document["user_subjects"]])
+        for subject_id in subject_ids:
+            for kind in KINDS:
+                if not conversation_store.count_messages(user_id, subject_id, kind):
+                    continue
+                yield _record(type="conversation", subject_id=subject_id, kind=kind)
+                messages = 0
+                for message in conversation_store.iter_messages(user_id, subject_id, kind, batch_size):
+                    line = _record(type="message", id=message["id"], role=message["role"], content=message["content"])
+                    digest.update(line)
+                    messages += 1
+                    yield line
+                yield _record(type="end_conversation", messages=messages)
+                count += messages
+        yield _record(type="end_learner", user_id=user_id, messages=count, sha256=digest.hexdigest())
+        learners += 1
+        total += count
+    yield _record(type="footer", learners=learners, messages=total)
+
+
+def iter_archive(user_ids, conversation_store, learner_state_store, compression="gzip", batch_size=DEFAULT_BATCH_SIZE):
+    """Yields the compressed archive of the given learners in chunks, for streaming to a file or a response."""
+    compressor = _compressor(compression)
+    pending, size = [], 0
+    for line in iter_archive_records(user_ids, conversation_store, learner_state_store, batch_size):
+        pending.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            chunk = compressor.compress(b"".join(pending))
+            pending, size = [], 0
+            if chunk:
+                yield chunk
+    yield compressor.compress(b"".join(pending)) + compressor.flush()
+
+
+def write_archive(fileobj, user_ids, conversation_store, learner_state_store, compression="gzip"):
+    """Writes the archive of the given learners to a binary file; returns the number of bytes written."""
+    written = 0
+    for chunk in iter_archive(user_ids, conversation_store, learner_state_store, compression):
+        fileobj.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def _iter_lines(fileobj):
+    magic = fileobj.read(4)
+    decompressor = _decompressor(magic)
+    tail = b""
+    data = magic
+    while data:
+        try:
+            text = tail + decompressor.decompress(data)
+        except Exception as error:  # zlib.error or zstandard.ZstdError
+            raise ArchiveError(f"Corrupted archive: {error}") from None
+        lines = text.split(b"\n")
+        tail = lines.pop()
+        yield from lines
+        data = fileobj.read(CHUNK_BYTES)
+    if not getattr(decompressor, "eof", True):
+        raise ArchiveError("The archive is truncated")
+    if tail:
+        yield tail
+
+
+def _parse(line, number):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        raise ArchiveError(f"Line {number} is not valid JSON") from None
+    if not isinstance(record, dict) or not isinstance(record.get("type"), str):
+        raise ArchiveError(f"Line {number} is not an archive record")
+    return record
+
+
+def _require(record, number, **fields):
+    for field, expected in fields.items():
+        if not isinstance(record.get(field), expected):
+            raise ArchiveError(f"Line {number}: {record['type']} record without a valid {field!r}")
+
+
+def iter_archive_events(fileobj):
+    """Parses and checks an archive, yielding ("learner", user_id, state), ("conversation", subject_id, kind),
+    ("message", message) and ("end_learner", user_id, count) events in order.
+
+    Raises ArchiveError as soon as something is wrong: an unknown format or version, a record out of place, a
+    conversation or learner whose message count or checksum doesn't match, or a missing footer (truncation).
+    """
+    lines = _iter_lines(fileobj)
+    header = _parse(next(lines, b"{}"), 1)
+    if header.get("type") != "header" or header.get("format") != ARCHIVE_FORMAT:
+        raise ArchiveError("Not a learner archive (no header)")
+    if not isinstance(header.get("version"), int) or header["version"] > ARCHIVE_VERSION:
+        raise ArchiveError(f"Archive version {header.get('version')} is newer than this app supports ({ARCHIVE_VERSION})")
+    learner = None     # user_id of the learner being read
+    in_conversation = None  # Messages read so far in the current conversation, None between conversations
+    digest = count = learners = total = 0
+    footer = None
+    for number, line in enumerate(lines, 2):
+        if footer is not None:
+            raise ArchiveError(f"Line {number}: data after the footer")
+        record = _parse(line, number)
+        kind = record["type"]
+        if kind == "message":
+            if in_conversation is None:
+                raise ArchiveError(f"Line {number}: message outside a conversation")
+            _require(record, number, id=str, role=str, content=str)
+            digest.update(line + b"\n")
+            in_conversation += 1
+            count += 1
+            yield ("message", {"id": record["id"], "role": record["role"], "content": record["content"]})
+            continue
+        if kind == "end_conversation":
+            if in_conversation is None or record.get("messages") != in_conversation:
+                raise ArchiveError(f"Line {number}: conversation message count mismatch, the archive is corrupted")
+            in_conversation = None
+            continue
+        if in_conversation is not None:
+            raise ArchiveError(f"Line {number}: conversation has no end record")
+        if kind == "learner":
+            if learner is not None:
+                raise ArchiveError(f"Line {number}: learner {learner} has no end record")
+            _require(record, number, user_id=str, state=dict)
+            missing = [field for field in LEARNER_STATE_FIELDS if field not in record["state"]]
+            if missing:
+                raise ArchiveError(f"Line {number}: learner state without {', '.join(missing)}")
+            learner, digest, count = record["user_id"], hashlib.sha256(), 0
+            yield ("learner", learner, {field: record["state"][field] for field in LEARNER_STATE_FIELDS})
+        elif kind == "conversation":
+            _require(record, number, subject_id=str, kind=str)
+            if learner is None or record["kind"] not in KINDS:
+                raise ArchiveError(f"Line {number}: invalid conversation record")
+            in_conversation = 0
+            yield ("conversation", record["subject_id"], record["kind"])
+        elif kind == "end_learner":
+            if learner is None or record.get("user_id") != learner:
+                raise ArchiveError(f"Line {number}: end record without its learner")
+            if record.get("messages") != count or record.get("sha256") != digest.hexdigest():
+                raise ArchiveError(f"Learner {learner}: message count or checksum mismatch, the archive is corrupted")
+            yield ("end_learner", learner, count)
+            learner = None
+            learners += 1
+            total += count
+        elif kind == "footer":
+            if learner is not None:
+                raise ArchiveError(f"Line {number}: learner {learner} has no end record")
+            footer = record
+        else:
+            raise ArchiveError(f"Line {number}: unknown record type {kind!r}")
+    if footer is None:
+        raise ArchiveError("The archive is truncated (no footer)")
+    if footer.get("learners") != learners or footer.get("messages") != total:
+        raise ArchiveError("Learner or message totals don't match the footer")
+
+
+def verify_archive(fileobj):
+    """Checks a whole archive without importing it; returns {"learners", "messages"}."""
+    learners = messages = 0
+    for event in iter_archive_events(fileobj):
+        if event[0] == "end_learner":
+            learners += 1
+            messages += event[2]
+    return {"learners": learners, "messages": messages}
+
+
+def import_archive(fileobj, conversation_store, learner_state_store, replace=False, user_id=None,
+                   batch_size=DEFAULT_BATCH_SIZE):
+    """Loads the learners of an archive into the stores; returns {"learners", "messages", "user_ids"}.
+
+    Existing learners are refused unless `replace` is set, which clears their data first. `user_id` imports a
+    single-learner archive under another id (e.g. the current session's). The archive is verified in full
+    before anything is written or cleared; streams that can't be read twice are spooled to a temporary file
+    first. A learner whose writes fail halfway is cleared again, and learners imported before it are kept.
+    """
+    if not fileobj.seekable():
+        with tempfile.TemporaryFile() as spool:
+            shutil.copyfileobj(fileobj, spool, CHUNK_BYTES)
+            spool.seek(0)
+            return import_archive(spool, conversation_store, learner_state_store, replace, user_id, batch_size)
+    start = fileobj.tell()
+    if verify_archive(fileobj)["learners"] > 1 and user_id is not None:
+        raise ArchiveError("The archive holds several learners, it can't be imported under one id")
+    fileobj.seek(start)
+    imported = []
+    messages = 0
+    target = state = subject_id = kind = None
+    batch = []
+
+    def flush_batch():
+        if batch:
+            conversation_store.append_messages(target, subject_id, batch, kind)
+            conversation_store.flush()  # Bounds the write-behind backlog to one batch
+            batch.clear()
+
+    try:
+        for event in iter_archive_events(fileobj):
+            if event[0] == "message":
+                batch.append(event[1])
+                if len(batch) >= batch_size:
+                    flush_batch()
+            elif event[0] == "conversation":
+                flush_batch()
+                subject_id, kind = event[1], event[2]
+            elif event[0] == "learner":
+                if user_id is not None and imported:
+                    raise ArchiveError("The archive holds several learners, it can't be imported under one id")
+                learner = user_id or event[1]
+                if learner_document(learner, conversation_store, learner_state_store) is not None:
+                    if not replace:
+                        raise ArchiveError(f"Learner {learner} already exists (import with replace to overwrite)")
+                    conversation_store.clear_learning_data(learner)
+                target, state = learner, event[2]
+            else:  # end_learner: the learner's messages checked out, so its state can be written
+                flush_batch()
+                version, current = learner_state_store.get(target, max_age=0)
+                learner_state_store.save(target, version, current or state, state)
+                imported.append(target)
+                messages += event[2]
+                target = None
+    except BaseException:
+        if target is not None:
+            logger.warning("Import of learner %s failed, clearing its partial data", target)
+            batch.clear()
+            conversation_store.clear_learning_data(target)
+        raise
+    return {"learners": len(imported), "messages": messages, "user_ids": imported}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exports or imports learners' data as compressed JSONL archives.")
+    parser.add_argument("--backend", default="sqlite", choices=("sqlite", "redis"))
+    parser.add_argument("--path", default=DEFAULT_SQLITE_PATH, help="SQLite database file")
+    parser.add_argument("--url", help="Redis url")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Write one archive with the given learners (e.g. a whole class)")
+    export.add_argument("learners", nargs="*", help="Learner ids")
+    export.add_argument("--roster", help="File with one learner id per line")
+    export.add_argument("-o", "--output", required=True, help="Archive file to write ('-' for stdout)")
+    export.add_argument("--compression", default="gzip", choices=COMPRESSIONS)
+    load = commands.add_parser("import", help="Load the learners of an archive")
+    load.add_argument("archive", help="Archive file to read ('-' for stdin)")
+    load.add_argument("--replace", action="store_true", help="Overwrite learners that already exist")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    conversation_store = create_conversation_store(args.backend, args.path, args.url, shared=True)
+    learner_state_store = LearnerStateStore(create_learner_state_backend(args.backend, args.path, args.url), cache_ttl=0)
+    started_at = time.perf_counter()
+    try:
+        if args.command == "export":
+            user_ids = list(args.learners)
+            if args.roster:
+                with open(args.roster, encoding="utf-8") as f:
+                    user_ids += [line.strip() for line in f if line.strip()]
+            if not user_ids:
+                parser.error("export needs learner ids or a --roster")
+            if args.output == "-":
+                written = write_archive(sys.stdout.buffer, user_ids, conversation_store, learner_state_store, args.compression)
+            else:
+                with open(args.output, "wb") as f:
+                    written = write_archive(f, user_ids, conversation_store, learner_state_store, args.compression)
+            report = {"requested": len(user_ids), "bytes": written}
+        else:
+            if args.archive == "-":
+                report = import_archive(sys.stdin.buffer, conversation_store, learner_state_store, args.replace)
+            else:
+                with open(args.archive, "rb") as f:
+                    report = import_archive(f, conversation_store, learner_state_store, args.replace)
+            del report["user_ids"]
+    except ArchiveError as error:
+        conversation_store.close()
+        sys.exit(f"error: {error}")
+    conversation_store.close()
+    report["seconds"] = time.perf_counter() - started_at
+    for key, value in report.items():
+        print(f"{key:>10}: {value:.2f}" if isinstance(value, float) else f"{key:>10}: {value}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import copy
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from storage import REDIS_KEY_PREFIX, connect_redis
+
+# --- Learner State ---
+# The per-learner part of the session that must survive a worker restart or a move
+# to another worker: subjects, progress, reminders, avatar and quiz subject. The
+# section and selected subject stay in each tab's session state, so two tabs of one
+# learner don't switch each other's view. It is stored as one versioned JSON document in a shared backend (SQLite on
+# shared disk, or any Redis-protocol server). Writes are optimistic: they only succeed
+# against the version they were based on, and on a conflict this session's changes are
+# merged onto the newer document and retried. Reads go through a small process-local
+# cache. Conversation histories live in the conversation store (storage.py).
+
+LEARNER_STATE_FIELDS = ("user_subjects", "learning_progress", "user_reminders", "user_avatar", "quiz_subject_id")
+DEFAULT_CACHE_TTL = 2.0         # Seconds a cached document is trusted before re-reading the backend
+DEFAULT_MAX_CACHED = 10000      # Learner documents kept in the local cache
+MAX_WRITE_ATTEMPTS = 5          # Merge-and-retry rounds before a write gives up
+
+
+class VersionConflict(Exception):
+    """The stored document changed since the version a write was based on."""
+
+
+class LearnerStateBackend:
+    """Interface of the shared backends. Documents are JSON-serializable dicts."""
+
+    def load(self, user_id):
+        """Returns (version, document); version 0 and None when the learner has no document yet."""
+        raise NotImplementedError
+
+    def compare_and_set(self, user_id, expected_version, document):
+        """Stores the document if the current version is `expected_version`; returns the new version."""
+        raise NotImplementedError
+
+
+class MemoryLearnerStateBackend(LearnerStateBackend):
+    """Process-local backend, for development and single-worker deployments."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._documents = {}  # user_id -> (version, JSON text)
+
+    def load(self, user_id):
+        with self._lock:
+            version, data = self._documents.get(user_id, (0, None))
+        return version, json.loads(data) if data is not None else None
+
+    def compare_and_set(self, user_id, expected_version, document):
+        data = json.dumps(document)
+        with self._lock:
+            version = self._documents.get(user_id, (0, None))[0]
+            if version != expected_version:
+                raise VersionConflict(f"Learner state is at version {version}, not {expected_version}")
+            self._documents[user_id] = (version + 1, data)
+            return version + 1
+
+
+class SQLiteLearnerStateBackend(LearnerStateBackend):
+    """Backend in a SQLite database, which several workers can share on one disk (WAL mode)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS learner_state ("
+            "user_id TEXT PRIMARY KEY, version INTEGER NOT NULL, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        connection.commit()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def load(self, user_id):
+        row = self._connection().execute(
+            "SELECT version, data FROM learner_state WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else (0, None)
+
+    def compare_and_set(self, user_id, expected_version, document):
+        data = json.dumps(document)
+        connection = self._connection()
+        with connection:
+            if expected_version == 0:
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO learner_state (user_id, version, data, updated_at) VALUES (?, 1, ?, ?)",
+                    (user_id, data, time.time()),
+                )
+            else:
+                cursor = connection.execute(
+                    "UPDATE learner_state SET version = version + 1, data = ?, updated_at = ? "
+                    "WHERE user_id = ? AND version = ?",
+                    (data, time.time(), user_id, expected_version),
+                )
+        if cursor.rowcount != 1:
+            raise VersionConflict(f"Learner state changed since version {expected_version}")
+        return expected_version + 1
+
+
+# Compare-and-set runs as one script on the server, so it is atomic without WATCH round trips
+_REDIS_COMPARE_AND_SET = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if current ~= tonumber(ARGV[1]) then
+    return -1
+end
+redis.call('HSET', KEYS[1], 'version', current + 1, 'data', ARGV[2])
+return current + 1
+"""
+
+
+class RedisLearnerStateBackend(LearnerStateBackend):
+    """Backend on a Redis-protocol server (Redis, Valkey, KeyDB, ...); needs the 'redis' package."""
+
+    def __init__(self, url):
+        self._client = connect_redis(url)
+        self._compare_and_set = self._client.register_script(_REDIS_COMPARE_AND_SET)
+
+    def _key(self, user_id):
+        return f"{REDIS_KEY_PREFIX}:{user_id}:state"
+
+    def load(self, user_id):
+        version, data = self._client.hmget(self._key(user_id), "version", "data")
+        return (int(version), json.loads(data)) if data is not None else (0, None)
+
+    def compare_and_set(self, user_id, expected_version, document):
+        version = self._compare_and_set(keys=[self._key(user_id)], args=[expected_version, json.dumps(document)])
+        if version < 0:
+            raise VersionConflict(f"Learner state changed since version {expected_version}")
+        return version
+
+
+def create_learner_state_backend(backend="sqlite", path=None, url=None):
+    """Builds the learner state backend matching the [storage] settings ("sqlite", "memory" or "redis")."""
+    if backend == "sqlite":
+        return SQLiteLearnerStateBackend(path)
+    if backend == "memory":
+        return MemoryLearnerStateBackend()
+    if backend == "redis":
+        return RedisLearnerStateBackend(url)
+    raise ValueError(f"Unknown storage backend: {backend!r}")
+
+
+def _merge_list(base, ours, theirs):
+    """Merges lists of {"id": ...} records: their version, plus our additions and edits."""
+    base_by_id = {item["id"]: item for item in base}
+    ours_by_id = {item["id"]: item for item in ours}
+    removed = set(base_by_id) - set(ours_by_id)
+    merged = []
+    for item in theirs:
+        if item["id"] in removed:
+            continue
+        ours_item = ours_by_id.get(item["id"])
+        changed_by_us = ours_item is not None and ours_item != base_by_id.get(item["id"])
+        merged.append(ours_item if changed_by_us else item)
+    seen = {item["id"] for item in merged}
+    merged.extend(item for item in ours if item["id"] not in base_by_id and item["id"] not in seen)
+    return merged
+
+
+def merge_learner_state(base, ours, theirs):
+    """Applies the changes between `base` and `ours` on top of `theirs`, field by field."""
+    merged = dict(theirs)
+    for field, value in ours.items():
+        base_value = base.get(field)
+        if value == base_value:
+            continue  # Unchanged here, so theirs wins
+        their_value = theirs.get(field)
+        if field == "learning_progress" and isinstance(value, dict) and isinstance(their_value, dict):
+            # Counters: keep both sides' increments
+            merged[field] = dict(their_value, **{
+                key: their_value.get(key, 0) + count - (base_value or {}).get(key, 0)
+                for key, count in value.items() if isinstance(count, (int, float))
+            })
+        elif isinstance(value, list) and isinstance(their_value, list) and all(
+                isinstance(item, dict) and "id" in item for item in value + their_value + (base_value or [])):
+            merged[field] = _merge_list(base_value or [], value, their_value)
+        else:
+            merged[field] = value  # Last writer wins for plain values (avatar, quiz subject)
+    return merged
+
+
+class LearnerStateStore:
+    """Read-through cache in front of a backend, with optimistic, merging writes."""
+
+    def __init__(self, backend, cache_ttl=DEFAULT_CACHE_TTL, max_cached=DEFAULT_MAX_CACHED):
+        self.backend = backend
+        self.cache_ttl = cache_ttl
+        self.max_cached = max_cached
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # user_id -> (version, JSON text, fetched_at), least recently used first
+        self._counters = {"hits": 0, "misses": 0, "writes": 0, "conflicts": 0}
+
+    def _remember(self, user_id, version, document):
+        with self._lock:
+            self._cache[user_id] = (version, json.dumps(document), time.monotonic())
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def get(self, user_id, max_age=None):
+        """Returns (version, document), from the local cache if it is fresh enough.
+
+        Every call returns a new copy, so callers may mutate it.
+        """
+        max_age = self.cache_ttl if max_age is None else max_age
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached is not None and time.monotonic() - cached[2] <= max_age:
+                self._counters["hits"] += 1
+                self._cache.move_to_end(user_id)
+                return cached[0], json.loads(cached[1])
+            self._counters["misses"] += 1
+        version, document = self.backend.load(user_id)
+        if document is not None:
+            self._remember(user_id, version, document)
+        return version, document
+
+    def save(self, user_id, base_version, base, ours):
+        """Writes `ours`, which was derived from `base` at `base_version`; returns (version, stored document).
+
+        If another worker wrote first, our changes are merged onto its document and the write is retried.
+        """
+        document = ours
+        version = base_version
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            try:
+                version = self.backend.compare_and_set(user_id, version, document)
+            except VersionConflict:
+                with self._lock:
+                    self._counters["conflicts"] += 1
+                version, theirs = self.get(user_id, max_age=0)
+                document = merge_learner_state(base or {}, ours, theirs or {})
+                continue
+            with self._lock:
+                self._counters["writes"] += 1
+            self._remember(user_id, version, document)
+            return version, copy.deepcopy(document)
+        raise VersionConflict(f"Could not save learner state after {MAX_WRITE_ATTEMPTS} attempts")
+
+    def stats(self):
+        """Returns cache hit/miss, write and conflict counters."""
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return dict(self._counters, cached=len(self._cache),
+                        hit_rate=self._counters["hits"] / lookups if lookups else 0.0)
+
+
+def format_learner_state_stats(stats):
+    """Formats learner state stats for display."""
+    return (f"Learner state: {stats['hits']} cached / {stats['misses']} backend reads ({stats['hit_rate']:.0%}) · "
+            f"{stats['writes']} writes, {stats['conflicts']} conflicts merged")
@@ -0,0 +1,97 @@
+import threading
+import weakref
+
+import httpx
+from groq import AsyncGroq
+
+# --- Shared LLM Client ---
+# One Groq client per process, backed by a single keep-alive connection pool, so
+# Streamlit reruns and parallel sessions reuse warm TLS connections. The client is
+# async and is only used from the LLM gateway's event loop (see llm_gateway.py).
+
+DEFAULT_POOL_SIZE = 20          # Max open connections to the API across all sessions
+DEFAULT_KEEPALIVE_CONNECTIONS = 10
+DEFAULT_KEEPALIVE_EXPIRY = 60   # Seconds an idle connection is kept open
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 60       # Streams can pause between tokens, so this is generous
+DEFAULT_MAX_RETRIES = 0          # Retries are handled by resilience.py, with rate-limit awareness
+
+
+def http2_available():
+    """HTTP/2 needs the optional 'h2' package (pip install httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class PoolStatsTransport(httpx.AsyncHTTPTransport):
+    """HTTP transport that counts how often a request reused a pooled connection."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._seen_streams = weakref.WeakSet()  # Network streams (connections) seen so far
+        self.requests = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+
+    async def handle_async_request(self, request):
+        response = await super().handle_async_request(request)
+        network_stream = response.extensions.get("network_stream")
+        with self._lock:
+            self.requests += 1
+            if network_stream is None:
+                pass
+            elif network_stream in self._seen_streams:
+                self.connections_reused += 1
+            else:
+                self._seen_streams.add(network_stream)
+                self.connections_opened += 1
+        return response
+
+
+class SharedLLMClient:
+    """Owns the async Groq client and its tuned connection pool."""
+
+    def __init__(self, api_key, pool_size=DEFAULT_POOL_SIZE, keepalive_connections=DEFAULT_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, http2=False, max_retries=DEFAULT_MAX_RETRIES, base_url=None):
+        self.http2 = bool(http2) and http2_available()  # Quietly fall back to HTTP/1.1 without 'h2'
+        limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.transport = PoolStatsTransport(limits=limits, http2=self.http2)
+        self.http_client = httpx.AsyncClient(
+            transport=self.transport,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+        # base_url points the app at another OpenAI-compatible endpoint, e.g. benchmarks/fake_llm_server.py
+        self.client = AsyncGroq(api_key=api_key, base_url=base_url, http_client=self.http_client, max_retries=max_retries)
+        self.pool_size = pool_size
+
+    def pool_stats(self):
+        """Returns how many requests reused a pooled connection vs. opened a new one."""
+        transport = self.transport
+        with transport._lock:
+            return {
+                "requests": transport.requests,
+                "connections_opened": transport.connections_opened,
+                "connections_reused": transport.connections_reused,
+                "pool_size": self.pool_size,
+                "http2": self.http2,
+            }
+
+    async def aclose(self):
+        """Closes all pooled connections (must run on the event loop that used them)."""
+        await self.http_client.aclose()
+
+
+def format_pool_stats(stats):
+    """Formats pool stats for display."""
+    protocol = "HTTP/2" if stats["http2"] else "HTTP/1.1"
+    return (f"{stats['requests']} requests · {stats['connections_reused']} reused / "
+            f"{stats['connections_opened']} opened connections · pool {stats['pool_size']} ({protocol})")
@@ -0,0 +1,276 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import queue
+import threading
+import time
+
+# --- LLM Gateway ---
+# Every model call goes through one asyncio event loop running on a background
+# thread. A global semaphore caps concurrent upstream requests; callers beyond the
+# cap wait in line (up to a limit), each request has a deadline, and a new prompt
+# from the same session cancels the one it supersedes. Identical requests in flight
+# at the same time (e.g. a whole class asking the same first question) share one
+# upstream stream: late joiners first replay what has streamed so far, and the
+# upstream call is only cancelled once every subscriber has gone.
+
+DEFAULT_MAX_CONCURRENCY = 8   # Upstream requests in flight at once, across all sessions
+DEFAULT_MAX_WAITING = 32      # Requests allowed to queue for a slot before new ones are turned away
+DEFAULT_REQUEST_TIMEOUT = 90  # Seconds from submission (including time in line) until a request is abandoned
+WAIT_POLL_INTERVAL = 0.25
+
+_DONE = object()
+_request_ids = itertools.count(1)
+
+
+class GatewayError(Exception):
+    """Base class for requests the gateway could not complete."""
+
+
+class GatewayBusy(GatewayError):
+    """Too many requests are already waiting for a slot."""
+
+
+class RequestTimeout(GatewayError):
+    """The request did not finish before its deadline."""
+
+
+class RequestCancelled(GatewayError):
+    """The request was cancelled, e.g. superseded by a newer prompt from the same session."""
+
+
+class UpstreamError(GatewayError):
+    """The model API failed (after any retries); the original exception is the __cause__."""
+
+
+def request_key(params):
+    """Identifies requests that produce the same stream (same model, messages and parameters)."""
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class _Flight:
+    """One upstream call, streamed to every request subscribed to it."""
+
+    def __init__(self, key, params):
+        self.key = key
+        self.params = params
+        self.state = "queued"     # queued -> running -> finished
+        self.buffer = []          # Chunks streamed so far, replayed to late joiners
+        self.subscribers = set()  # Requests still reading this flight
+        self.future = None
+
+
+class GatewayRequest:
+    """Handle for a submitted request; its text chunks are consumed from the calling thread."""
+
+    def __init__(self, gateway, session_id, params, flight):
+        self.id = next(_request_ids)
+        self.session_id = session_id
+        self.params = params
+        self.state = "queued"   # queued -> running -> done / failed / cancelled
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self._gateway = gateway
+        self._flight = flight
+        self._chunks = queue.Queue()
+        self._started = threading.Event()  # Set once the request leaves the line (or ends)
+        self._cancel_reason = None
+
+    @property
+    def queue_position(self):
+        """1-based position in line while waiting for a slot, otherwise None."""
+        return self._gateway._queue_position(self)
+
+    def cancel(self, reason="Request cancelled"):
+        """Stops the request; the upstream stream is closed unless other requests share it."""
+        if self._cancel_reason is None:
+            self._cancel_reason = reason
+        self._gateway._unsubscribe(self)
+
+    def wait_for_slot(self, on_wait=None):
+        """Blocks while the request is in line, calling `on_wait(position)` whenever the position changes."""
+        last_position = None
+        while not self._started.wait(WAIT_POLL_INTERVAL):
+            position = self.queue_position
+            if on_wait is not None and position is not None and position != last_position:
+                on_wait(position)
+                last_position = position
+
+    def chunks(self):
+        """Yields response text as it streams in, then raises if the request failed."""
+        try:
+            while True:
+                item = self._chunks.get()
+                if item is _DONE:
+                    break
+                yield item
+            if self.error is not None:
+                raise self.error
+        finally:
+            if self.state in ("queued", "running"):
+                self.cancel()  # The consumer stopped early (e.g. Streamlit rerun), so stop paying for tokens
+
+    def text(self):
+        """Waits for the whole response and returns it."""
+        return "".join(self.chunks())
+
+
+class LLMGateway:
+    """Async request pipeline with a global concurrency limit, deadlines, per-session cancellation
+    and coalescing of identical in-flight requests."""
+
+    def __init__(self, caller, max_concurrency=DEFAULT_MAX_CONCURRENCY, max_waiting=DEFAULT_MAX_WAITING,
+                 request_timeout=DEFAULT_REQUEST_TIMEOUT, coalesce=True):
+        self.caller = caller  # ResilientCaller wrapping the AsyncGroq client, used only on the gateway's loop
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.request_timeout = request_timeout
+        self.coalesce = coalesce
+        self._lock = threading.Lock()
+        self._waiting = []        # Flights waiting for a slot, in arrival order
+        self._flights = {}        # request key -> flight that identical requests can still join
+        self._by_session = {}     # session_id -> latest request from that session
+        self._active = 0
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "timed_out": 0, "rejected": 0,
+                          "upstream": 0, "coalesced": 0}
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+        self._thread.start()
+
+    def submit(self, session_id=None, **params):
+        """Starts a streamed chat completion, or joins an identical one already in flight.
+
+        A newer request from the same session cancels the older one.
+        """
+        key = request_key(params) if self.coalesce else None
+        with self._lock:
+            flight = self._flights.get(key) if key is not None else None
+            new_flight = flight is None
+            if new_flight:
+                free_slots = max(0, self.max_concurrency - self._active)
+                if len(self._waiting) >= self.max_waiting + free_slots:
+                    self._counters["rejected"] += 1
+                    raise GatewayBusy("Too many requests are waiting; please try again in a moment.")
+                flight = _Flight(key, params)
+                self._waiting.append(flight)
+                if key is not None:
+                    self._flights[key] = flight
+                self._counters["upstream"] += 1
+            else:
+                self._counters["coalesced"] += 1
+            request = GatewayRequest(self, session_id, params, flight)
+            for chunk in flight.buffer:  # A late joiner first gets what has streamed so far
+                request._chunks.put(chunk)
+            flight.subscribers.add(request)
+            if flight.state == "running":
+                request.state = "running"
+                request._started.set()
+            self._counters["submitted"] += 1
+            previous = self._by_session.get(session_id) if session_id is not None else None
+            if session_id is not None:
+                self._by_session[session_id] = request
+        if previous is not None and previous.state in ("queued", "running"):
+            previous.cancel("Superseded by a newer prompt")
+        if new_flight:
+            flight.future = asyncio.run_coroutine_threadsafe(self._run(flight), self._loop)
+        return request
+
+    def _queue_position(self, request):
+        with self._lock:
+            try:
+                return self._waiting.index(request._flight) + 1
+            except ValueError:
+                return None
+
+    def _finish_request(self, request, state, error, counter):
+        """Ends one subscriber's stream (the caller holds the lock)."""
+        request.state, request.error = state, error
+        self._counters[counter] += 1
+        if self._by_session.get(request.session_id) is request:
+            del self._by_session[request.session_id]
+        request._started.set()
+        request._chunks.put(_DONE)
+
+    def _unsubscribe(self, request):
+        flight = request._flight
+        with self._lock:
+            if request not in flight.subscribers:
+                return  # Already finished
+            flight.subscribers.discard(request)
+            self._finish_request(request, "cancelled", RequestCancelled(request._cancel_reason or "Request cancelled"),
+                                 "cancelled")
+            abandoned = not flight.subscribers
+            if abandoned:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]  # Nobody may join a flight that is being cancelled
+                if flight in self._waiting:
+                    self._waiting.remove(flight)  # A task cancelled before it starts never reaches _run's cleanup
+        if abandoned and flight.future is not None:
+            flight.future.cancel()  # Closes the upstream stream
+
+    def _emit(self, flight, text):
+        with self._lock:
+            flight.buffer.append(text)
+            for request in flight.subscribers:
+                request._chunks.put(text)
+
+    async def _run(self, flight):
+        state, error, counter = "done", None, "completed"
+        try:
+            with self._lock:
+                abandoned = not flight.subscribers
+            if abandoned:
+                raise asyncio.CancelledError  # Every subscriber left before the flight was scheduled
+            await asyncio.wait_for(self._acquire_and_stream(flight), self.request_timeout)
+        except asyncio.TimeoutError:
+            state, error, counter = "failed", RequestTimeout(f"No complete answer within {self.request_timeout}s"), "timed_out"
+        except asyncio.CancelledError:
+            state, error, counter = "cancelled", RequestCancelled("Request cancelled"), "cancelled"
+        except Exception as e:
+            state, error, counter = "failed", UpstreamError(str(e) or type(e).__name__), "failed"
+            error.__cause__ = e
+        finally:
+            with self._lock:
+                if flight in self._waiting:
+                    self._waiting.remove(flight)
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+                flight.state = "finished"
+                for request in flight.subscribers:
+                    self._finish_request(request, state, error, counter)
+                flight.subscribers.clear()
+                flight.buffer = []
+
+    async def _acquire_and_stream(self, flight):
+        async with self._semaphore:
+            with self._lock:
+                if flight in self._waiting:
+                    self._waiting.remove(flight)
+                self._active += 1
+                flight.state = "running"
+                for request in flight.subscribers:
+                    request.state = "running"
+                    request._started.set()
+            try:
+                # Cancellation closes the upstream response, which stops generation
+                await self.caller.stream(flight.params, lambda text: self._emit(flight, text))
+            finally:
+                with self._lock:
+                    self._active -= 1
+
+    def stats(self):
+        """Returns in-flight/waiting counts, outcome counters and the share of requests that were coalesced."""
+        with self._lock:
+            submitted = self._counters["submitted"]
+            return dict(self._counters, active=self._active, waiting=len(self._waiting),
+                        max_concurrency=self.max_concurrency,
+                        dedup_ratio=self._counters["coalesced"] / submitted if submitted else 0.0)
+
+
+def format_gateway_stats(stats):
+    """Formats gateway stats for display."""
+    return (f"Gateway: {stats['active']}/{stats['max_concurrency']} active, {stats['waiting']} waiting · "
+            f"{stats['completed']} done, {stats['cancelled']} cancelled, {stats['timed_out']} timed out, "
+            f"{stats['rejected']} turned away · {stats['coalesced']} coalesced ({stats['dedup_ratio']:.0%})")
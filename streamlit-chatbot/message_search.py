@@ -0,0 +1,103 @@
+import math
+import re
+import threading
+from collections import Counter
+
+# --- Message Search ---
+# Tokenizing, snippets and an in-process inverted index for searching past messages.
+# The SQLite store uses FTS5 instead; the memory and Redis stores use these helpers.
+
+DEFAULT_SEARCH_RESULTS = 20
+SNIPPET_WORDS = 12         # Words of context around the first match
+HIGHLIGHT = "**"           # Markdown around matched words
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Lower-cased word tokens."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def make_snippet(content, terms, words=SNIPPET_WORDS):
+    """Returns the few words that match the most query terms, with matches highlighted."""
+    parts = content.split()
+    matched_terms = {}
+    for i, part in enumerate(parts):
+        found = {term for token in tokenize(part) for term in terms if token.startswith(term)}
+        if found:
+            matched_terms[i] = found
+    if not matched_terms:
+        return " ".join(parts[:words]) + (" …" if len(parts) > words else "")
+    matches = sorted(matched_terms)
+    starts = {max(0, min(i - words // 3, len(parts) - words)) for i in matches}
+    start = max(sorted(starts), key=lambda s: len(set().union(*(matched_terms[i] for i in matches if s <= i < s + words))))
+    window = parts[start:start + words]
+    shown = [f"{HIGHLIGHT}{part}{HIGHLIGHT}" if start + i in matches else part for i, part in enumerate(window)]
+    return ("… " if start > 0 else "") + " ".join(shown) + (" …" if start + words < len(parts) else "")
+
+
+class InvertedIndex:
+    """Incrementally maintained token -> postings index with BM25 ranking and prefix matching."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}    # (user_id, token) -> {doc key: term count}
+        self._documents = {}   # doc key -> (user_id, subject_id, kind, seq, role, content, length)
+        self._user_tokens = {} # user_id -> set of tokens, for prefix matching and clearing
+        self._user_docs = {}   # user_id -> (document count, total length)
+
+    def add(self, user_id, subject_id, kind, seq, role, content):
+        tokens = tokenize(content)
+        key = (user_id, subject_id, kind, seq)
+        with self._lock:
+            self._documents[key] = (user_id, subject_id, kind, seq, role, content, len(tokens))
+            for token, count in Counter(tokens).items():
+                self._postings.setdefault((user_id, token), {})[key] = count
+                self._user_tokens.setdefault(user_id, set()).add(token)
+            docs, length = self._user_docs.get(user_id, (0, 0))
+            self._user_docs[user_id] = (docs + 1, length + len(tokens))
+
+    def remove_user(self, user_id):
+        with self._lock:
+            for token in self._user_tokens.pop(user_id, ()):
+                for key in self._postings.pop((user_id, token), {}):
+                    self._documents.pop(key, None)
+            self._user_docs.pop(user_id, None)
+
+    def search(self, user_id, query, limit=DEFAULT_SEARCH_RESULTS):
+        """Returns the best matching messages of one learner; every query word must match (as a prefix)."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            docs, total_length = self._user_docs.get(user_id, (0, 0))
+            if not docs:
+                return []
+            average_length = total_length / docs
+            user_tokens = self._user_tokens.get(user_id, set())
+            scores = None
+            for term in terms:
+                # Prefix matching, so "volcano" also finds "volcanoes"
+                term_scores = {}
+                for token in (t for t in user_tokens if t.startswith(term)):
+                    postings = self._postings[(user_id, token)]
+                    idf = math.log(1 + (docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for key, count in postings.items():
+                        length = self._documents[key][6]
+                        tf = count * (BM25_K1 + 1) / (count + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+                        term_scores[key] = term_scores.get(key, 0.0) + idf * tf
+                scores = term_scores if scores is None else {k: s + term_scores[k] for k, s in scores.items() if k in term_scores}
+                if not scores:
+                    return []
+            best = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+            documents = [(self._documents[key], score) for key, score in best]
+        return [search_hit(subject_id, kind, seq, role, make_snippet(content, tuple(terms)), score)
+                for (_, subject_id, kind, seq, role, content, _), score in documents]
+
+
+def search_hit(subject_id, kind, seq, role, snippet, score):
+    """A search result, pointing at one message of one conversation."""
+    return {"subject_id": subject_id, "kind": kind, "seq": seq, "role": role, "snippet": snippet, "score": score}
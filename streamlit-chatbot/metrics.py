@@ -0,0 +1,225 @@
+import bisect
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Metrics ---
+# Process-wide latency and throughput histograms (per phase of a script run, per app
+# mode, per model call), exposed in Prometheus text format over HTTP and/or written
+# to a local file, and summarized in the debug sidebar.
+
+METRICS_NAMESPACE = "olive"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # Seconds
+TOKEN_BUCKETS = (16, 64, 256, 1024, 2048, 4096, 8192)
+DEFAULT_WRITE_INTERVAL = 15  # Seconds between rewrites of the metrics file
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, as Prometheus expects."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimates a quantile by interpolating inside the bucket that contains it."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if math.isinf(bound) else repr(float(bound))
+
+
+class MetricsRegistry:
+    """Thread-safe histograms and counters, keyed by metric name and labels."""
+
+    def __init__(self, namespace=METRICS_NAMESPACE):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._histograms = {}   # name -> {labels: Histogram}
+        self._counters = {}     # name -> {labels: value}
+        self._help = {}
+        self._collectors = []   # (prefix, fn) returning {name: number}, read at export time
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, help_text=None, **labels):
+        """Records one value in the histogram for these labels."""
+        if value is None:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+    def inc(self, name, amount=1, help_text=None, **labels):
+        """Adds to a counter."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Times a block. Nothing is recorded if it is interrupted (e.g. by st.rerun), so partial runs don't skew the numbers."""
+        started_at = time.perf_counter()
+        yield
+        self.observe(name, time.perf_counter() - started_at, **labels)
+
+    def add_collector(self, prefix, collect):
+        """Exports the numeric values of `collect()` (e.g. a component's stats dict) as gauges."""
+        with self._lock:
+            self._collectors.append((prefix, collect))
+
+    def render_prometheus(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            histograms = {name: {labels: (list(h.counts), h.sum, h.count, h.buckets) for labels, h in series.items()}
+                          for name, series in self._histograms.items()}
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            collectors = list(self._collectors)
+            help_texts = dict(self._help)
+        for name in sorted(histograms):
+            full_name = f"{self.namespace}_{name}"
+            if name in help_texts:
+                lines.append(f"# HELP {full_name} {help_texts[name]}")
+            lines.append(f"# TYPE {full_name} histogram")
+            for labels, (counts, total, count, buckets) in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, bucket_count in zip(list(buckets) + [math.inf], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{full_name}_bucket{_format_labels(labels, ('le', _format_bound(bound)))} {cumulative}")
+                lines.append(f"{full_name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{full_name}_count{_format_labels(labels)} {count}")
+        for name in sorted(counters):
+            full_name = f"{self.namespace}_{name}_total"
+            if name in help_texts:
+                lines.append(f"# HELP {full_name} {help_texts[name]}")
+            lines.append(f"# TYPE {full_name} counter")
+            for labels, value in sorted(counters[name].items()):
+                lines.append(f"{full_name}{_format_labels(labels)} {value}")
+        for prefix, collect in collectors:
+            try:
+                values = collect()
+            except Exception as e:  # A broken collector must not break the endpoint
+                logger.warning("Metrics collector %r failed: %s", prefix, e)
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                full_name = f"{self.namespace}_{prefix}_{key}"
+                lines.append(f"# TYPE {full_name} gauge")
+                lines.append(f"{full_name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, name):
+        """Returns [(labels dict, count, mean, p50, p95)] for one histogram, for display."""
+        with self._lock:
+            series = sorted(self._histograms.get(name, {}).items())
+            return [(dict(labels), h.count, h.sum / h.count, h.quantile(0.5), h.quantile(0.95))
+                    for labels, h in series if h.count]
+
+    def write_file(self, path):
+        """Atomically writes the Prometheus text to `path` (e.g. for node_exporter's textfile collector)."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render_prometheus())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the Streamlit log
+
+
+class MetricsExporter:
+    """Serves /metrics on a port and/or rewrites a metrics file periodically, from daemon threads."""
+
+    def __init__(self, registry, port=None, host="127.0.0.1", path=None, write_interval=DEFAULT_WRITE_INTERVAL):
+        self.registry = registry
+        self.server = None
+        if port:
+            handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+            self.server = ThreadingHTTPServer((host, int(port)), handler)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+        if path:
+            self.path = path
+            self.write_interval = write_interval
+            threading.Thread(target=self._write_loop, name="metrics-file", daemon=True).start()
+
+    def _write_loop(self):
+        while True:
+            time.sleep(self.write_interval)
+            try:
+                self.registry.write_file(self.path)
+            except OSError as e:
+                logger.warning("Could not write metrics to %s: %s", self.path, e)
+
+
+def format_metrics_summary(rows, label, unit="s"):
+    """Formats histogram summaries as one markdown line per label value."""
+    lines = []
+    for labels, count, mean, p50, p95 in rows:
+        name = " · ".join(str(labels[key]) for key in label if key in labels)
+        if unit == "s":
+            digits = 1 if p95 < 0.01 else 0  # Sub-10 ms timings (e.g. game bot moves) need a decimal
+            lines.append(f"- {name}: p50 {p50 * 1000:.{digits}f} ms, p95 {p95 * 1000:.{digits}f} ms ({count}×)")
+        else:
+            lines.append(f"- {name}: p50 {p50:.0f}, p95 {p95:.0f} {unit} ({count}×)")
+    return "\n".join(lines)
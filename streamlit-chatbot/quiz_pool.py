@@ -0,0 +1,175 @@
+import logging
+import queue
+import re
+import threading
+from collections import deque
+
+# --- Quiz Question Pool ---
+# Keeps a few ready-made, validated quiz questions per subject. A background worker
+# refills a subject's pool in batches whenever it drops below the low watermark, so
+# "New Quiz Question" only has to pop the next one.
+
+POOL_TARGET = 8           # Ready questions kept per subject
+LOW_WATERMARK = 3         # Refill when fewer than this many are left
+BATCH_SIZE = 5            # Questions requested per API call
+MAX_FAILED_BATCHES = 3    # Give up a refill after this many unusable batches in a row
+RECENT_QUESTIONS = 200    # Pooled questions remembered per subject to avoid repeats
+OPTION_LETTERS = ("A", "B", "C")
+
+logger = logging.getLogger(__name__)
+
+_QUESTION_RE = re.compile(
+    r"Question\s*\d*\s*[:.)]\s*(?P<question>.+?)\s*"
+    r"\(?A\)\s*(?P<A>.+?)\s*\(?B\)\s*(?P<B>.+?)\s*\(?C\)\s*(?P<C>.+?)\s*"
+    r"Correct(?:\s+answer)?\s*:?\s*\[?\(?(?P<correct>[ABC])\b",
+    re.IGNORECASE | re.DOTALL,
+)
+_MARKDOWN_RE = re.compile(r"[*_`#]+")
+_ANSWER_RE = re.compile(r"^\s*\(?([ABC])\b", re.IGNORECASE)
+
+
+def quiz_prompt(subject_name, count):
+    """Builds the messages asking the model for a batch of quiz questions."""
+    return [
+        {"role": "system", "content": (
+            f"You are a quiz master for kids. Generate {count} different, simple quiz questions about '{subject_name}', "
+            "each with 3 multiple-choice options (A, B, C) and exactly one correct answer. "
+            "Format every question exactly like this, separated by a blank line:\n"
+            "Question: ...\nA) ...\nB) ...\nC) ...\nCorrect: [A/B/C]"
+        )},
+        {"role": "user", "content": f"Generate {count} quiz questions about {subject_name}."},
+    ]
+
+
+def _clean(text):
+    return " ".join(_MARKDOWN_RE.sub("", text).split())
+
+
+def parse_quiz_questions(text):
+    """Parses model output into validated {"question", "options", "correct"} records."""
+    questions = []
+    for match in _QUESTION_RE.finditer(text or ""):
+        question = _clean(match.group("question"))
+        options = {letter: _clean(match.group(letter)) for letter in OPTION_LETTERS}
+        correct = match.group("correct").upper()
+        if not question or len(question) > 300:
+            continue
+        if not all(options.values()) or len(set(o.lower() for o in options.values())) < len(options):
+            continue  # Empty or duplicate options make the question unanswerable
+        questions.append({"question": question, "options": options, "correct": correct})
+    return questions
+
+
+def normalize_answer(answer):
+    """Extracts the option letter from an answer like "b", "B)" or "(B) Paris"."""
+    match = _ANSWER_RE.match(answer or "")
+    return match.group(1).upper() if match else None
+
+
+def is_correct_answer(question, answer):
+    """Compares the learner's answer with the question's correct option."""
+    return normalize_answer(answer) == question["correct"]
+
+
+def format_quiz_question(question):
+    """Formats a structured question as markdown."""
+    options = "\n".join(f"- **{letter})** {question['options'][letter]}" for letter in OPTION_LETTERS)
+    return f"**{question['question']}**\n\n{options}"
+
+
+class QuizPool:
+    """Process-wide pools of ready quiz questions, refilled by a background worker."""
+
+    def __init__(self, generate_batch, target=POOL_TARGET, low_watermark=LOW_WATERMARK, batch_size=BATCH_SIZE):
+        self.generate_batch = generate_batch  # (subject_name, count) -> raw model text
+        self.target = target
+        self.low_watermark = low_watermark
+        self.batch_size = batch_size
+        self._ready = {}          # subject_name -> deque of questions
+        self._recent = {}         # subject_name -> (deque, set) of recently pooled question texts
+        self._refilling = set()
+        self._errors = {}         # subject_name -> last refill error message
+        self._condition = threading.Condition()
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._refill_loop, name="quiz-pool-refill", daemon=True)
+        self._worker.start()
+
+    def warm(self, subject_names):
+        """Schedules refills for any of these subjects that are below the watermark."""
+        for subject_name in subject_names:
+            self._maybe_refill(subject_name)
+
+    def _maybe_refill(self, subject_name):
+        with self._condition:
+            ready = len(self._ready.get(subject_name, ()))
+            if ready >= self.low_watermark or subject_name in self._refilling:
+                return
+            self._refilling.add(subject_name)
+        self._requests.put(subject_name)
+
+    def pop(self, subject_name, timeout=0):
+        """Returns the next ready question, waiting up to `timeout` seconds if the pool is empty."""
+        self._maybe_refill(subject_name)
+        with self._condition:
+            ready = self._ready.setdefault(subject_name, deque())
+            if not ready and timeout:
+                self._condition.wait_for(lambda: ready or subject_name not in self._refilling, timeout)
+            question = ready.popleft() if ready else None
+        if question is not None:
+            self._maybe_refill(subject_name)  # Top up in the background after taking one
+        return question
+
+    def last_error(self, subject_name):
+        with self._condition:
+            return self._errors.get(subject_name)
+
+    def stats(self):
+        """Returns the number of ready questions per subject."""
+        with self._condition:
+            return {name: len(ready) for name, ready in self._ready.items()}
+
+    def _add(self, subject_name, questions):
+        with self._condition:
+            ready = self._ready.setdefault(subject_name, deque())
+            recent, recent_set = self._recent.setdefault(subject_name, (deque(), set()))
+            added = 0
+            for question in questions:
+                text = question["question"].lower()
+                if text in recent_set or len(ready) >= self.target:
+                    continue
+                ready.append(question)
+                recent.append(text)
+                recent_set.add(text)
+                if len(recent) > RECENT_QUESTIONS:
+                    recent_set.discard(recent.popleft())
+                added += 1
+            self._condition.notify_all()
+            return added
+
+    def _refill(self, subject_name):
+        failures = 0
+        while failures < MAX_FAILED_BATCHES:
+            with self._condition:
+                missing = self.target - len(self._ready.get(subject_name, ()))
+            if missing <= 0:
+                break
+            try:
+                raw_text = self.generate_batch(subject_name, min(self.batch_size, missing))
+                added = self._add(subject_name, parse_quiz_questions(raw_text))
+                error = None if added else "The quiz master's answer could not be understood."
+            except Exception as e:  # Keep the worker alive whatever the API raises
+                logger.warning("Quiz refill for %r failed: %s", subject_name, e)
+                added, error = 0, str(e)
+            with self._condition:
+                self._errors[subject_name] = error
+            failures = 0 if added else failures + 1
+
+    def _refill_loop(self):
+        while True:
+            subject_name = self._requests.get()
+            try:
+                self._refill(subject_name)
+            finally:
+                with self._condition:
+                    self._refilling.discard(subject_name)
+                    self._condition.notify_all()
@@ -0,0 +1,128 @@
+import heapq
+import uuid
+
+# --- Reminder Scheduler ---
+# Revision and Quiz reminders are spaced-repetition cards: each quiz answer (or a
+# finished revision) is an SM-2 review that sets the card's next due time. Pending
+# reminders sit in a heap ordered by due time, so finding what has become due only
+# pops the top of the heap instead of scanning every reminder.
+
+DEFAULT_DAY_SECONDS = 24 * 60 * 60  # Length of an SM-2 "day"; shorten it to try the schedule out
+INITIAL_EASINESS = 2.5
+MIN_EASINESS = 1.3
+QUIZ_CORRECT_QUALITY = 4   # SM-2 answer quality (0-5) for a right quiz answer...
+QUIZ_WRONG_QUALITY = 1     # ...and for a wrong one
+REVISION_DONE_QUALITY = 4  # A revision the learner marked as done
+
+
+def new_reminder(text, reminder_type, subject_id, now, day_seconds=DEFAULT_DAY_SECONDS):
+    """Creates a reminder card, first due after one SM-2 interval."""
+    return {
+        "id": str(uuid.uuid4()),
+        "text": text,
+        "type": reminder_type,
+        "subject_id": subject_id,
+        "completed": False,
+        "easiness": INITIAL_EASINESS,
+        "repetitions": 0,
+        "interval_days": 1,
+        "due_at": now + day_seconds,
+    }
+
+
+def review(reminder, quality, now, day_seconds=DEFAULT_DAY_SECONDS):
+    """Applies one SM-2 review with answer quality 0-5 and sets the reminder's next due time."""
+    easiness = reminder.get("easiness", INITIAL_EASINESS)
+    easiness = max(MIN_EASINESS, easiness + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    if quality < 3:
+        repetitions, interval = 0, 1  # Forgotten: start the intervals over
+    else:
+        repetitions = reminder.get("repetitions", 0) + 1
+        if repetitions == 1:
+            interval = 1
+        elif repetitions == 2:
+            interval = 6
+        else:
+            interval = round(reminder.get("interval_days", 1) * easiness)
+    reminder.update(easiness=easiness, repetitions=repetitions, interval_days=interval,
+                    due_at=now + interval * day_seconds, last_reviewed_at=now)
+    return reminder
+
+
+class ReminderQueue:
+    """One learner's pending reminders: a heap by due time, plus the ones that have already come due.
+
+    Rescheduling pushes a new heap entry; outdated entries are skipped when they reach the top.
+    """
+
+    def __init__(self, reminders):
+        self.source = reminders  # The list the reminder dicts live in (the learner state)
+        self._reminders = {}     # id -> reminder, for every pending reminder
+        self._due = {}           # id -> reminder, already due
+        self._heap = []          # (due_at, id), possibly outdated
+        self.ticked = False
+        for reminder in reminders:
+            if not reminder.get("completed"):
+                self._reminders[reminder["id"]] = reminder
+                self._heap.append((reminder.get("due_at", 0), reminder["id"]))  # Reminders from before scheduling are due now
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._reminders)
+
+    def _current(self, entry):
+        reminder = self._reminders.get(entry[1])
+        if reminder is None or reminder.get("due_at", 0) != entry[0] or entry[1] in self._due:
+            return None
+        return reminder
+
+    def schedule(self, reminder):
+        """Adds a reminder, or re-files one whose due time changed."""
+        self._reminders[reminder["id"]] = reminder
+        self._due.pop(reminder["id"], None)
+        heapq.heappush(self._heap, (reminder.get("due_at", 0), reminder["id"]))
+
+    def tick(self, now):
+        """Moves reminders whose time has come to the due list and returns them (O(log n) each)."""
+        newly_due = []
+        while self._heap and self._heap[0][0] <= now:
+            reminder = self._current(heapq.heappop(self._heap))
+            if reminder is not None:
+                self._due[reminder["id"]] = reminder
+                newly_due.append(reminder)
+        self.ticked = True
+        return newly_due
+
+    def due(self):
+        """Reminders that are due, oldest first."""
+        return sorted(self._due.values(), key=lambda reminder: reminder.get("due_at", 0))
+
+    def upcoming(self, count):
+        """The next `count` reminders that are not due yet, by popping and re-pushing the top of the heap."""
+        popped, upcoming = [], []
+        while self._heap and len(upcoming) < count:
+            entry = heapq.heappop(self._heap)
+            reminder = self._current(entry)
+            if reminder is not None:
+                popped.append(entry)
+                upcoming.append(reminder)
+        for entry in popped:
+            heapq.heappush(self._heap, entry)
+        return upcoming
+
+    def for_subject(self, subject_id):
+        """Pending reminders of one subject."""
+        return [reminder for reminder in self._reminders.values() if reminder.get("subject_id") == subject_id]
+
+
+def format_due(due_at, now):
+    """Formats a due time relative to now ("now", "in 5 min", "in 3 h", "in 2 days")."""
+    seconds = due_at - now
+    if seconds <= 0:
+        return "now"
+    if seconds < 3600:
+        return f"in {max(1, round(seconds / 60))} min"
+    if seconds < 86400:
+        return f"in {round(seconds / 3600)} h"
+    days = round(seconds / 86400)
+    return f"in {days} day{'s' if days != 1 else ''}"
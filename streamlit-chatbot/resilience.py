@@ -0,0 +1,255 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+
+import groq
+import httpx
+
+from context_window import count_tokens
+
+# --- Resilient Model Calls ---
+# Wraps streamed chat completions with client-side rate limiting (token buckets kept
+# in sync with Groq's rate-limit headers), retries with jittered exponential backoff,
+# fallback to a lighter model while the primary is slow or failing, and resumption
+# of streams that break partway through.
+
+DEFAULT_REQUESTS_PER_MINUTE = 30
+DEFAULT_TOKENS_PER_MINUTE = 6000
+DEFAULT_COMPLETION_TOKENS = 512   # Assumed reply size when a request sets no max_tokens
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BASE_DELAY = 0.5          # Seconds before the first retry; doubles on every attempt
+DEFAULT_MAX_DELAY = 8.0
+DEFAULT_FALLBACK_MODELS = {"llama3-70b-8192": "llama3-8b-8192"}
+DEFAULT_LATENCY_BUDGET = 4.0      # Median time-to-first-token (s) above which the fallback is used
+DEFAULT_ERROR_BUDGET = 0.25       # Error rate above which the fallback is used
+HEALTH_WINDOW = 60                # Seconds of history used to judge a model's health
+HEALTH_MIN_SAMPLES = 4
+
+RETRYABLE_ERRORS = (
+    groq.RateLimitError,
+    groq.InternalServerError,
+    groq.APIConnectionError,  # Includes APITimeoutError
+    httpx.TransportError,     # Connection dropped while reading a stream
+)
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value):
+    """Parses rate-limit reset durations such as "7.66s", "2m59.56s" or "120ms" into seconds."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def estimate_request_tokens(params):
+    """Estimates the tokens a request will count against the per-minute quota."""
+    prompt = sum(count_tokens(m.get("content", "")) for m in params.get("messages", []))
+    return prompt + params.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to `capacity` units per minute."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.capacity / 60)
+        self.updated_at = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` units are available (0 if they are available now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0 if self.level >= amount else (amount - self.level) * 60 / self.capacity
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def limit_to(self, remaining, now):
+        """Never believe we have more than the server says is left."""
+        self._refill(now)
+        self.level = min(self.level, remaining)
+
+
+class RateLimiter:
+    """Client-side request and token quotas for one model."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, estimated_tokens):
+        """Waits until both quotas allow another request; returns the seconds spent waiting."""
+        waited = 0.0
+        async with self._lock:  # First come, first served
+            while True:
+                now = time.monotonic()
+                delay = max(self.paused_until - now, self.requests.wait_time(1, now),
+                            self.tokens.wait_time(estimated_tokens, now))
+                if delay <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(estimated_tokens)
+                    return waited
+                await asyncio.sleep(delay)
+                waited += delay
+
+    def update_from_headers(self, headers):
+        """Syncs the buckets with Groq's x-ratelimit-* and retry-after headers."""
+        if not headers:
+            return
+        now = time.monotonic()
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            bucket.limit_to(float(remaining), now)
+            reset_after = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if float(remaining) <= 0 and reset_after:
+                self.paused_until = max(self.paused_until, now + reset_after)  # Quota exhausted until the reset
+        retry_after = parse_duration(headers.get("retry-after"))
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+
+
+class ModelHealth:
+    """Sliding window of a model's recent errors and time-to-first-token."""
+
+    def __init__(self):
+        self.samples = deque()  # (time, ok, ttft)
+
+    def record(self, ok, ttft=None):
+        self.samples.append((time.monotonic(), ok, ttft))
+
+    def _trim(self, now):
+        while self.samples and now - self.samples[0][0] > HEALTH_WINDOW:
+            self.samples.popleft()
+
+    def degraded(self, latency_budget, error_budget):
+        self._trim(time.monotonic())
+        if len(self.samples) < HEALTH_MIN_SAMPLES:
+            return False
+        errors = sum(1 for _, ok, _ in self.samples if not ok)
+        if errors / len(self.samples) > error_budget:
+            return True
+        latencies = sorted(ttft for _, ok, ttft in self.samples if ok and ttft is not None)
+        return bool(latencies) and latencies[len(latencies) // 2] > latency_budget
+
+
+class ResilientCaller:
+    """Streams chat completions with throttling, retries, model fallback and stream resumption."""
+
+    def __init__(self, client, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 fallback_models=None, latency_budget=DEFAULT_LATENCY_BUDGET, error_budget=DEFAULT_ERROR_BUDGET):
+        self.client = client
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.fallback_models = DEFAULT_FALLBACK_MODELS if fallback_models is None else dict(fallback_models)
+        self.latency_budget = latency_budget
+        self.error_budget = error_budget
+        self._limiters = {}
+        self._health = {}
+        self._stats_lock = threading.Lock()  # Stats are read from Streamlit threads
+        self._counters = {"attempts": 0, "retries": 0, "fallbacks": 0, "resumed": 0, "throttled_seconds": 0.0}
+
+    def _limiter(self, model):
+        if model not in self._limiters:
+            self._limiters[model] = RateLimiter(self.requests_per_minute, self.tokens_per_minute)
+        return self._limiters[model]
+
+    def _model_health(self, model):
+        return self._health.setdefault(model, ModelHealth())
+
+    def _count(self, counter, amount=1):
+        with self._stats_lock:
+            self._counters[counter] += amount
+
+    def route(self, model):
+        """Returns the model to use, switching to the fallback while the requested one is over budget."""
+        fallback = self.fallback_models.get(model)
+        if fallback and self._model_health(model).degraded(self.latency_budget, self.error_budget):
+            return fallback
+        return model
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, never shorter than the server's retry-after."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        return max(delay, retry_after or 0)
+
+    async def stream(self, params, emit):
+        """Streams a completion, calling `emit(text)` per chunk. Text already emitted is never repeated."""
+        requested_model = params["model"]
+        partial = []
+        attempt = 0
+        while True:
+            attempt += 1
+            model = self.route(requested_model)
+            if model != requested_model:
+                self._count("fallbacks")
+            attempt_params = dict(params, model=model)
+            if partial:
+                # Prefill the answer so far; the model continues from where the broken stream stopped
+                attempt_params["messages"] = list(params["messages"]) + [{"role": "assistant", "content": "".join(partial)}]
+                self._count("resumed")
+            limiter = self._limiter(model)
+            waited = await limiter.acquire(estimate_request_tokens(attempt_params))
+            if waited:
+                self._count("throttled_seconds", waited)
+            self._count("attempts")
+            started_at = time.monotonic()
+            first_chunk = True
+            try:
+                raw_response = await self.client.chat.completions.with_raw_response.create(stream=True, **attempt_params)
+                limiter.update_from_headers(raw_response.headers)
+                stream = await raw_response.parse()
+                async with stream:
+                    async for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content is not None:
+                            if first_chunk:
+                                self._model_health(model).record(True, time.monotonic() - started_at)
+                                first_chunk = False
+                            partial.append(chunk.choices[0].delta.content)
+                            emit(chunk.choices[0].delta.content)
+                if first_chunk:
+                    self._model_health(model).record(True, time.monotonic() - started_at)
+                return
+            except RETRYABLE_ERRORS as e:
+                self._model_health(model).record(False)
+                response = getattr(e, "response", None)
+                headers = getattr(response, "headers", None)
+                limiter.update_from_headers(headers)
+                if attempt >= self.max_attempts:
+                    raise
+                self._count("retries")
+                retry_after = parse_duration(headers.get("retry-after")) if headers else None
+                await asyncio.sleep(self.backoff_delay(attempt, retry_after))
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._counters)
+
+
+def format_resilience_stats(stats):
+    """Formats retry/fallback stats for display."""
+    return (f"Resilience: {stats['retries']} retries, {stats['fallbacks']} fallbacks, {stats['resumed']} resumed streams, "
+            f"{stats['throttled_seconds']:.1f}s throttled")
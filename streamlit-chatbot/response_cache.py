@@ -0,0 +1,214 @@
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# --- Response Cache ---
+# Process-wide cache of model answers keyed on (model, system prompts, every
+# normalized message sent), since the answer depends on all of them. Exact matches are checked first; optionally (off by default),
+# a lookup by text similarity finds answers to the same question phrased slightly
+# differently. Character-trigram similarity can't tell "war 1" from "war 2" or
+# "biggest" from "smallest", so a similar question is only a hit if it also has
+# exactly the same key terms (numbers and content words); only wording such as
+# "what's" / "what is the" may differ.
+
+DEFAULT_MAX_ENTRIES = 2000
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024  # Memory cap for cached answers and keys
+DEFAULT_TTL = 24 * 60 * 60            # Seconds an answer stays valid
+DEFAULT_SIMILARITY_THRESHOLD = 0.95   # Minimum cosine similarity for a semantic hit
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_WHITESPACE_RE = re.compile(r"\s+")
+_REPLAY_RE = re.compile(r"\S+\s*|\s+")
+# Words that don't change what a question asks; every other word and number is a key term
+STOPWORDS = frozenset(
+    "a an the is are was were be been am do does did of in on at to for from by with about into and or "
+    "what what's whats which who who's whos whom whose when where why how it its it's this that these those "
+    "i me my you your we our us can could would should will shall may might please tell explain "
+    "s there there's some any".split()
+)
+
+
+def normalize_text(text):
+    """Lower-cases and collapses whitespace and trailing punctuation for exact matching."""
+    return _WHITESPACE_RE.sub(" ", text.lower()).strip().rstrip("?!. ")
+
+
+def embed_text(text):
+    """Embeds text as a sparse vector of word and character-trigram counts."""
+    features = Counter()
+    for word in _WORD_RE.findall(text.lower()):
+        features["w:" + word] += 1
+        padded = f"#{word}#"
+        for i in range(len(padded) - 2):
+            features["c:" + padded[i:i + 3]] += 1
+    norm = math.sqrt(sum(count * count for count in features.values()))
+    return features, norm
+
+
+def key_terms(text):
+    """Returns the numbers and content words of a question, which must all match for a semantic hit."""
+    return frozenset(word for word in _WORD_RE.findall(text.lower()) if word not in STOPWORDS)
+
+
+def cosine_similarity(a, b):
+    features_a, norm_a = a
+    features_b, norm_b = b
+    if not norm_a or not norm_b:
+        return 0.0
+    if len(features_a) > len(features_b):
+        features_a, features_b = features_b, features_a
+    dot = sum(count * features_b.get(feature, 0) for feature, count in features_a.items())
+    return dot / (norm_a * norm_b)
+
+
+def replay_text(text):
+    """Splits a cached answer into word-sized chunks so it can be streamed like a live one."""
+    return _REPLAY_RE.findall(text)
+
+
+def _split_messages(messages):
+    system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+    turns = [(m["role"], normalize_text(m["content"])) for m in messages if m["role"] != "system"]
+    return system, turns
+
+
+class _Entry:
+    __slots__ = ("key", "partition", "vector", "terms", "text", "created_at", "size")
+
+    def __init__(self, key, partition, vector, terms, created_at):
+        self.key = key
+        self.partition = partition
+        self.vector = vector
+        self.terms = terms
+        self.text = None
+        self.created_at = created_at
+        self.size = len(key) + len(partition)
+
+
+class ResponseCache:
+    """LRU/TTL cache of model answers with an optional similarity index."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL,
+                 semantic=False, similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.semantic = semantic
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> _Entry, least recently used first
+        self._partitions = {}          # partition -> {key: _Entry}, the local vector index
+        self._bytes = 0
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _keys(self, model, messages):
+        """Returns (exact key, partition, last user text) for a request."""
+        system, turns = _split_messages(messages)
+        last_text = turns[-1][1] if turns else ""
+        # Everything but the last message must match exactly for a semantic hit
+        partition = hashlib.sha1(json.dumps([model, system, turns[:-1]]).encode()).hexdigest()
+        key = hashlib.sha1(json.dumps([partition, last_text]).encode()).hexdigest()
+        return key, partition, last_text
+
+    def _remove(self, entry):
+        del self._entries[entry.key]
+        index = self._partitions.get(entry.partition)
+        if index is not None:
+            index.pop(entry.key, None)
+            if not index:
+                del self._partitions[entry.partition]
+        self._bytes -= entry.size
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry.created_at > self.ttl
+
+    def _find(self, key, partition, last_text, now):
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry, now):
+            self._remove(entry)
+            entry = None
+        if entry is not None or not self.semantic or not last_text:
+            return entry, False
+        # Semantic lookup among cached questions that share the same context
+        vector, terms = embed_text(last_text), key_terms(last_text)
+        best, best_score = None, self.similarity_threshold
+        for candidate in list(self._partitions.get(partition, {}).values()):
+            if self._expired(candidate, now):
+                self._remove(candidate)
+                continue
+            if candidate.terms != terms:
+                continue  # Asks about something else, however similar the wording
+            score = cosine_similarity(vector, candidate.vector)
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best, best is not None
+
+    def get(self, model, messages):
+        """Returns a cached answer, or None on a miss."""
+        key, partition, last_text = self._keys(model, messages)
+        now = time.time()
+        with self._lock:
+            entry, semantic = self._find(key, partition, last_text, now)
+            if entry is None or entry.text is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry.key)
+            if semantic:
+                self.semantic_hits += 1
+            else:
+                self.hits += 1
+            return entry.text
+
+    def put(self, model, messages, text):
+        """Stores an answer, evicting the least recently used entries to respect the caps."""
+        if not text:
+            return
+        key, partition, last_text = self._keys(model, messages)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry, now):
+                if entry is not None:
+                    self._remove(entry)
+                entry = _Entry(key, partition, embed_text(last_text) if self.semantic else None,
+                               key_terms(last_text) if self.semantic else None, now)
+                self._entries[key] = entry
+                self._partitions.setdefault(partition, {})[key] = entry
+                self._bytes += entry.size
+            if entry.text is not None:
+                return
+            entry.text = text
+            size = len(text.encode())
+            entry.size += size
+            self._bytes += size
+            self._entries.move_to_end(key)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries.values())))
+                self.evictions += 1
+
+    def stats(self):
+        """Returns hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+def format_cache_stats(stats):
+    """Formats cache stats for display."""
+    return (f"Cache: {stats['hits']} exact + {stats['semantic_hits']} similar hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%}) · {stats['entries']} entries, {stats['bytes'] / 1024:.0f} KiB")
@@ -0,0 +1,246 @@
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+# --- Session Memory Governor ---
+# Keeps the memory held in st.session_state bounded per process. Every session's
+# state is measured (approximately) after its runs, at most once per measure
+# interval, since walking the whole state on every run costs more than it saves. A session over its own budget
+# drops its caches that can be rebuilt (conversation tails, which reload from the
+# conversation store, and rendered markdown). Sessions idle for a while, and the
+# least recently active ones while the process is over its budget, are evicted:
+# state that exists nowhere else (context window summaries, the quiz question, the
+# current game...) is spilled to a compressed file and the caches are dropped. The
+# app brings spilled state back the next time the session reads any of it. A session
+# whose script is running is never evicted: runs mark their start (touch) and end
+# (track), and a per-session lock keeps eviction and rehydration apart.
+
+DEFAULT_SESSION_BUDGET = 8 * 1024 * 1024     # Bytes one session may hold before its caches are dropped
+DEFAULT_PROCESS_BUDGET = 512 * 1024 * 1024   # Bytes all sessions together may hold before the idlest are evicted
+DEFAULT_IDLE_SECONDS = 15 * 60               # Sessions without activity for this long are evicted
+DEFAULT_SWEEP_INTERVAL = 30                  # Seconds between checks of idle sessions and the process budget
+DEFAULT_MEASURE_INTERVAL = 5                 # Seconds between measurements of one session's state
+RUN_GRACE_SECONDS = 120                      # A run that never reported its end counts as over after this long
+SPILL_COMPRESSION_LEVEL = 6
+SPILL_MARKER = "spilled_session_state"       # Session-state key holding the spill file of an evicted session
+
+# Caches that are rebuilt on demand, so they are dropped rather than spilled
+DROPPED_KEYS = ("chat_histories_in_session", "study_messages", "conversation_memories", "rendered_markdown",
+                "transcript_visible")
+# State that exists only in the session, so it is spilled to disk
+SPILLED_KEYS = ("context_windows", "stream_stats", "quiz_question", "quiz_question_subject", "game")
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_bytes(value, _seen=None):
+    """Approximate memory held by a value and everything it references (shared objects counted once)."""
+    seen = set() if _seen is None else _seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, int, float, bool, type(None))):
+        return size
+    if isinstance(value, dict):
+        return size + sum(estimate_bytes(k, seen) + estimate_bytes(v, seen) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(estimate_bytes(item, seen) for item in value)
+    for slot in getattr(type(value), "__slots__", ()):
+        size += estimate_bytes(getattr(value, slot, None), seen)
+    if hasattr(value, "__dict__"):
+        size += estimate_bytes(vars(value), seen)
+    return size
+
+
+class SessionMemoryGovernor:
+    """Tracks the session-state memory of every session in this process and evicts sessions to stay in budget.
+
+    `state` objects are Streamlit's thread-safe session state of a session. `is_active(session_id)` tells whether
+    a session still exists; ended sessions are forgotten, with their spill files.
+    """
+
+    def __init__(self, session_budget=DEFAULT_SESSION_BUDGET, process_budget=DEFAULT_PROCESS_BUDGET,
+                 idle_seconds=DEFAULT_IDLE_SECONDS, sweep_interval=DEFAULT_SWEEP_INTERVAL, spill_dir=None, is_active=None,
+                 measure_interval=DEFAULT_MEASURE_INTERVAL):
+        self.session_budget = session_budget
+        self.process_budget = process_budget
+        self.idle_seconds = idle_seconds
+        self.measure_interval = measure_interval
+        self.is_active = is_active
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self.spill_dir = tempfile.mkdtemp(prefix="olive-sessions-", dir=spill_dir)  # This process's own files
+        self._lock = threading.Lock()
+        # session_id -> {"state", "bytes", "last_active", "spilled", "running_since", "measured_at", "lock"}
+        self._sessions = {}
+        self._stats = {"measurements": 0, "trims": 0, "evictions": 0, "rehydrations": 0, "bytes_freed": 0,
+                       "spilled_bytes": 0, "ended_sessions": 0, "skipped_running": 0}
+        if sweep_interval:
+            threading.Thread(target=self._loop, args=(sweep_interval,), name="session-memory-governor", daemon=True).start()
+
+    def _loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Session memory sweep failed")
+
+    def _spill_path(self, session_id):
+        return os.path.join(self.spill_dir, f"{session_id}.spill")
+
+    def _entry(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = self._sessions[session_id] = {"bytes": 0, "spilled": False, "running_since": None,
+                                                      "measured_at": 0.0, "lock": threading.Lock()}
+            return entry
+
+    def touch(self, session_id, state):
+        """Notes activity in a session, whose script is running until the next track()."""
+        entry = self._entry(session_id)
+        with entry["lock"]:  # Waits for an eviction in progress
+            entry["state"] = state  # A new run may hand out a new state wrapper
+            entry["last_active"] = entry["running_since"] = time.time()
+
+    def track(self, session_id, state):
+        """Notes the end of a run and measures the session (at most once per measure interval), dropping its
+        caches if it is over the per-session budget; returns the last measured size."""
+        entry = self._entry(session_id)
+        now = time.time()
+        with entry["lock"]:
+            entry["state"] = state
+            entry["last_active"] = now
+            entry["running_since"] = None
+            if now - entry["measured_at"] < self.measure_interval:
+                return entry["bytes"]
+            entry["measured_at"] = now
+        size = self._measure(state)
+        trimmed = size > self.session_budget
+        if trimmed:
+            self._drop(state, DROPPED_KEYS)
+            freed, size = size, self._measure(state)
+            freed -= size
+        with self._lock:
+            entry["bytes"] = size
+            self._stats["measurements"] += 1
+            if trimmed:
+                self._stats["trims"] += 1
+                self._stats["bytes_freed"] += freed
+        return size
+
+    @staticmethod
+    def _running(entry, now):
+        return entry["running_since"] is not None and now - entry["running_since"] < RUN_GRACE_SECONDS
+
+    def _measure(self, state):
+        return sum(estimate_bytes(value) for value in state.filtered_state.values())
+
+    @staticmethod
+    def _drop(state, keys):
+        for key in keys:
+            if key in state:
+                del state[key]
+
+    def rehydrate(self, session_id, state):
+        """Brings back the state spilled when the session was evicted; a no-op for resident sessions."""
+        if SPILL_MARKER not in state:
+            return False
+        with self._entry(session_id)["lock"]:
+            return self._rehydrate(session_id, state)
+
+    def _rehydrate(self, session_id, state):
+        if SPILL_MARKER not in state:
+            return False  # Restored by a concurrent run of the same session
+        path = state[SPILL_MARKER]
+        try:
+            with open(path, "rb") as f:
+                spilled = pickle.loads(zlib.decompress(f.read()))
+            os.remove(path)
+        except FileNotFoundError:
+            spilled = {}  # Already restored by a concurrent run of the same session
+        for key, value in spilled.items():
+            if key not in state:
+                state[key] = value
+        if SPILL_MARKER in state:
+            del state[SPILL_MARKER]
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry["spilled"] = False
+            self._stats["rehydrations"] += 1
+        return True
+
+    def evict(self, session_id):
+        """Spills a session's own state to disk and drops its caches, unless its script is running."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+        if entry is None:
+            return 0
+        with entry["lock"]:  # A run starting now waits in touch() or rehydrate() until the spill is complete
+            if entry["spilled"]:
+                return 0
+            if self._running(entry, time.time()):
+                with self._lock:
+                    self._stats["skipped_running"] += 1
+                return 0
+            entry["spilled"] = True
+            state, before = entry["state"], entry["bytes"]
+            spilled = {key: state[key] for key in SPILLED_KEYS if key in state}
+            data = zlib.compress(pickle.dumps(spilled, pickle.HIGHEST_PROTOCOL), SPILL_COMPRESSION_LEVEL)
+            path = self._spill_path(session_id)
+            with open(path, "wb") as f:
+                f.write(data)
+            state[SPILL_MARKER] = path
+            self._drop(state, SPILLED_KEYS + DROPPED_KEYS)
+            after = self._measure(state)
+        with self._lock:
+            entry["bytes"] = after
+            self._stats["evictions"] += 1
+            self._stats["bytes_freed"] += max(0, before - after)
+            self._stats["spilled_bytes"] += len(data)
+        return before - after
+
+    def sweep(self):
+        """Forgets ended sessions, evicts idle ones, then the least recently active until under the process budget."""
+        now = time.time()
+        with self._lock:
+            sessions = list(self._sessions.items())
+        resident = []
+        for session_id, entry in sessions:
+            if self.is_active is not None and not self.is_active(session_id):
+                with self._lock:
+                    self._sessions.pop(session_id, None)
+                    self._stats["ended_sessions"] += 1
+                if os.path.exists(self._spill_path(session_id)):
+                    os.remove(self._spill_path(session_id))
+            elif not entry["spilled"] and not self._running(entry, now):
+                if now - entry["last_active"] > self.idle_seconds:
+                    self.evict(session_id)
+                else:
+                    resident.append((entry["last_active"], session_id, entry["bytes"]))
+        total = sum(size for _, _, size in resident)
+        for _, session_id, size in sorted(resident):
+            if total <= self.process_budget:
+                break
+            total -= self.evict(session_id)
+
+    def stats(self):
+        """Returns session counts, resident and spilled bytes, and eviction counters."""
+        with self._lock:
+            resident = [entry for entry in self._sessions.values() if not entry["spilled"]]
+            return dict(self._stats, sessions=len(self._sessions), resident_sessions=len(resident),
+                        resident_bytes=sum(entry["bytes"] for entry in resident))
+
+
+def format_session_memory_stats(stats):
+    """Formats session memory stats for display."""
+    return (f"Session memory: {stats['resident_bytes'] / 2 ** 20:.1f} MiB in {stats['resident_sessions']}/{stats['sessions']} "
+            f"resident sessions · {stats['evictions']} evicted, {stats['rehydrations']} restored, {stats['trims']} trimmed")
@@ -0,0 +1,855 @@
+import base64
+import hashlib
+import json
+import logging
+import math
+import queue
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from message_search import DEFAULT_SEARCH_RESULTS, InvertedIndex, make_snippet, search_hit, tokenize
+
+# --- Conversation Storage ---
+# Durable home for chat/study histories. Subjects, progress and reminders live in the
+# versioned learner state (learner_state.py); the ones earlier versions saved here are
+# only read, once, to migrate those learners.
+# The app only keeps a bounded tail of each conversation in st.session_state and
+# loads older turns from here on demand. The SQLite (with shared = true) and Redis
+# backends can be shared by several worker processes. Older turns of cold
+# conversations can be compacted (compaction.py): they are replaced by a compressed
+# archive chunk plus a short "memory" summary, and decompressed again when read.
+
+DEFAULT_SQLITE_PATH = "chat_data.sqlite3"
+REDIS_KEY_PREFIX = "olive"
+WRITE_BATCH_SIZE = 200        # Max queued writes committed in one transaction
+WRITE_FLUSH_INTERVAL = 0.05   # Seconds the writer waits to gather more writes into a batch
+ARCHIVE_COMPRESSION_LEVEL = 6 # zlib level for archived messages
+FTS_OWNER_CHARS = 12          # Hex digits of the learner prefix on full-text indexed words
+
+logger = logging.getLogger(__name__)
+
+
+def connect_redis(url):
+    """Connects to a Redis-protocol server; the optional 'redis' package is only needed for this backend."""
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError("The redis storage backend needs the 'redis' package (pip install redis)")
+    return redis.Redis.from_url(url, decode_responses=True)
+
+
+def pack_messages(messages):
+    """Compresses messages for the archive."""
+    records = [{k: m[k] for k in ("id", "seq", "role", "content")} for m in messages]
+    return zlib.compress(json.dumps(records, separators=(",", ":")).encode("utf-8"), ARCHIVE_COMPRESSION_LEVEL)
+
+
+def unpack_messages(data):
+    """Decompresses an archive chunk back into messages."""
+    return json.loads(zlib.decompress(data))
+
+
+def _add_archived(messages, chunks, end, limit):
+    """Extends newest-first `messages` with archived ones older than seq `end`, from `chunks` (newest chunk first)."""
+    for chunk in chunks:
+        for message in reversed(chunk):
+            if limit is not None and len(messages) >= limit:
+                return messages
+            if end is None or message["seq"] < end:
+                messages.append(message)
+    return messages
+
+
+class ConversationStore:
+    """Interface shared by the storage backends. Every method is keyed by learner id."""
+
+    def load_subjects(self, user_id):
+        """Returns subjects saved before learner state existed; only read to migrate such learners."""
+        raise NotImplementedError
+
+    def append_message(self, user_id, subject_id, message, kind="chat"):
+        """Persists a message, assigning its per-conversation sequence number ("seq")."""
+        raise NotImplementedError
+
+    def load_messages(self, user_id, subject_id, kind="chat", limit=None, before_seq=None, include_archived=True):
+        """Returns messages in chronological order, optionally only the newest `limit` before `before_seq`.
+
+        Archived messages are decompressed as needed, or left out with include_archived=False.
+        """
+        raise NotImplementedError
+
+    def count_messages(self, user_id, subject_id, kind="chat"):
+        """Returns the number of messages, archived ones included."""
+        raise NotImplementedError
+
+    def append_messages(self, user_id, subject_id, messages, kind="chat"):
+        """Persists several messages of one conversation in order, e.g. when importing a learner's data."""
+        for message in messages:
+            self.append_message(user_id, subject_id, message, kind)
+
+    def iter_messages(self, user_id, subject_id, kind="chat", batch_size=500):
+        """Yields every message of a conversation, oldest first, loading `batch_size` at a time."""
+        total = self.count_messages(user_id, subject_id, kind)
+        for start in range(0, total, batch_size):
+            end = min(total, start + batch_size)
+            yield from self.load_messages(user_id, subject_id, kind, limit=end - start, before_seq=end)
+
+    def cold_conversations(self, idle_seconds, min_messages):
+        """Returns (user_id, subject_id, kind) of conversations without new messages for `idle_seconds`
+        and with at least `min_messages` messages, as compaction candidates."""
+        raise NotImplementedError
+
+    def archive_messages(self, user_id, subject_id, kind, memory, data):
+        """Replaces the live messages memory["first_seq"]..memory["last_seq"] with a packed archive chunk and its
+        memory record. Returns False if that chunk was already archived (e.g. by another worker)."""
+        raise NotImplementedError
+
+    def load_memories(self, user_id, subject_id, kind="chat"):
+        """Returns the memory records of a conversation's archived chunks, oldest first."""
+        raise NotImplementedError
+
+    def search_messages(self, user_id, query, limit=DEFAULT_SEARCH_RESULTS):
+        """Returns the learner's best matching messages across all conversations, as message_search hits."""
+        raise NotImplementedError
+
+    def load_reminders(self, user_id):
+        """Returns reminders saved before learner state existed; only read to migrate such learners."""
+        raise NotImplementedError
+
+    def load_progress(self, user_id):
+        """Returns progress saved before learner state existed; only read to migrate such learners."""
+        raise NotImplementedError
+
+    def clear_learning_data(self, user_id):
+        """Forgets histories and any legacy progress and reminders (legacy subjects are kept)."""
+        raise NotImplementedError
+
+    def flush(self):
+        """Blocks until all pending writes are durable."""
+
+    def close(self):
+        self.flush()
+
+
+class MemoryConversationStore(ConversationStore):
+    """Process-local backend; data is lost on restart. Useful for development."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subjects = {}
+        self._messages = {}
+        self._reminders = {}
+        self._progress = {}
+        self._last_active = {}  # (user_id, subject_id, kind) -> time of the last message
+        self._archives = {}     # (user_id, subject_id, kind) -> [(memory, packed messages)], oldest first
+        self._index = InvertedIndex()
+
+    def load_subjects(self, user_id):
+        with self._lock:
+            return [dict(s) for s in self._subjects.get(user_id, [])]
+
+    def append_message(self, user_id, subject_id, message, kind="chat"):
+        with self._lock:
+            messages = self._messages.setdefault((user_id, subject_id, kind), [])
+            message["seq"] = len(messages)
+            messages.append({k: message[k] for k in ("id", "seq", "role", "content")})
+            self._last_active[(user_id, subject_id, kind)] = time.time()
+        self._index.add(user_id, subject_id, kind, message["seq"], message["role"], message["content"])
+
+    def load_messages(self, user_id, subject_id, kind="chat", limit=None, before_seq=None, include_archived=True):
+        key = (user_id, subject_id, kind)
+        with self._lock:
+            messages = self._messages.get(key, [])  # Archived messages are None
+            end = len(messages) if before_seq is None else max(0, min(before_seq, len(messages)))
+            start = 0 if limit is None else max(0, end - limit)
+            loaded = messages[start:end]
+            if include_archived and None in loaded:
+                archived = {}
+                for memory, data in self._archives.get(key, []):
+                    if memory["first_seq"] < end and memory["last_seq"] >= start:
+                        archived.update((m["seq"], m) for m in unpack_messages(data))
+                loaded = [archived.get(start + i) if m is None else m for i, m in enumerate(loaded)]
+            return [dict(m) for m in loaded if m is not None]
+
+    def count_messages(self, user_id, subject_id, kind="chat"):
+        with self._lock:
+            return len(self._messages.get((user_id, subject_id, kind), []))
+
+    def cold_conversations(self, idle_seconds, min_messages):
+        cutoff = time.time() - idle_seconds
+        with self._lock:
+            return [key for key, last_active in self._last_active.items()
+                    if last_active < cutoff and len(self._messages.get(key, ())) >= min_messages]
+
+    def archive_messages(self, user_id, subject_id, kind, memory, data):
+        key = (user_id, subject_id, kind)
+        with self._lock:
+            archives = self._archives.setdefault(key, [])
+            if any(archived["first_seq"] == memory["first_seq"] for archived, _ in archives):
+                return False
+            archives.append((dict(memory), data))
+            messages = self._messages[key]
+            for seq in range(memory["first_seq"], memory["last_seq"] + 1):
+                messages[seq] = None
+            return True
+
+    def load_memories(self, user_id, subject_id, kind="chat"):
+        with self._lock:
+            return [dict(memory) for memory, _ in self._archives.get((user_id, subject_id, kind), [])]
+
+    def search_messages(self, user_id, query, limit=DEFAULT_SEARCH_RESULTS):
+        return self._index.search(user_id, query, limit)
+
+    def load_reminders(self, user_id):
+        with self._lock:
+            return [dict(r) for r in self._reminders.get(user_id, [])]
+
+    def load_progress(self, user_id):
+        with self._lock:
+            return dict(self._progress.get(user_id, {"lessons_completed": 0}))
+
+    def clear_learning_data(self, user_id):
+        with self._lock:
+            for key in [k for k in self._messages if k[0] == user_id]:
+                del self._messages[key]
+                self._last_active.pop(key, None)
+                self._archives.pop(key, None)
+            self._reminders.pop(user_id, None)
+            self._progress.pop(user_id, None)
+        self._index.remove_user(user_id)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subjects (
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    emoji TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (user_id, id)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    user_id TEXT NOT NULL,
+    subject_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (user_id, subject_id, kind, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_messages_user_subject_seq ON messages (user_id, subject_id, seq);
+CREATE TABLE IF NOT EXISTS reminders (
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user_id, id)
+);
+CREATE TABLE IF NOT EXISTS progress (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversation_seqs (
+    user_id TEXT NOT NULL,
+    subject_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    next_seq INTEGER NOT NULL,
+    PRIMARY KEY (user_id, subject_id, kind)
+);
+CREATE TABLE IF NOT EXISTS message_archive (
+    user_id TEXT NOT NULL,
+    subject_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    first_seq INTEGER NOT NULL,
+    last_seq INTEGER NOT NULL,
+    memory TEXT NOT NULL,
+    data BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (user_id, subject_id, kind, first_seq)
+) WITHOUT ROWID;
+"""
+
+# Last sequence number of a conversation, whether that message is live or archived
+_LAST_SEQ_SQL = (
+    "SELECT MAX(last_seq) FROM (SELECT MAX(seq) AS last_seq FROM messages WHERE user_id = ? AND subject_id = ? AND kind = ? "
+    "UNION ALL SELECT MAX(last_seq) FROM message_archive WHERE user_id = ? AND subject_id = ? AND kind = ?)"
+)
+
+# Full-text index over message content, kept up to date by a trigger in the same transaction as
+# each insert. Every indexed word carries a prefix derived from the learner id (fts_terms, registered
+# as an SQL function on each connection), so a learner's query only walks that learner's terms and
+# bm25 ranks by that learner's history, whatever the size of the deployment. Rows are still filtered
+# with user_id = ?, in case two learner ids share a prefix.
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE messages_fts USING fts5(
+    terms, content UNINDEXED, user_id UNINDEXED, subject_id UNINDEXED, kind UNINDEXED, seq UNINDEXED, role UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (terms, content, user_id, subject_id, kind, seq, role)
+    VALUES (fts_terms(new.user_id, new.content), new.content, new.user_id, new.subject_id, new.kind, new.seq, new.role);
+END;
+INSERT INTO messages_fts (terms, content, user_id, subject_id, kind, seq, role)
+    SELECT fts_terms(user_id, content), content, user_id, subject_id, kind, seq, role FROM messages;
+"""
+_FTS_WORD_RE = re.compile(r"[^\W_]+")  # Words as FTS5's unicode61 tokenizer splits them
+
+
+def _fts_owner(user_id):
+    return hashlib.sha1(user_id.encode()).hexdigest()[:FTS_OWNER_CHARS]
+
+
+def fts_terms(user_id, content):
+    """Returns the text indexed for a message: its words, each prefixed with the learner's prefix."""
+    owner = _fts_owner(user_id)
+    return " ".join(owner + word for word in _FTS_WORD_RE.findall(content.lower()))
+
+
+def _fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def fts_query(user_id, query):
+    """Builds an FTS5 query matching every word of `query` as a prefix of a word in the learner's messages."""
+    owner = _fts_owner(user_id)
+    words = _FTS_WORD_RE.findall(query.lower())
+    if not words:
+        return None
+    return f"terms : ({' '.join(_fts_phrase(owner + word) + '*' for word in words)})"
+
+
+class SQLiteConversationStore(ConversationStore):
+    """SQLite backend in WAL mode. Writes go through a write-behind queue and are committed in batches.
+
+    Message reads never wait for the writer: queued messages are kept in a pending buffer and merged into
+    the results. Only the reads off the render path (the pre-learner-state subjects, progress and reminders,
+    and compaction) flush the queue first.
+
+    With `shared`, message sequence numbers are allocated in the database instead of in this
+    process, so several workers can append to the same file on shared disk.
+    """
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, shared=False):
+        self.path = path
+        self.shared = shared
+        self._local = threading.local()  # One read connection per Streamlit session thread
+        self._seq_lock = threading.Lock()
+        self._next_seq = {}               # (user_id, subject_id, kind) -> next sequence number
+        self._queue = queue.Queue()
+        self._closed = False
+        # Messages queued but not committed yet, so reads see them without waiting for the writer
+        self._pending_lock = threading.Lock()
+        self._pending = {}                # (user_id, subject_id, kind) -> {seq: message}
+
+        connection = self._connect()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        connection.commit()
+        self.full_text_search = self._create_search_index(connection)
+
+        self._writer = threading.Thread(target=self._write_loop, name="conversation-store-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        connection.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL and much cheaper per commit
+        connection.create_function("fts_terms", 2, fts_terms, deterministic=True)  # Used by the index trigger
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _create_search_index(self, connection):
+        """Creates (and fills) the FTS5 index on first use; returns False if SQLite was built without FTS5."""
+        row = connection.execute("SELECT sql FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+        if row and "content UNINDEXED" in row["sql"]:
+            return True
+        # Indexes created before words were prefixed per learner are rebuilt
+        rebuild = "DROP TRIGGER IF EXISTS messages_fts_insert; DROP TABLE IF EXISTS messages_fts;" if row else ""
+        try:
+            connection.executescript("BEGIN IMMEDIATE;" + rebuild + SEARCH_SCHEMA + "COMMIT;")
+        except sqlite3.OperationalError as e:
+            connection.rollback()
+            if connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone():
+                return True  # Another worker created it at the same time
+            logger.warning("Full-text search index unavailable (%s); searching messages with LIKE instead", e)
+            return False
+        return True
+
+    def _reader(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    # --- Write-behind queue ---
+    def _enqueue(self, sql, params=(), many=False, pending=None):
+        """Queues a statement (with `many`, one statement run for every row of `params`).
+
+        `pending` is the (key, seqs) of the messages the statement inserts, dropped from the pending buffer
+        once it is written.
+        """
+        if self._closed:
+            raise RuntimeError("Conversation store is closed")
+        self._queue.put((sql, params, many, pending))
+
+    def _pending_messages(self, key):
+        """Returns a snapshot of a conversation's queued messages; take it before reading the database."""
+        with self._pending_lock:
+            return dict(self._pending.get(key, ()))
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.monotonic() + WRITE_FLUSH_INTERVAL
+            # Gather whatever else arrives shortly after, so a burst is committed once
+            while len(batch) < WRITE_BATCH_SIZE and isinstance(batch[-1], tuple):  # A flush or close commits right away
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._write_batch(connection, batch)
+            if any(item is None for item in batch):
+                connection.close()
+                return
+
+    @staticmethod
+    def _execute(connection, write):
+        sql, params, many, _ = write
+        if many:
+            connection.executemany(sql, params)
+        else:
+            connection.execute(sql, params)
+
+    def _commit(self, connection, writes):
+        """Commits the writes in one transaction, or one by one if that fails, dropping only the failing ones."""
+        try:
+            with connection:
+                for write in writes:
+                    self._execute(connection, write)
+            return
+        except sqlite3.Error:
+            # One bad statement (e.g. a seq taken by another worker) must not lose everyone else's writes
+            logger.warning("Failed to write a batch of %d statements, retrying them one by one", len(writes))
+        for write in writes:
+            try:
+                with connection:
+                    self._execute(connection, write)
+            except sqlite3.Error:
+                logger.exception("Dropped a queued statement that failed: %s", write[0])
+
+    def _write_batch(self, connection, batch):
+        flushed = [item for item in batch if isinstance(item, threading.Event)]
+        writes = [item for item in batch if isinstance(item, tuple)]
+        try:
+            self._commit(connection, writes)
+        finally:
+            with self._pending_lock:
+                for key, seqs in (item[3] for item in writes if item[3] is not None):
+                    messages = self._pending.get(key, {})
+                    for seq in seqs:
+                        messages.pop(seq, None)
+                    if not messages:
+                        self._pending.pop(key, None)
+            for event in flushed:
+                event.set()  # Never leave a flush() waiting, even if the batch failed
+
+    def flush(self):
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+
+    # --- Legacy subjects (read to migrate) ---
+    def load_subjects(self, user_id):
+        self.flush()
+        rows = self._reader().execute(
+            "SELECT id, name, emoji FROM subjects WHERE user_id = ? ORDER BY position", (user_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    # --- Messages ---
+    def _take_seq(self, user_id, subject_id, kind, count=1):
+        """Allocates `count` consecutive sequence numbers and returns the first."""
+        key = (user_id, subject_id, kind)
+        if self.shared:
+            # One short write transaction per allocation; the counter starts after any existing rows
+            connection = self._reader()
+            with connection:
+                row = connection.execute(
+                    "INSERT INTO conversation_seqs (user_id, subject_id, kind, next_seq) VALUES (?, ?, ?, "
+                    f"COALESCE(({_LAST_SEQ_SQL}), -1) + 1 + ?) "
+                    "ON CONFLICT (user_id, subject_id, kind) DO UPDATE SET next_seq = next_seq + ? "
+                    "RETURNING next_seq - ?",
+                    key + key + key + (count, count, count),
+                ).fetchone()
+            return row[0]
+        with self._seq_lock:
+            if key not in self._next_seq:
+                row = self._reader().execute(_LAST_SEQ_SQL, key + key).fetchone()
+                self._next_seq[key] = 0 if row[0] is None else row[0] + 1
+            seq = self._next_seq[key]
+            self._next_seq[key] = seq + count
+            return seq
+
+    def _add_pending(self, key, messages):
+        with self._pending_lock:
+            pending = self._pending.setdefault(key, {})
+            for message in messages:
+                pending[message["seq"]] = {k: message[k] for k in ("id", "seq", "role", "content")}
+        return key, [message["seq"] for message in messages]
+
+    def append_message(self, user_id, subject_id, message, kind="chat"):
+        message["seq"] = self._take_seq(user_id, subject_id, kind)
+        self._enqueue(
+            "INSERT INTO messages (user_id, subject_id, kind, seq, id, role, content, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id, subject_id, kind, message["seq"], message["id"], message["role"], message["content"], time.time()),
+            pending=self._add_pending((user_id, subject_id, kind), [message]),
+        )
+
+    def append_messages(self, user_id, subject_id, messages, kind="chat"):
+        if not messages:
+            return
+        # One sequence block (one transaction in shared mode) and one queued statement for the whole batch
+        first_seq = self._take_seq(user_id, subject_id, kind, len(messages))
+        now = time.time()
+        rows = []
+        for offset, message in enumerate(messages):
+            message["seq"] = first_seq + offset
+            rows.append((user_id, subject_id, kind, message["seq"], message["id"], message["role"], message["content"], now))
+        self._enqueue(
+            "INSERT INTO messages (user_id, subject_id, kind, seq, id, role, content, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows, many=True, pending=self._add_pending((user_id, subject_id, kind), messages),
+        )
+
+    def load_messages(self, user_id, subject_id, kind="chat", limit=None, before_seq=None, include_archived=True):
+        # Queued appends come from the pending buffer instead of flushing the writer. The snapshot is taken
+        # first: a message committed after it is then in the database read below (and may be in both).
+        pending = self._pending_messages((user_id, subject_id, kind))
+        messages = self._load_committed(user_id, subject_id, kind, limit, before_seq, include_archived)
+        pending = [message for seq, message in pending.items() if before_seq is None or seq < before_seq]
+        if not pending:
+            return messages
+        window = {message["seq"]: message for message in messages}
+        window.update((message["seq"], dict(message)) for message in pending)
+        messages = [window[seq] for seq in sorted(window)]
+        return messages if limit is None else messages[-limit:]
+
+    def _load_committed(self, user_id, subject_id, kind, limit, before_seq, include_archived):
+        sql = "SELECT id, seq, role, content FROM messages WHERE user_id = ? AND subject_id = ? AND kind = ?"
+        params = [user_id, subject_id, kind]
+        if before_seq is not None:
+            sql += " AND seq < ?"
+            params.append(before_seq)
+        sql += " ORDER BY seq DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        messages = [dict(row) for row in self._reader().execute(sql, params).fetchall()]
+        if include_archived and (limit is None or len(messages) < limit):
+            # Archived messages all come before the live ones
+            end = messages[-1]["seq"] if messages else before_seq
+            if end is None or end > 0:
+                messages = _add_archived(messages, self._archive_chunks(user_id, subject_id, kind, end), end, limit)
+        return messages[::-1]
+
+    def _archive_chunks(self, user_id, subject_id, kind, end):
+        """Yields unpacked archive chunks with messages before seq `end`, newest first."""
+        sql = "SELECT data FROM message_archive WHERE user_id = ? AND subject_id = ? AND kind = ?"
+        params = [user_id, subject_id, kind]
+        if end is not None:
+            sql += " AND first_seq < ?"
+            params.append(end)
+        for row in self._reader().execute(sql + " ORDER BY first_seq DESC", params):
+            yield unpack_messages(row["data"])
+
+    def count_messages(self, user_id, subject_id, kind="chat"):
+        # Sequence numbers are dense, so the next one is also the message count
+        key = (user_id, subject_id, kind)
+        with self._seq_lock:
+            if key in self._next_seq:
+                return self._next_seq[key]
+        pending = self._pending_messages(key)
+        row = self._reader().execute(_LAST_SEQ_SQL, key + key).fetchone()
+        return max([-1 if row[0] is None else row[0], *pending]) + 1
+
+    def cold_conversations(self, idle_seconds, min_messages):
+        self.flush()
+        rows = self._reader().execute(
+            "SELECT user_id, subject_id, kind FROM messages GROUP BY user_id, subject_id, kind "
+            "HAVING MAX(created_at) < ? AND COUNT(*) >= ?",
+            (time.time() - idle_seconds, min_messages),
+        ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def archive_messages(self, user_id, subject_id, kind, memory, data):
+        self.flush()
+        connection = self._reader()
+        try:
+            # One transaction, so readers see either the live messages or the archive chunk
+            with connection:
+                connection.execute(
+                    "INSERT INTO message_archive (user_id, subject_id, kind, first_seq, last_seq, memory, data, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (user_id, subject_id, kind, memory["first_seq"], memory["last_seq"], json.dumps(memory), data, time.time()),
+                )
+                connection.execute(
+                    "DELETE FROM messages WHERE user_id = ? AND subject_id = ? AND kind = ? AND seq BETWEEN ? AND ?",
+                    (user_id, subject_id, kind, memory["first_seq"], memory["last_seq"]),
+                )
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def load_memories(self, user_id, subject_id, kind="chat"):
+        # Archive chunks are written synchronously by archive_messages, so nothing queued can be missing
+        rows = self._reader().execute(
+            "SELECT memory FROM message_archive WHERE user_id = ? AND subject_id = ? AND kind = ? ORDER BY first_seq",
+            (user_id, subject_id, kind),
+        ).fetchall()
+        return [json.loads(row["memory"]) for row in rows]
+
+    def search_messages(self, user_id, query, limit=DEFAULT_SEARCH_RESULTS):
+        match = fts_query(user_id, query)
+        if match is None:
+            return []
+        terms = tuple(tokenize(query))
+        # Queued messages (the last few turns) are matched here, the same way FTS matches prefixes
+        with self._pending_lock:
+            pending = [(key, message) for key, messages in self._pending.items() if key[0] == user_id
+                       for message in messages.values()]
+        hits = {}
+        for (_, subject_id, kind), message in pending:
+            tokens = tokenize(message["content"])
+            if all(any(token.startswith(term) for token in tokens) for term in terms):
+                hits[(subject_id, kind, message["seq"])] = search_hit(subject_id, kind, message["seq"], message["role"],
+                                                                      make_snippet(message["content"], terms), 0.0)
+        if self.full_text_search:
+            rows = self._reader().execute(
+                "SELECT subject_id, kind, seq, role, content, bm25(messages_fts) AS score FROM messages_fts "
+                "WHERE messages_fts MATCH ? AND user_id = ? ORDER BY score LIMIT ?",
+                (match, user_id, limit),
+            ).fetchall()
+            found = [search_hit(row["subject_id"], row["kind"], row["seq"], row["role"], make_snippet(row["content"], terms),
+                                -row["score"]) for row in rows]
+        else:
+            sql = "SELECT subject_id, kind, seq, role, content FROM messages WHERE user_id = ?"
+            sql += " AND content LIKE ? ESCAPE '\\'" * len(terms) + " ORDER BY seq DESC LIMIT ?"
+            patterns = ["%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%" for term in terms]
+            rows = self._reader().execute(sql, (user_id, *patterns, limit)).fetchall()
+            found = [search_hit(row["subject_id"], row["kind"], row["seq"], row["role"], make_snippet(row["content"], terms), 0.0) for row in rows]
+        for hit in found:
+            hits.setdefault((hit["subject_id"], hit["kind"], hit["seq"]), hit)
+        return list(hits.values())[:limit]
+
+    # --- Legacy reminders and progress (read to migrate) ---
+    def load_reminders(self, user_id):
+        self.flush()
+        rows = self._reader().execute(
+            "SELECT data FROM reminders WHERE user_id = ? ORDER BY position", (user_id,)
+        ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def load_progress(self, user_id):
+        self.flush()
+        row = self._reader().execute("SELECT data FROM progress WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row["data"]) if row else {"lessons_completed": 0}
+
+    def clear_learning_data(self, user_id):
+        with self._seq_lock:
+            for key in [k for k in self._next_seq if k[0] == user_id]:
+                del self._next_seq[key]
+            # Queued under the lock so no new append can slip in between with a stale seq
+            self._enqueue("DELETE FROM messages WHERE user_id = ?", (user_id,))
+            self._enqueue("DELETE FROM message_archive WHERE user_id = ?", (user_id,))
+            self._enqueue("DELETE FROM conversation_seqs WHERE user_id = ?", (user_id,))
+            if self.full_text_search:
+                self._enqueue("DELETE FROM messages_fts WHERE user_id = ?", (user_id,))
+        self._enqueue("DELETE FROM reminders WHERE user_id = ?", (user_id,))
+        self._enqueue("DELETE FROM progress WHERE user_id = ?", (user_id,))
+        self.flush()
+
+
+class RedisConversationStore(ConversationStore):
+    """Backend on a Redis-protocol server (Redis, Valkey, KeyDB, ...), shared by every worker.
+
+    Each conversation is a list, so a message's sequence number is its index and RPUSH allocates it atomically.
+    Search uses a per-learner inverted index of sets ("<kind>|<seq>|<subject_id>" per word). Archived messages
+    are left in the list as empty strings, to keep the indexes; their chunks live in a hash per conversation.
+    """
+
+    def __init__(self, url):
+        self._client = connect_redis(url)
+
+    def _key(self, user_id, *parts):
+        return ":".join((REDIS_KEY_PREFIX, user_id) + parts)
+
+    def _activity_key(self):
+        return f"{REDIS_KEY_PREFIX}:activity"  # Sorted set: conversation key -> time of its last message
+
+    # --- Legacy subjects (read to migrate) ---
+    def load_subjects(self, user_id):
+        return [json.loads(s) for s in self._client.lrange(self._key(user_id, "subjects"), 0, -1)]
+
+    # --- Messages ---
+    def append_message(self, user_id, subject_id, message, kind="chat"):
+        key = self._key(user_id, "messages", kind, subject_id)
+        pipeline = self._client.pipeline()
+        pipeline.rpush(key, json.dumps({k: message[k] for k in ("id", "role", "content")}))
+        pipeline.sadd(self._key(user_id, "conversations"), key)  # So clear_learning_data can find it
+        pipeline.zadd(self._activity_key(), {key: time.time()})
+        length = pipeline.execute()[0]
+        message["seq"] = length - 1
+        tokens = set(tokenize(message["content"]))
+        if tokens:
+            reference = f"{kind}|{message['seq']}|{subject_id}"
+            pipeline = self._client.pipeline()
+            for token in tokens:
+                pipeline.sadd(self._key(user_id, "words", token), reference)
+            pipeline.sadd(self._key(user_id, "vocabulary"), *tokens)
+            pipeline.execute()
+
+    def append_messages(self, user_id, subject_id, messages, kind="chat"):
+        if not messages:
+            return
+        key = self._key(user_id, "messages", kind, subject_id)
+        pipeline = self._client.pipeline()
+        pipeline.rpush(key, *(json.dumps({k: m[k] for k in ("id", "role", "content")}) for m in messages))
+        pipeline.sadd(self._key(user_id, "conversations"), key)
+        pipeline.zadd(self._activity_key(), {key: time.time()})
+        length = pipeline.execute()[0]
+        pipeline = self._client.pipeline()
+        vocabulary = set()
+        for offset, message in enumerate(messages):
+            message["seq"] = length - len(messages) + offset
+            tokens = set(tokenize(message["content"]))
+            vocabulary |= tokens
+            for token in tokens:
+                pipeline.sadd(self._key(user_id, "words", token), f"{kind}|{message['seq']}|{subject_id}")
+        if vocabulary:
+            pipeline.sadd(self._key(user_id, "vocabulary"), *vocabulary)
+            pipeline.execute()
+
+    def load_messages(self, user_id, subject_id, kind="chat", limit=None, before_seq=None, include_archived=True):
+        key = self._key(user_id, "messages", kind, subject_id)
+        length = self._client.llen(key)
+        end = length if before_seq is None else max(0, min(before_seq, length))
+        start = 0 if limit is None else max(0, end - limit)
+        if end <= start:
+            return []
+        entries = self._client.lrange(key, start, end - 1)
+        archived = {}
+        if include_archived and "" in entries:
+            for first_seq, data in self._client.hgetall(self._key(user_id, "archive", kind, subject_id)).items():
+                if int(first_seq) < end:
+                    archived.update((m["seq"], m) for m in unpack_messages(base64.b64decode(data)) if m["seq"] >= start)
+        messages = []
+        for i, data in enumerate(entries):
+            if data:
+                messages.append(dict(json.loads(data), seq=start + i))
+            elif start + i in archived:
+                messages.append(archived[start + i])
+        return messages
+
+    def count_messages(self, user_id, subject_id, kind="chat"):
+        return self._client.llen(self._key(user_id, "messages", kind, subject_id))
+
+    def cold_conversations(self, idle_seconds, min_messages):
+        conversations = []
+        for key in self._client.zrangebyscore(self._activity_key(), "-inf", time.time() - idle_seconds):
+            user_id, _, kind, subject_id = key[len(REDIS_KEY_PREFIX) + 1:].rsplit(":", 3)  # Subject ids have no ":"
+            if self._client.llen(key) >= min_messages:
+                conversations.append((user_id, subject_id, kind))
+        return conversations
+
+    def archive_messages(self, user_id, subject_id, kind, memory, data):
+        archive = self._key(user_id, "archive", kind, subject_id)
+        if not self._client.hsetnx(archive, memory["first_seq"], base64.b64encode(data).decode("ascii")):
+            return False  # Binary-safe as base64, since the client decodes responses as text
+        memories = self._key(user_id, "memories", kind, subject_id)
+        messages = self._key(user_id, "messages", kind, subject_id)
+        pipeline = self._client.pipeline(transaction=True)
+        for seq in range(memory["first_seq"], memory["last_seq"] + 1):
+            pipeline.lset(messages, seq, "")
+        pipeline.rpush(memories, json.dumps(memory))
+        pipeline.sadd(self._key(user_id, "conversations"), archive, memories)
+        pipeline.execute()
+        return True
+
+    def load_memories(self, user_id, subject_id, kind="chat"):
+        memories = self._client.lrange(self._key(user_id, "memories", kind, subject_id), 0, -1)
+        return sorted((json.loads(m) for m in memories), key=lambda memory: memory["first_seq"])
+
+    def search_messages(self, user_id, query, limit=DEFAULT_SEARCH_RESULTS):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        vocabulary = self._client.smembers(self._key(user_id, "vocabulary"))
+        references = None
+        for term in terms:
+            words = [word for word in vocabulary if word.startswith(term)]  # Prefix matching
+            matched = self._client.sunion([self._key(user_id, "words", word) for word in words]) if words else set()
+            references = matched if references is None else references & matched
+            if not references:
+                return []
+        # Newest messages first; only the best `limit` are fetched and ranked by how often the words occur
+        candidates = sorted((ref.split("|", 2) for ref in references), key=lambda ref: -int(ref[1]))[:limit * 5]
+        pipeline = self._client.pipeline()
+        for kind, seq, subject_id in candidates:
+            pipeline.lindex(self._key(user_id, "messages", kind, subject_id), int(seq))
+        hits = []
+        for (kind, seq, subject_id), data in zip(candidates, pipeline.execute()):
+            if not data:
+                continue  # Gone, or archived
+            message = json.loads(data)
+            tokens = tokenize(message["content"])
+            score = sum(token.startswith(tuple(terms)) for token in tokens) / math.sqrt(len(tokens) or 1)
+            hits.append(search_hit(subject_id, kind, int(seq), message["role"], make_snippet(message["content"], tuple(terms)), score))
+        return sorted(hits, key=lambda hit: -hit["score"])[:limit]
+
+    # --- Legacy reminders and progress (read to migrate) ---
+    def load_reminders(self, user_id):
+        return [json.loads(r) for r in self._client.lrange(self._key(user_id, "reminders"), 0, -1)]
+
+    def load_progress(self, user_id):
+        data = self._client.get(self._key(user_id, "progress"))
+        return json.loads(data) if data else {"lessons_completed": 0}
+
+    def clear_learning_data(self, user_id):
+        conversations = self._key(user_id, "conversations")
+        vocabulary = self._key(user_id, "vocabulary")
+        words = [self._key(user_id, "words", word) for word in self._client.smembers(vocabulary)]
+        keys = self._client.smembers(conversations)
+        if keys:
+            self._client.zrem(self._activity_key(), *keys)
+        self._client.delete(*keys, *words, conversations, vocabulary,
+                            self._key(user_id, "reminders"), self._key(user_id, "progress"))
+
+
+def create_conversation_store(backend="sqlite", path=DEFAULT_SQLITE_PATH, url=None, shared=False):
+    """Builds the configured storage backend ("sqlite", "memory" or "redis")."""
+    if backend == "sqlite":
+        return SQLiteConversationStore(path, shared=shared)
+    if backend == "memory":
+        return MemoryConversationStore()
+    if backend == "redis":
+        return RedisConversationStore(url)
+    raise ValueError(f"Unknown storage backend: {backend!r}")
@@ -0,0 +1,84 @@
+import time
+
+# --- Batched Streaming Renderer ---
+# Collects streamed chunks in a list and only pushes the accumulated text to the
+# placeholder every few milliseconds or tokens, instead of on every chunk.
+
+DEFAULT_FLUSH_INTERVAL_MS = 80  # Redraw at most ~12 times per second
+DEFAULT_FLUSH_EVERY_TOKENS = 24 # ...or sooner once this many tokens are waiting
+STREAM_CURSOR = "▌"
+
+
+class StreamRenderer:
+    """Renders a streamed completion into a Streamlit placeholder in batches."""
+
+    def __init__(self, placeholder, flush_interval_ms=DEFAULT_FLUSH_INTERVAL_MS, flush_every_tokens=DEFAULT_FLUSH_EVERY_TOKENS):
+        self.placeholder = placeholder
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_every_tokens = flush_every_tokens
+        self.parts = []           # Every chunk received so far, joined only when flushing
+        self.pending_tokens = 0   # Chunks received since the last flush
+        self.tokens = 0
+        self.flushes = 0
+        # Create the renderer right before sending the request so TTFT includes upstream latency
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+        self.last_flush_at = self.started_at
+
+    def write(self, text):
+        """Buffers a chunk of text, flushing if the time or token threshold is reached."""
+        if not text:
+            return
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.parts.append(text)
+        self.tokens += 1
+        self.pending_tokens += 1
+        if self.pending_tokens >= self.flush_every_tokens or now - self.last_flush_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self, final=False):
+        """Pushes the accumulated text to the placeholder."""
+        text = "".join(self.parts)
+        self.placeholder.markdown(text if final else text + STREAM_CURSOR)
+        self.pending_tokens = 0
+        self.flushes += 1
+        self.last_flush_at = time.perf_counter()
+        return text
+
+    def finish(self):
+        """Renders the final text without the cursor and returns it."""
+        self.finished_at = time.perf_counter()
+        return self.flush(final=True)
+
+    def render(self, chunks):
+        """Consumes text chunks (live or replayed from the cache) and returns the full response text."""
+        for text in chunks:
+            self.write(text)
+        return self.finish()
+
+    @property
+    def stats(self):
+        """Time-to-first-token and throughput of the rendered response."""
+        finished_at = self.finished_at or time.perf_counter()
+        ttft = self.first_token_at - self.started_at if self.first_token_at else None
+        generation_time = finished_at - self.first_token_at if self.first_token_at else 0
+        return {
+            "ttft": ttft,
+            "total": finished_at - self.started_at,
+            "tokens": self.tokens,
+            "tokens_per_sec": self.tokens / generation_time if generation_time > 0 else None,
+            "flushes": self.flushes,
+        }
+
+
+def format_stream_stats(stats):
+    """Formats streaming stats for display under the chat."""
+    if not stats or stats["ttft"] is None:
+        return ""
+    text = f"First token in {stats['ttft']:.2f}s"
+    if stats["tokens_per_sec"]:
+        text += f" · {stats['tokens_per_sec']:.0f} tokens/s"
+    return text
@@ -0,0 +1,102 @@
+import pytest
+
+from compaction import Compactor, format_memories, prepare_chunk, summarize_locally
+from storage import MemoryConversationStore, SQLiteConversationStore, unpack_messages
+from transcript import new_message
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = MemoryConversationStore() if request.param == "memory" else SQLiteConversationStore(str(tmp_path / "chat.sqlite3"))
+    yield store
+    store.close()
+
+
+def _lesson(count):
+    messages = []
+    for i in range(count):
+        if i % 2 == 0:
+            messages.append(new_message("user", f"Why do volcanoes erupt, question {i}?"))
+        else:
+            messages.append(new_message("assistant", f"Magma rises because it is lighter than the rock around it. Note {i}."))
+    return messages
+
+
+def _compactor(store, **kwargs):
+    return Compactor(store, **dict(dict(idle_seconds=0, keep_messages=4, chunk_messages=10, min_chunk_messages=5,
+                                        processes=0), **kwargs))
+
+
+def test_prepare_chunk_packs_and_indexes_messages():
+    messages = [{"id": m["id"], "seq": i + 7, "role": m["role"], "content": m["content"]} for i, m in enumerate(_lesson(6))]
+    chunk = prepare_chunk(messages)
+    assert (chunk["first_seq"], chunk["last_seq"], chunk["messages"]) == (7, 12, 6)
+    assert unpack_messages(chunk["data"]) == messages
+    assert chunk["archive_bytes"] == len(chunk["data"])
+    assert {"volcanoes", "magma"} <= set(chunk["keywords"])
+    assert chunk["transcript"].splitlines()[:2] == ["Learner: Why do volcanoes erupt, question 0?",
+                                                    "Tutor: Magma rises because it is lighter than the rock around it. Note 1."]
+
+
+def test_local_summary_prefers_the_learners_questions():
+    messages = [{"role": "user", "content": "How do volcanoes form? I like rocks."},
+                {"role": "assistant", "content": "Volcanoes form where magma reaches the surface. Nice weather today."}]
+    summary = summarize_locally(messages, ["volcanoes", "magma"], sentences=2)
+    assert summary.splitlines() == ["- Learner asked: How do volcanoes form?",
+                                    "- Tutor said: Volcanoes form where magma reaches the surface.",
+                                    "- Topics: volcanoes, magma"]
+
+
+def test_format_memories_keeps_the_newest_that_fit():
+    memories = [{"summary": f"memory {i}", "tokens": 10} for i in range(5)]
+    assert format_memories(memories, 25) == "memory 3\nmemory 4"
+    assert format_memories(memories[:1], 5) == "memory 0"  # The newest memory is always kept
+    assert format_memories([], 100) is None
+
+
+def test_run_archives_older_turns_behind_a_model_summary(store):
+    store.append_messages("learner-1", "science", _lesson(26))
+    transcripts = []
+    compactor = _compactor(store, summarize=lambda transcript: transcripts.append(transcript) or "- Asked about volcanoes")
+    report = compactor.run()
+    # 22 archivable messages: two chunks of 10; the last 2 stay live with the 4 kept ones
+    assert (report["conversations"], report["chunks"], report["messages"]) == (1, 2, 20)
+    assert (report["model_summaries"], report["local_summaries"]) == (2, 0)
+    assert report["tokens_saved"] > 0
+    memories = store.load_memories("learner-1", "science")
+    assert [(m["first_seq"], m["last_seq"], m["summary"]) for m in memories] == [
+        (0, 9, "- Asked about volcanoes"), (10, 19, "- Asked about volcanoes")]
+    assert len(transcripts) == 2
+    assert [m["seq"] for m in store.load_messages("learner-1", "science", include_archived=False)] == list(range(20, 26))
+    assert [m["seq"] for m in store.load_messages("learner-1", "science")] == list(range(26))  # Scrolling back still works
+    assert compactor.run()["chunks"] == 0  # Nothing left to compact
+    assert compactor.stats()["runs"] == 2
+
+
+def test_failing_model_summaries_fall_back_to_local_ones(store):
+    store.append_messages("learner-1", "science", _lesson(15))
+
+    def summarize(transcript):
+        raise ConnectionError("model unavailable")
+
+    report = _compactor(store, summarize=summarize).run()
+    assert (report["chunks"], report["model_summaries"], report["local_summaries"]) == (1, 0, 1)
+    [memory] = store.load_memories("learner-1", "science")
+    assert memory["source"] == "local" and "- Topics: " in memory["summary"]
+
+
+def test_active_and_short_conversations_are_left_alone(store):
+    store.append_messages("learner-1", "science", _lesson(30))
+    store.append_messages("learner-2", "science", _lesson(8))
+    assert _compactor(store, idle_seconds=3600).run()["chunks"] == 0
+    report = _compactor(store).run()
+    assert report["conversations"] == 1
+    assert store.load_memories("learner-2", "science") == []
+
+
+def test_chunks_are_prepared_in_worker_processes():
+    store = MemoryConversationStore()
+    store.append_messages("learner-1", "science", _lesson(26))
+    report = _compactor(store, processes=1).run()
+    assert (report["chunks"], report["local_summaries"]) == (2, 2)
+    assert [m["seq"] for m in store.load_messages("learner-1", "science")] == list(range(26))
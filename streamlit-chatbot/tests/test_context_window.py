@@ -0,0 +1,65 @@
+from context_window import MESSAGE_OVERHEAD_TOKENS, ContextWindow, count_tokens, message_tokens
+
+
+def _history(count, words=40):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "word " * words, "seq": i}
+            for i in range(count)]
+
+
+def test_count_tokens_rounds_up():
+    assert count_tokens("") == 0
+    assert count_tokens("abc") == 1
+    assert count_tokens("abcde") == 2
+
+
+def test_message_tokens_is_cached_on_the_message():
+    message = {"role": "user", "content": "x" * 40}
+    assert message_tokens(message) == 10 + MESSAGE_OVERHEAD_TOKENS
+    message["content"] = ""
+    assert message_tokens(message) == 10 + MESSAGE_OVERHEAD_TOKENS
+
+
+def test_short_history_is_sent_whole():
+    window = ContextWindow()
+    history = _history(4)
+    messages = window.build(history, system_prompt="Be brief.")
+    assert messages[0] == {"role": "system", "content": "Be brief."}
+    assert [m["content"] for m in messages[1:]] == [m["content"] for m in history]
+    assert window.last_usage["folded_messages"] == 0
+
+
+def test_long_history_stays_in_budget_and_folds_older_turns():
+    window = ContextWindow(budget=400, summary_budget=100)
+    history = _history(40)
+    messages = window.build(history, system_prompt="Be brief.")
+    usage = window.last_usage
+    assert usage["total"] <= usage["budget"]
+    assert messages[-1]["content"] == history[-1]["content"]
+    assert messages[1]["content"].startswith("Summary of the earlier conversation:")
+    assert usage["kept_messages"] + usage["folded_messages"] == len(history)
+    assert window.summary_tokens + MESSAGE_OVERHEAD_TOKENS <= window.summary_budget
+
+
+def test_last_message_is_kept_even_over_budget():
+    window = ContextWindow(budget=50, summary_budget=10)
+    history = [{"role": "user", "content": "word " * 500, "seq": 0}]
+    assert window.build(history)[-1]["content"] == history[0]["content"]
+
+
+def test_folding_resumes_from_sequence_numbers():
+    window = ContextWindow(budget=400, summary_budget=100)
+    history = _history(40)
+    window.build(history)
+    folded = window.folded
+    # Only the in-memory tail is passed on the next turn; already folded turns are not folded again
+    window.build(history[-10:] + _history(42)[40:])
+    assert window.folded >= folded
+    assert window.last_usage["kept_messages"] + window.folded == 42
+
+
+def test_cleared_history_resets_the_summary():
+    window = ContextWindow(budget=400, summary_budget=100)
+    window.build(_history(40))
+    window.build(_history(1))
+    assert window.folded == 0
+    assert window.summary_lines == []
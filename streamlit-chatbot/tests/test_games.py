@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from games import (RPS_COUNTER, RPS_MOVES, TTT_FULL, ConnectFourEngine, c4_aligned, c4_cells, c4_play, guess_hint,
+                   guess_limit, rps_bot_move, rps_result, ttt_winner)
+
+
+@pytest.fixture(scope="module")
+def ttt():
+    from games import TicTacToeEngine
+    return TicTacToeEngine()
+
+
+class _NoMistakes(random.Random):
+    """Never rolls the random move that weaker levels play sometimes."""
+
+    def random(self):
+        return 0.99
+
+
+@pytest.fixture(scope="module")
+def c4():
+    return ConnectFourEngine()
+
+
+def _bot_never_loses(engine, bot, learner, bot_to_move):
+    """Plays every possible learner move against the Hard bot; False if any line of play lets the learner win."""
+    if ttt_winner(bot, learner)[0] is not None:
+        return ttt_winner(bot, learner)[0] != "O"  # The learner's stones are passed as O
+    if bot_to_move:
+        cell = engine.best_move(bot, learner)
+        return _bot_never_loses(engine, bot | 1 << cell, learner, False)
+    free = [cell for cell in range(9) if not (bot | learner) >> cell & 1]
+    return all(_bot_never_loses(engine, bot, learner | 1 << cell, True) for cell in free)
+
+
+def test_ttt_winner():
+    assert ttt_winner(0b111, 0b11000) == ("X", 0b111)
+    assert ttt_winner(0b11000, 0b100_100_100) == ("O", 0b100_100_100)
+    assert ttt_winner(0b010_110_001, TTT_FULL ^ 0b010_110_001) == ("draw", 0)
+    assert ttt_winner(0, 0) == (None, 0)
+
+
+@pytest.mark.parametrize("bot_first", [True, False])
+def test_hard_ttt_bot_never_loses(ttt, bot_first):
+    assert _bot_never_loses(ttt, 0, 0, bot_first)
+
+
+def _c4_position(columns):
+    position = mask = 0
+    for column in columns:
+        position, mask = c4_play(position, mask, column)
+    return position, mask, len(columns)
+
+
+@pytest.mark.parametrize("difficulty", ["Medium", "Hard"])
+def test_c4_bot_takes_a_winning_move(c4, difficulty):
+    position, mask, moves = _c4_position([3, 4, 3, 4, 3, 6])
+    assert c4.best_move(position, mask, moves, difficulty, _NoMistakes(1)) == 3
+
+
+@pytest.mark.parametrize("difficulty", ["Medium", "Hard"])
+def test_c4_bot_blocks_a_winning_threat(c4, difficulty):
+    position, mask, moves = _c4_position([6, 0, 5, 0, 6, 0])
+    assert c4.best_move(position, mask, moves, difficulty, _NoMistakes(1)) == 0
+
+
+def test_c4_board_helpers():
+    position, mask, moves = _c4_position([3, 4, 3, 4, 3, 4, 3])
+    assert c4_aligned(position ^ mask)  # The player who just moved has four in column 3
+    cells = c4_cells(position, mask, moves)
+    assert [row[3] for row in cells[-4:]] == [1, 1, 1, 1]
+    assert [row[4] for row in cells[-3:]] == [2, 2, 2]
+
+
+def test_guess_the_number():
+    assert guess_limit(100) == 7 + 2
+    assert [guess_hint(42, guess) for guess in (10, 50, 42)] == ["higher", "lower", "correct"]
+
+
+def test_rps_result():
+    assert rps_result("rock", "scissors") == "win"
+    assert rps_result("rock", "paper") == "lose"
+    assert rps_result("paper", "paper") == "draw"
+
+
+def _counter_rate(difficulty, history, rounds=4000):
+    rng = random.Random(7)
+    counter = RPS_COUNTER[history[-1]]
+    return sum(rps_bot_move(history, difficulty, rng) == counter for _ in range(rounds)) / rounds
+
+
+def test_rps_levels_differ():
+    history = ["rock"] * 10  # A learner who always plays rock
+    easy, medium, hard = (_counter_rate(level, history) for level in ("Easy", "Medium", "Hard"))
+    assert easy == pytest.approx(1 / 3, abs=0.04)  # Pure chance
+    assert medium == pytest.approx(0.5 + 0.5 / 3, abs=0.04)  # Exploits the favourite move half of the time
+    assert hard == 1.0
+
+
+def test_hard_rps_bot_learns_sequences():
+    history = ["rock", "paper", "scissors"] * 5 + ["rock", "paper"]
+    assert rps_bot_move(history, "Hard", random.Random(1)) == RPS_COUNTER["scissors"]
+    assert rps_bot_move([], "Hard", random.Random(1)) in RPS_MOVES
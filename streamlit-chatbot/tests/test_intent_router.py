@@ -0,0 +1,108 @@
+import pytest
+
+from intent_router import (MAX_EXPRESSION_LENGTH, IntentRouter, UnsafeExpression, evaluate_arithmetic,
+                           extract_arithmetic, format_number)
+
+
+@pytest.mark.parametrize("expression, value", [
+    ("7 * 8", 56),
+    ("(2 + 3) * 4", 20),
+    ("10 / 4", 2.5),
+    ("17 // 5", 3),
+    ("17 % 5", 2),
+    ("-2 ** 3", -8),
+    ("2 ** -1", 0.5),
+])
+def test_evaluates_plain_arithmetic(expression, value):
+    assert evaluate_arithmetic(expression) == value
+
+
+@pytest.mark.parametrize("expression", [
+    "__import__('os')",
+    "abs(-1)",
+    "x + 1",
+    "'a' * 3",
+    "1 +",
+    "5 / 0",
+    "5 % 0",
+    "9 ** 999999",
+    "10 ** 12 * 10 ** 12",
+    "1000000000000000000000000000000.0 ** 12",
+    "(-8) ** 0.5",
+    "1" + "+1" * MAX_EXPRESSION_LENGTH,
+])
+def test_refuses_anything_else(expression):
+    with pytest.raises(UnsafeExpression):
+        evaluate_arithmetic(expression)
+
+
+@pytest.mark.parametrize("prompt, expression", [
+    ("What is 7 x 8?", "7 * 8"),
+    ("whats 12 divided by 4", "12 / 4"),
+    ("calculate 3 to the power of 2", "3 ** 2"),
+    ("5 squared", "5 **2"),
+    ("what is 7", None),
+    ("what is the answer to life", None),
+])
+def test_extract_arithmetic(prompt, expression):
+    assert extract_arithmetic(prompt) == expression
+
+
+@pytest.mark.parametrize("value, text", [
+    (56, "56"),
+    (56.0, "56"),
+    (2.5, "2.5"),
+    (1 / 3, "0.333333"),
+    (-1 / 3, "-0.333333"),
+    (0.001, "0.001"),
+    (1 / 100000, None),
+    (-1 / 100000, None),
+    (1234567.5, None),
+])
+def test_format_number(value, text):
+    assert format_number(value) == text
+
+
+@pytest.fixture
+def router():
+    return IntentRouter(small_model="small", large_model="large")
+
+
+@pytest.mark.parametrize("prompt, intent", [
+    ("Hi Olive!", "small_talk"),
+    ("thank you so much", "small_talk"),
+    ("what is 7 x 8?", "arithmetic"),
+    ("What is the capital of France?", "short_question"),
+    ("Why is the sky blue?", "open_question"),
+    ("Tell me about the planets in our solar system and which ones have rings around them please", "open_question"),
+])
+def test_classify(router, prompt, intent):
+    assert router.classify(prompt).intent == intent
+
+
+def test_arithmetic_is_answered_locally(router):
+    route = router.classify("what is 7 x 8?")
+    assert (route.tier, route.model, route.answer) == ("local", None, "7 × 8 = **56** 🎉")
+
+
+@pytest.mark.parametrize("prompt", [
+    "what is 1000000000000000000000000000000.0 ** 12",
+    "what is 1 / 100000",
+    "what is 5 / 0",
+])
+def test_arithmetic_the_router_cannot_show_goes_to_a_model(router, prompt):
+    assert router.classify(prompt).tier == "small"
+
+
+def test_disabled_router_sends_everything_to_the_large_model():
+    route = IntentRouter(large_model="large", enabled=False).classify("hi")
+    assert (route.tier, route.model) == ("large", "large")
+
+
+def test_stats_count_decisions_and_offload(router):
+    for prompt in ("hi", "what is 2 + 2", "Why do cats purr?", "Why do dogs bark?"):
+        router.record_latency(router.route(prompt), 0.5)
+    stats = router.stats()
+    assert (stats["local_routed"], stats["small_routed"], stats["large_routed"]) == (2, 0, 2)
+    assert stats["offload_ratio"] == 0.5
+    assert stats["large_mean_seconds"] == 0.5
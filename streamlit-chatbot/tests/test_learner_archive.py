@@ -0,0 +1,149 @@
+import gzip
+import io
+
+import pytest
+
+from learner_archive import ArchiveError, import_archive, iter_archive_records, verify_archive, write_archive
+from learner_state import LearnerStateStore, MemoryLearnerStateBackend
+from storage import SQLiteConversationStore
+from transcript import new_message
+
+
+@pytest.fixture
+def stores(tmp_path):
+    conversations = SQLiteConversationStore(str(tmp_path / "chat.sqlite3"))
+    yield conversations, LearnerStateStore(MemoryLearnerStateBackend())
+    conversations.close()
+
+
+def _learner(stores, user_id, chat=3, study=2):
+    conversations, learner_state = stores
+    subjects = [{"id": "math", "name": "Math", "emoji": "➗"}]
+    learner_state.save(user_id, 0, None, {"user_subjects": subjects, "learning_progress": {"lessons_completed": 1},
+                                          "user_reminders": [], "user_avatar": "🦊", "quiz_subject_id": "math"})
+    conversations.append_messages(user_id, "general", [new_message("user", f"chat {i}") for i in range(chat)])
+    conversations.append_messages(user_id, "math", [new_message("user", f"study {i}") for i in range(study)], "study")
+
+
+def _export(stores, user_ids):
+    archive = io.BytesIO()
+    write_archive(archive, user_ids, *stores)
+    archive.seek(0)
+    return archive
+
+
+def _contents(conversations, user_id):
+    return [[m["content"] for m in conversations.load_messages(user_id, subject_id, kind)]
+            for subject_id, kind in (("general", "chat"), ("math", "study"))]
+
+
+def test_round_trip_restores_messages_and_state(stores, tmp_path):
+    _learner(stores, "learner-1")
+    _learner(stores, "learner-2", chat=1, study=0)
+    archive = _export(stores, ["learner-1", "learner-2", "unknown"])
+    assert verify_archive(archive) == {"learners": 2, "messages": 6}
+    archive.seek(0)
+    target = SQLiteConversationStore(str(tmp_path / "other.sqlite3")), LearnerStateStore(MemoryLearnerStateBackend())
+    try:
+        assert import_archive(archive, *target) == {"learners": 2, "messages": 6, "user_ids": ["learner-1", "learner-2"]}
+        assert _contents(target[0], "learner-1") == _contents(stores[0], "learner-1")
+        assert target[1].get("learner-1")[1] == stores[1].get("learner-1")[1]
+    finally:
+        target[0].close()
+
+
+def test_import_refuses_existing_learners_unless_replacing(stores):
+    _learner(stores, "learner-1")
+    archive = _export(stores, ["learner-1"])
+    with pytest.raises(ArchiveError, match="already exists"):
+        import_archive(archive, *stores)
+    archive.seek(0)
+    import_archive(archive, *stores, replace=True)
+    assert _contents(stores[0], "learner-1") == [["chat 0", "chat 1", "chat 2"], ["study 0", "study 1"]]
+
+
+def test_import_under_another_id(stores):
+    _learner(stores, "learner-1")
+    archive = _export(stores, ["learner-1"])
+    assert import_archive(archive, *stores, user_id="session-2")["user_ids"] == ["session-2"]
+    assert _contents(stores[0], "session-2") == _contents(stores[0], "learner-1")
+
+
+def test_messages_appended_during_export_keep_the_archive_valid(stores):
+    _learner(stores, "learner-1")
+    conversations = stores[0]
+    lines = []
+    for line in iter_archive_records(["learner-1"], *stores, batch_size=2):
+        lines.append(line)
+        if b'"type":"conversation"' in line:
+            conversations.append_message("learner-1", "general", new_message("assistant", "late reply"))
+    assert verify_archive(io.BytesIO(gzip.compress(b"".join(lines))))["learners"] == 1
+
+
+def _rewrite(archive, edit):
+    return io.BytesIO(gzip.compress(edit(gzip.decompress(archive.getvalue()))))
+
+
+def test_truncated_archive_is_refused(stores):
+    _learner(stores, "learner-1")
+    data = _export(stores, ["learner-1"]).getvalue()
+    with pytest.raises(ArchiveError, match="truncated"):
+        verify_archive(io.BytesIO(data[:len(data) // 2]))
+
+
+def test_tampered_message_is_refused(stores):
+    _learner(stores, "learner-1")
+    archive = _rewrite(_export(stores, ["learner-1"]), lambda data: data.replace(b"chat 1", b"chat 9"))
+    with pytest.raises(ArchiveError, match="checksum"):
+        verify_archive(archive)
+
+
+def test_dropped_message_is_refused(stores):
+    _learner(stores, "learner-1")
+
+    def drop(data):
+        return b"\n".join(line for line in data.split(b"\n") if b'"chat 1"' not in line)
+
+    with pytest.raises(ArchiveError, match="count mismatch"):
+        verify_archive(_rewrite(_export(stores, ["learner-1"]), drop))
+
+
+class _Unseekable(io.BytesIO):
+    """A stream that can only be read once, like stdin or a network upload."""
+
+    def seekable(self):
+        return False
+
+
+def test_failed_import_leaves_no_partial_learner(stores, tmp_path):
+    _learner(stores, "learner-1")
+    data = gzip.decompress(_export(stores, ["learner-1"]).getvalue()).replace(b"study 1", b"study 9")
+    target = SQLiteConversationStore(str(tmp_path / "other.sqlite3")), LearnerStateStore(MemoryLearnerStateBackend())
+    try:
+        with pytest.raises(ArchiveError):
+            import_archive(_Unseekable(gzip.compress(data)), *target)
+        assert _contents(target[0], "learner-1") == [[], []]
+        assert target[1].get("learner-1")[1] is None
+    finally:
+        target[0].close()
+
+
+@pytest.mark.parametrize("damage", [
+    lambda archive: archive[:len(archive) // 2],
+    lambda archive: gzip.compress(gzip.decompress(archive).replace(b"chat 2", b"chat 7")),
+], ids=["truncated", "tampered"])
+def test_broken_stream_never_clears_the_learner_it_would_replace(stores, damage):
+    _learner(stores, "learner-1")
+    before = _contents(stores[0], "learner-1")
+    broken = damage(_export(stores, ["learner-1"]).getvalue())
+    with pytest.raises(ArchiveError):
+        import_archive(_Unseekable(broken), *stores, replace=True)
+    assert _contents(stores[0], "learner-1") == before
+    assert stores[1].get("learner-1")[1]["user_avatar"] == "🦊"
+
+
+def test_unseekable_stream_imports_like_a_file(stores):
+    _learner(stores, "learner-1")
+    archive = _export(stores, ["learner-1"])
+    assert import_archive(_Unseekable(archive.getvalue()), *stores, replace=True)["messages"] == 5
+    assert _contents(stores[0], "learner-1") == [["chat 0", "chat 1", "chat 2"], ["study 0", "study 1"]]
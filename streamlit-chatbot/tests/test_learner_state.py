@@ -0,0 +1,61 @@
+import pytest
+
+from learner_state import (LearnerStateStore, MemoryLearnerStateBackend, VersionConflict, MAX_WRITE_ATTEMPTS,
+                           merge_learner_state)
+
+
+def _reminder(id, text="Revise", completed=False):
+    return {"id": id, "text": text, "completed": completed}
+
+
+def test_merge_keeps_both_sides_progress_increments():
+    base = {"learning_progress": {"lessons_completed": 2, "quizzes": 1}}
+    ours = {"learning_progress": {"lessons_completed": 3, "quizzes": 1}}
+    theirs = {"learning_progress": {"lessons_completed": 4, "quizzes": 2}}
+    assert merge_learner_state(base, ours, theirs)["learning_progress"] == {"lessons_completed": 5, "quizzes": 2}
+
+
+def test_merge_combines_record_lists_by_id():
+    base = {"user_reminders": [_reminder("a"), _reminder("b")]}
+    ours = {"user_reminders": [_reminder("a", completed=True), _reminder("c")]}  # Edited a, removed b, added c
+    theirs = {"user_reminders": [_reminder("a"), _reminder("b"), _reminder("d")]}  # Added d
+    merged = merge_learner_state(base, ours, theirs)["user_reminders"]
+    assert merged == [_reminder("a", completed=True), _reminder("d"), _reminder("c")]
+
+
+def test_merge_lets_the_last_writer_win_for_plain_values_and_keeps_untouched_fields():
+    base = {"user_avatar": "😀", "quiz_subject_id": "general"}
+    ours = {"user_avatar": "🦊", "quiz_subject_id": "general"}
+    theirs = {"user_avatar": "🐼", "quiz_subject_id": "math"}
+    assert merge_learner_state(base, ours, theirs) == {"user_avatar": "🦊", "quiz_subject_id": "math"}
+
+
+def test_concurrent_saves_are_merged():
+    backend = MemoryLearnerStateBackend()
+    first, second = LearnerStateStore(backend), LearnerStateStore(backend)
+    version, _ = first.save("learner-1", 0, None, {"learning_progress": {"lessons_completed": 0}, "user_reminders": []})
+    base = first.get("learner-1")[1]
+    first.save("learner-1", version, base, {"learning_progress": {"lessons_completed": 1}, "user_reminders": []})
+    # The second worker still works from the old version
+    _, stored = second.save("learner-1", version, base,
+                            {"learning_progress": {"lessons_completed": 1}, "user_reminders": [_reminder("a")]})
+    assert stored == {"learning_progress": {"lessons_completed": 2}, "user_reminders": [_reminder("a")]}
+    assert second.stats()["conflicts"] == 1
+
+
+def test_save_gives_up_with_version_conflict():
+    class AlwaysBehind(MemoryLearnerStateBackend):
+        def compare_and_set(self, user_id, expected_version, document):
+            raise VersionConflict("someone else wrote first")
+
+    store = LearnerStateStore(AlwaysBehind())
+    with pytest.raises(VersionConflict):
+        store.save("learner-1", 0, None, {"user_avatar": "🦊"})
+    assert store.stats()["conflicts"] == MAX_WRITE_ATTEMPTS
+
+
+def test_get_returns_copies():
+    store = LearnerStateStore(MemoryLearnerStateBackend())
+    store.save("learner-1", 0, None, {"user_subjects": []})
+    store.get("learner-1")[1]["user_subjects"].append({"id": "math"})
+    assert store.get("learner-1")[1] == {"user_subjects": []}
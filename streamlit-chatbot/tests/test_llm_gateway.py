@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm_gateway import GatewayBusy, LLMGateway, RequestCancelled, RequestTimeout, UpstreamError
+
+
+class _Upstream:
+    """Fake ResilientCaller: emits `before`, waits for `gate` (if any), emits `after`, then raises `error`."""
+
+    def __init__(self, before=("Hel",), after=("lo",), gate=None, error=None):
+        self.before, self.after, self.gate, self.error = before, after, gate, error
+        self.calls = []
+        self.cancelled = threading.Event()
+
+    async def stream(self, params, emit):
+        self.calls.append(params)
+        try:
+            for text in self.before:
+                emit(text)
+            while self.gate is not None and not self.gate.is_set():
+                await asyncio.sleep(0.005)
+            for text in self.after:
+                emit(text)
+        except asyncio.CancelledError:
+            self.cancelled.set()
+            raise
+        if self.error is not None:
+            raise self.error
+
+
+def _ask(question):
+    return {"model": "llama3-8b-8192", "messages": [{"role": "user", "content": question}]}
+
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_streams_the_answer():
+    gateway = LLMGateway(_Upstream())
+    assert gateway.submit("session-1", **_ask("hi")).text() == "Hello"
+    _wait_until(lambda: gateway.stats()["completed"] == 1)
+
+
+def test_requests_beyond_the_waiting_limit_are_turned_away():
+    gate = threading.Event()
+    gateway = LLMGateway(_Upstream(gate=gate), max_concurrency=1, max_waiting=1)
+    running = gateway.submit(**_ask("one"))
+    running.wait_for_slot()
+    waiting = gateway.submit(**_ask("two"))
+    assert waiting.queue_position == 1
+    with pytest.raises(GatewayBusy):
+        gateway.submit(**_ask("three"))
+    gate.set()
+    assert (running.text(), waiting.text()) == ("Hello", "Hello")
+    assert gateway.stats()["rejected"] == 1
+
+
+def test_concurrency_is_capped():
+    gate = threading.Event()
+    upstream = _Upstream(gate=gate)
+    gateway = LLMGateway(upstream, max_concurrency=2)
+    requests = [gateway.submit(**_ask(f"question {i}")) for i in range(5)]
+    _wait_until(lambda: len(upstream.calls) == 2)
+    time.sleep(0.05)
+    assert (len(upstream.calls), gateway.stats()["active"], gateway.stats()["waiting"]) == (2, 2, 3)
+    gate.set()
+    assert [request.text() for request in requests] == ["Hello"] * 5
+
+
+def test_a_newer_prompt_cancels_the_sessions_previous_request():
+    upstream = _Upstream(gate=threading.Event())
+    gateway = LLMGateway(upstream)
+    first = gateway.submit("session-1", **_ask("one"))
+    first.wait_for_slot()
+    second = gateway.submit("session-1", **_ask("two"))
+    with pytest.raises(RequestCancelled, match="Superseded"):
+        first.text()
+    assert upstream.cancelled.wait(5)  # The upstream stream was closed
+    second.cancel()
+    assert gateway.stats()["cancelled"] == 2
+
+
+def test_consumer_that_stops_reading_cancels_the_request():
+    upstream = _Upstream(gate=threading.Event())
+    gateway = LLMGateway(upstream)
+    chunks = gateway.submit(**_ask("hi")).chunks()
+    assert next(chunks) == "Hel"
+    chunks.close()  # E.g. a Streamlit rerun interrupted the script
+    assert upstream.cancelled.wait(5)
+
+
+def test_requests_time_out():
+    gateway = LLMGateway(_Upstream(gate=threading.Event()), request_timeout=0.1)
+    with pytest.raises(RequestTimeout):
+        gateway.submit(**_ask("hi")).text()
+    assert gateway.stats()["timed_out"] == 1
+
+
+def test_upstream_errors_are_wrapped():
+    error = ValueError("bad request")
+    gateway = LLMGateway(_Upstream(error=error))
+    with pytest.raises(UpstreamError) as raised:
+        gateway.submit(**_ask("hi")).text()
+    assert raised.value.__cause__ is error
+
+
+def test_identical_requests_share_one_upstream_call():
+    gate = threading.Event()
+    upstream = _Upstream(gate=gate)
+    gateway = LLMGateway(upstream)
+    first = gateway.submit("session-1", **_ask("What is osmosis?"))
+    first_chunks = first.chunks()
+    assert next(first_chunks) == "Hel"
+    late = gateway.submit("session-2", **_ask("What is osmosis?"))  # Joins mid-stream
+    gate.set()
+    assert "Hel" + "".join(first_chunks) == late.text() == "Hello"  # The late joiner got the buffered chunks
+    assert len(upstream.calls) == 1
+    stats = gateway.stats()
+    assert (stats["upstream"], stats["coalesced"], stats["dedup_ratio"]) == (1, 1, 0.5)
+
+
+def test_a_finished_request_is_not_joined():
+    upstream = _Upstream()
+    gateway = LLMGateway(upstream)
+    assert gateway.submit(**_ask("hi")).text() == "Hello"
+    _wait_until(lambda: gateway.stats()["completed"] == 1)
+    assert gateway.submit(**_ask("hi")).text() == "Hello"
+    assert len(upstream.calls) == 2
+
+
+def test_cancelling_one_subscriber_keeps_the_shared_stream_going():
+    gate = threading.Event()
+    upstream = _Upstream(gate=gate)
+    gateway = LLMGateway(upstream)
+    leaving = gateway.submit("session-1", **_ask("hi"))
+    staying = gateway.submit("session-2", **_ask("hi"))
+    leaving.cancel()
+    with pytest.raises(RequestCancelled):
+        leaving.text()
+    gate.set()
+    assert staying.text() == "Hello"
+    assert not upstream.cancelled.is_set()
+
+
+def test_cancelling_every_subscriber_cancels_the_upstream_call():
+    upstream = _Upstream(gate=threading.Event())
+    gateway = LLMGateway(upstream)
+    requests = [gateway.submit(f"session-{i}", **_ask("hi")) for i in range(2)]
+    requests[0].wait_for_slot()
+    for request in requests:
+        request.cancel()
+    assert upstream.cancelled.wait(5)
+    assert gateway.stats()["cancelled"] == 2
+
+
+def test_coalescing_can_be_disabled():
+    gate = threading.Event()
+    upstream = _Upstream(gate=gate)
+    gateway = LLMGateway(upstream, coalesce=False)
+    requests = [gateway.submit(**_ask("hi")) for _ in range(2)]
+    gate.set()
+    assert [request.text() for request in requests] == ["Hello", "Hello"]
+    assert len(upstream.calls) == 2
+    assert (gateway.stats()["upstream"], gateway.stats()["coalesced"]) == (2, 0)
@@ -0,0 +1,100 @@
+import socket
+import urllib.request
+
+import pytest
+
+from metrics import Histogram, MetricsExporter, MetricsRegistry, format_metrics_summary
+
+
+def test_histogram_quantiles_interpolate_within_buckets():
+    histogram = Histogram((1, 2, 4))
+    assert histogram.quantile(0.5) is None
+    for value in (0.5, 1.5, 1.5, 3):
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1, 0]
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert histogram.quantile(1.0) == pytest.approx(4)
+    histogram.observe(100)  # Beyond the last bucket: reported as the largest bound
+    assert histogram.quantile(1.0) == 4
+
+
+def test_prometheus_histograms_use_cumulative_buckets():
+    registry = MetricsRegistry()
+    for value in (0.5, 1.5, 3):
+        registry.observe("run_seconds", value, buckets=(1, 2), help_text="Script run time", mode="chat")
+    text = registry.render_prometheus()
+    assert "# HELP olive_run_seconds Script run time\n# TYPE olive_run_seconds histogram\n" in text
+    assert 'olive_run_seconds_bucket{mode="chat",le="1.0"} 1\n' in text
+    assert 'olive_run_seconds_bucket{mode="chat",le="2.0"} 2\n' in text
+    assert 'olive_run_seconds_bucket{mode="chat",le="+Inf"} 3\n' in text
+    assert 'olive_run_seconds_sum{mode="chat"} 5.0\n' in text
+    assert 'olive_run_seconds_count{mode="chat"} 3\n' in text
+
+
+def test_counters_get_a_total_suffix_and_escaped_labels():
+    registry = MetricsRegistry(namespace="app")
+    registry.inc("errors", kind='bad "quote"\n')
+    registry.inc("errors", 2, kind='bad "quote"\n')
+    text = registry.render_prometheus()
+    assert "# TYPE app_errors_total counter\n" in text
+    assert 'app_errors_total{kind="bad \\"quote\\"\\n"} 3\n' in text
+
+
+def test_collectors_export_numeric_values_only():
+    registry = MetricsRegistry()
+    registry.add_collector("gateway", lambda: {"active": 2, "ratio": 0.5, "enabled": True, "name": "groq"})
+    registry.add_collector("broken", lambda: 1 / 0)
+    text = registry.render_prometheus()
+    assert "olive_gateway_active 2\n" in text
+    assert "olive_gateway_ratio 0.5\n" in text
+    assert "enabled" not in text and "groq" not in text
+    assert "broken" not in text
+
+
+def test_interrupted_timers_record_nothing():
+    registry = MetricsRegistry()
+    with registry.timer("phase_seconds", phase="render"):
+        pass
+    with pytest.raises(RuntimeError):
+        with registry.timer("phase_seconds", phase="render"):
+            raise RuntimeError("rerun")
+    assert [count for _, count, *_ in registry.summary("phase_seconds")] == [1]
+
+
+def test_summary_and_its_formatting():
+    registry = MetricsRegistry()
+    for value in (0.02, 0.04):
+        registry.observe("run_seconds", value, mode="chat")
+    registry.observe("run_seconds", 0.002, mode="game")
+    rows = registry.summary("run_seconds")
+    assert [(labels, count) for labels, count, *_ in rows] == [({"mode": "chat"}, 2), ({"mode": "game"}, 1)]
+    assert rows[0][2] == pytest.approx(0.03)
+    lines = format_metrics_summary(rows, ("mode",)).splitlines()
+    assert lines[0].startswith("- chat: p50 ") and lines[0].endswith(" ms (2×)")
+    assert lines[1] == "- game: p50 2.5 ms, p95 4.8 ms (1×)"  # Sub-10 ms timings keep a decimal
+    assert registry.summary("missing") == []
+
+
+def test_write_file_replaces_the_file_atomically(tmp_path):
+    registry = MetricsRegistry()
+    registry.inc("runs")
+    path = tmp_path / "olive.prom"
+    path.write_text("stale")
+    registry.write_file(str(path))
+    assert path.read_text() == registry.render_prometheus()
+    assert [p.name for p in tmp_path.iterdir()] == ["olive.prom"]
+
+
+def test_exporter_serves_metrics_over_http():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    registry = MetricsRegistry()
+    registry.inc("runs")
+    exporter = MetricsExporter(registry, port=port)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            assert response.read().decode() == registry.render_prometheus()
+    finally:
+        exporter.server.shutdown()
+        exporter.server.server_close()
@@ -0,0 +1,99 @@
+import itertools
+import threading
+
+import pytest
+
+from quiz_pool import (MAX_FAILED_BATCHES, QuizPool, format_quiz_question, is_correct_answer, normalize_answer,
+                       parse_quiz_questions)
+
+BATCH = """Here are your questions!
+
+**Question 1:** What colour is the sky on a clear day?
+A) Green
+B) Blue
+C) Red
+Correct: [B]
+
+Question 2. How many legs does a spider have?
+(A) 6 (B) 8 (C) 10
+Correct answer: A
+
+Question: Which is a fruit?
+A) Apple
+B) apple
+C) Carrot
+Correct: A
+"""
+
+
+def test_parse_accepts_common_variations_and_drops_unanswerable_questions():
+    questions = parse_quiz_questions(BATCH)
+    assert questions == [
+        {"question": "What colour is the sky on a clear day?", "options": {"A": "Green", "B": "Blue", "C": "Red"},
+         "correct": "B"},
+        {"question": "How many legs does a spider have?", "options": {"A": "6", "B": "8", "C": "10"}, "correct": "A"},
+    ]  # The third has duplicate options
+    assert parse_quiz_questions(None) == []
+    assert parse_quiz_questions("Sorry, I can't do that.") == []
+
+
+@pytest.mark.parametrize("answer, letter", [("b", "B"), ("B)", "B"), ("(B) Blue", "B"), ("  c", "C"), ("Blue", None),
+                                            ("", None), (None, None)])
+def test_normalize_answer(answer, letter):
+    assert normalize_answer(answer) == letter
+
+
+def test_is_correct_answer_and_format():
+    question = parse_quiz_questions(BATCH)[0]
+    assert is_correct_answer(question, "b) blue")
+    assert not is_correct_answer(question, "A")
+    assert format_quiz_question(question).startswith("**What colour is the sky on a clear day?**\n\n- **A)** Green")
+
+
+def _batch(count, start):
+    return "\n\n".join(f"Question: Question number {i}?\nA) one\nB) two\nC) three\nCorrect: A"
+                       for i in range(start, start + count))
+
+
+def test_pop_waits_for_the_first_refill_and_keeps_the_pool_topped_up():
+    counter = itertools.count()
+    calls = []
+
+    def generate(subject_name, count):
+        calls.append((subject_name, count))
+        return _batch(count, next(counter) * 100)
+
+    pool = QuizPool(generate, target=4, low_watermark=2, batch_size=3)
+    question = pool.pop("Science", timeout=5)
+    assert question["question"] == "Question number 0?"
+    assert calls[0] == ("Science", 3)
+    assert all(count <= 3 for _, count in calls)  # Never more than a batch, or than is missing
+    for _ in range(3):
+        assert pool.pop("Science", timeout=5) is not None
+    assert pool.last_error("Science") is None
+
+
+def test_repeated_questions_are_not_pooled_again():
+    pool = QuizPool(lambda subject_name, count: _batch(3, 0), target=3, low_watermark=1)
+    seen = [pool.pop("Maths", timeout=5)["question"] for _ in range(3)]
+    assert sorted(seen) == ["Question number 0?", "Question number 1?", "Question number 2?"]
+    assert pool.pop("Maths", timeout=5) is None  # The model keeps repeating itself
+    assert pool.last_error("Maths") == "The quiz master's answer could not be understood."
+
+
+def test_refill_gives_up_after_repeated_failures():
+    calls = []
+    done = threading.Event()
+
+    def generate(subject_name, count):
+        calls.append(count)
+        if len(calls) == MAX_FAILED_BATCHES:
+            done.set()
+        raise RuntimeError("rate limited")
+
+    pool = QuizPool(generate)
+    assert pool.pop("History", timeout=5) is None
+    assert done.wait(5)
+    assert len(calls) == MAX_FAILED_BATCHES
+    assert pool.last_error("History") == "rate limited"
+    assert pool.stats() == {"History": 0}
@@ -0,0 +1,57 @@
+import pytest
+
+from reminder_scheduler import MIN_EASINESS, ReminderQueue, format_due, new_reminder, review
+
+DAY = 100  # A short SM-2 day keeps the numbers readable
+
+
+def _card(now=0):
+    return new_reminder("Revise fractions", "Revision", "math", now, day_seconds=DAY)
+
+
+def test_new_reminder_is_due_after_one_day():
+    card = _card(now=5)
+    assert (card["due_at"], card["repetitions"], card["interval_days"]) == (5 + DAY, 0, 1)
+
+
+def test_correct_answers_follow_the_sm2_intervals():
+    card = _card()
+    intervals = [review(card, 5, now=0, day_seconds=DAY)["interval_days"] for _ in range(4)]
+    # 1 day, 6 days, then the previous interval times the growing easiness (2.8, 2.9)
+    assert intervals == [1, 6, 17, 49]
+    assert card["easiness"] == pytest.approx(2.9)
+    assert card["due_at"] == 49 * DAY
+
+
+def test_wrong_answer_starts_the_intervals_over():
+    card = _card()
+    for _ in range(3):
+        review(card, 4, now=0, day_seconds=DAY)
+    review(card, 1, now=1000, day_seconds=DAY)
+    assert (card["repetitions"], card["interval_days"], card["due_at"]) == (0, 1, 1000 + DAY)
+
+
+def test_easiness_never_drops_below_the_minimum():
+    card = _card()
+    for _ in range(20):
+        review(card, 0, now=0, day_seconds=DAY)
+    assert card["easiness"] == MIN_EASINESS
+
+
+def test_queue_reports_reminders_as_they_come_due():
+    cards = [_card(now=i * 10) for i in range(3)]
+    cards.append(dict(_card(), completed=True))
+    queue = ReminderQueue(cards)
+    assert len(queue) == 3
+    assert queue.tick(DAY + 10) == cards[:2]
+    assert queue.upcoming(5) == [cards[2]]
+    review(cards[0], 5, now=DAY + 10, day_seconds=DAY)
+    queue.schedule(cards[0])
+    assert queue.due() == [cards[1]]
+    assert queue.upcoming(5) == [cards[2], cards[0]]
+
+
+def test_format_due():
+    assert format_due(0, 10) == "now"
+    assert format_due(10 * 60, 0) == "in 10 min"
+    assert format_due(2 * 86400, 0) == "in 2 days"
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import groq
+import httpx
+import pytest
+
+from resilience import HEALTH_MIN_SAMPLES, ModelHealth, RateLimiter, ResilientCaller, TokenBucket, parse_duration
+
+
+def _rate_limited(headers=None):
+    response = httpx.Response(429, request=httpx.Request("POST", "https://api.groq.test"), headers=headers or {})
+    return groq.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+class _Stream:
+    def __init__(self, texts, error):
+        self.texts, self.error = texts, error
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        for text in self.texts:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+        if self.error is not None:
+            raise self.error
+
+
+class _FakeGroq:
+    """Plays one scripted attempt per call: an exception raised up front, or (chunks, error raised mid-stream)."""
+
+    def __init__(self, *attempts, headers=None):
+        self.attempts = list(attempts)
+        self.headers = headers or {}
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(with_raw_response=SimpleNamespace(create=self._create)))
+
+    async def _create(self, stream, **params):
+        self.calls.append(params)
+        attempt = self.attempts.pop(0)
+        if isinstance(attempt, Exception):
+            raise attempt
+        texts, error = attempt
+
+        async def parse():
+            return _Stream(texts, error)
+        return SimpleNamespace(headers=self.headers, parse=parse)
+
+
+def _stream(caller, question="Explain photosynthesis"):
+    emitted = []
+    params = {"model": "llama3-70b-8192", "messages": [{"role": "user", "content": question}]}
+    asyncio.run(caller.stream(params, emitted.append))
+    return emitted
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("7.66s", 7.66), ("2m59.56s", 179.56), ("120ms", 0.12), ("1h", 3600), ("3", 3.0), (None, None), ("junk", None),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == pytest.approx(seconds)
+
+
+def test_token_bucket_refills_continuously():
+    bucket = TokenBucket(60)
+    now = bucket.updated_at
+    bucket.take(60)
+    assert bucket.wait_time(10, now) == pytest.approx(10)  # One unit per second
+    assert bucket.wait_time(10, now + 10) == 0
+    assert bucket.wait_time(1000, now + 10) == pytest.approx(50)  # Oversized requests wait for a full bucket
+
+
+def test_rate_limit_headers_pause_the_limiter():
+    limiter = RateLimiter(30, 6000)
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "12", "x-ratelimit-remaining-tokens": "0",
+                                 "x-ratelimit-reset-tokens": "7.66s"})
+    assert limiter.requests.level <= 12
+    assert limiter.paused_until - time.monotonic() == pytest.approx(7.66, abs=0.5)
+    limiter = RateLimiter(30, 6000)
+    limiter.update_from_headers({"retry-after": "2"})
+    assert limiter.paused_until - time.monotonic() == pytest.approx(2, abs=0.5)
+
+
+def test_model_health_needs_enough_samples():
+    health = ModelHealth()
+    for _ in range(HEALTH_MIN_SAMPLES - 1):
+        health.record(False)
+    assert not health.degraded(latency_budget=4, error_budget=0.25)
+    health.record(False)
+    assert health.degraded(latency_budget=4, error_budget=0.25)
+
+
+def test_slow_first_tokens_degrade_a_model():
+    health = ModelHealth()
+    for ttft in (5, 6, 7, 0.5):
+        health.record(True, ttft)
+    assert health.degraded(latency_budget=4, error_budget=0.25)
+    assert not health.degraded(latency_budget=10, error_budget=0.25)
+
+
+def test_degraded_models_are_routed_to_their_fallback():
+    caller = ResilientCaller(_FakeGroq(), fallback_models={"llama3-70b-8192": "llama3-8b-8192"})
+    assert caller.route("llama3-70b-8192") == "llama3-70b-8192"
+    for _ in range(HEALTH_MIN_SAMPLES):
+        caller._model_health("llama3-70b-8192").record(False)
+    assert caller.route("llama3-70b-8192") == "llama3-8b-8192"
+    assert caller.route("mixtral-8x7b-32768") == "mixtral-8x7b-32768"  # No fallback configured
+
+
+def test_backoff_is_capped_and_honours_retry_after():
+    caller = ResilientCaller(_FakeGroq(), base_delay=0.5, max_delay=2)
+    delays = [caller.backoff_delay(attempt) for attempt in range(1, 10) for _ in range(20)]
+    assert all(0 <= delay <= 2 for delay in delays)
+    assert caller.backoff_delay(1, retry_after=7.5) >= 7.5
+
+
+def test_retries_rate_limited_requests():
+    client = _FakeGroq(_rate_limited(), (["Plants ", "make sugar."], None))
+    caller = ResilientCaller(client, base_delay=0)
+    assert _stream(caller) == ["Plants ", "make sugar."]
+    assert len(client.calls) == 2
+    assert (caller.stats()["attempts"], caller.stats()["retries"]) == (2, 1)
+
+
+def test_a_broken_stream_resumes_without_repeating_text():
+    client = _FakeGroq((["Plants "], httpx.ReadError("connection reset")), (["make sugar."], None))
+    caller = ResilientCaller(client, base_delay=0)
+    assert _stream(caller) == ["Plants ", "make sugar."]
+    assert client.calls[1]["messages"][-1] == {"role": "assistant", "content": "Plants "}
+    assert caller.stats()["resumed"] == 1
+
+
+def test_gives_up_after_max_attempts():
+    client = _FakeGroq(*[_rate_limited() for _ in range(3)])
+    caller = ResilientCaller(client, max_attempts=3, base_delay=0)
+    with pytest.raises(groq.RateLimitError):
+        _stream(caller)
+    assert len(client.calls) == 3
+
+
+def test_other_errors_are_not_retried():
+    client = _FakeGroq(ValueError("bad request"), (["unused"], None))
+    caller = ResilientCaller(client, base_delay=0)
+    with pytest.raises(ValueError):
+        _stream(caller)
+    assert len(client.calls) == 1
+
+
+def test_failing_model_falls_back_on_later_attempts():
+    client = _FakeGroq(*[_rate_limited() for _ in range(HEALTH_MIN_SAMPLES)], (["Plants make sugar."], None))
+    caller = ResilientCaller(client, max_attempts=HEALTH_MIN_SAMPLES + 1, base_delay=0)
+    assert _stream(caller) == ["Plants make sugar."]
+    assert client.calls[-1]["model"] == "llama3-8b-8192"
+    assert caller.stats()["fallbacks"] == 1
@@ -0,0 +1,91 @@
+import pytest
+
+from response_cache import ResponseCache, key_terms, normalize_text
+
+MODEL = "llama3-8b-8192"
+
+
+def _ask(question, system="You are a tutor."):
+    return [{"role": "system", "content": system}, {"role": "user", "content": question}]
+
+
+def test_exact_key_ignores_case_whitespace_and_trailing_punctuation():
+    cache = ResponseCache()
+    cache.put(MODEL, _ask("What is photosynthesis?"), "Plants making food.")
+    assert cache.get(MODEL, _ask("  what is   PHOTOSYNTHESIS ")) == "Plants making food."
+    assert cache.hits == 1
+
+
+def test_key_includes_model_system_prompt_and_previous_turn():
+    cache = ResponseCache()
+    cache.put(MODEL, _ask("What is photosynthesis?"), "Plants making food.")
+    assert cache.get("other-model", _ask("What is photosynthesis?")) is None
+    assert cache.get(MODEL, _ask("What is photosynthesis?", system="You are a pirate.")) is None
+    follow_up = _ask("What is photosynthesis?")[:1] + [{"role": "assistant", "content": "Hello"}] + _ask("What is photosynthesis?")[1:]
+    assert cache.get(MODEL, follow_up) is None
+
+
+def test_key_covers_every_turn_sent_to_the_model():
+    def chat(pet):
+        return [{"role": "system", "content": "You are a tutor."}, {"role": "user", "content": f"I like {pet}"},
+                {"role": "assistant", "content": "Great!"}, {"role": "user", "content": "tell me a fact about it"}]
+
+    cache = ResponseCache(semantic=True)
+    cache.put(MODEL, chat("cats"), "Cats sleep a lot.")
+    assert cache.get(MODEL, chat("dogs")) is None
+    assert cache.get(MODEL, chat("cats")) == "Cats sleep a lot."
+
+
+def test_semantic_lookup_is_off_by_default():
+    cache = ResponseCache()
+    cache.put(MODEL, _ask("What is photosynthesis?"), "Plants making food.")
+    assert cache.get(MODEL, _ask("What's photosynthesis?")) is None
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("What is 2+2?", "What is 2+3?"),
+    ("Who was the first president of the USA?", "Who was the second president of the USA?"),
+    ("What is the capital of Austria?", "What is the capital of Australia?"),
+    ("Explain mitosis", "Explain meiosis"),
+    ("Is water a compound?", "Is water not a compound?"),
+])
+def test_semantic_lookup_never_answers_a_different_question(cached, asked):
+    cache = ResponseCache(semantic=True)
+    cache.put(MODEL, _ask(cached), "cached answer")
+    assert cache.get(MODEL, _ask(asked)) is None
+
+
+def test_semantic_lookup_matches_rewordings_with_the_same_key_terms():
+    cache = ResponseCache(semantic=True, similarity_threshold=0.85)
+    cache.put(MODEL, _ask("What is the capital of Austria?"), "Vienna")
+    assert cache.get(MODEL, _ask("Tell me, what is the capital of Austria")) == "Vienna"
+    assert cache.semantic_hits == 1
+
+
+def test_key_terms_gate_holds_even_with_a_low_threshold():
+    cache = ResponseCache(semantic=True, similarity_threshold=0.5)
+    cache.put(MODEL, _ask("What is the capital of Austria?"), "Vienna")
+    assert cache.get(MODEL, _ask("What is the capital of Australia?")) is None
+    assert key_terms("What is the capital of Austria?") == frozenset({"capital", "austria"})
+
+
+def test_normalize_text():
+    assert normalize_text("  Hello\n  World?! ") == "hello world"
+
+
+def test_lru_eviction_respects_max_entries():
+    cache = ResponseCache(max_entries=2)
+    for question in ("one", "two", "three"):
+        cache.put(MODEL, _ask(question), question.upper())
+    assert cache.get(MODEL, _ask("one")) is None
+    assert cache.get(MODEL, _ask("three")) == "THREE"
+    assert cache.evictions == 1
+
+
+def test_expired_entries_miss(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("response_cache.time.time", lambda: now[0])
+    cache = ResponseCache(ttl=10)
+    cache.put(MODEL, _ask("one"), "ONE")
+    now[0] += 11
+    assert cache.get(MODEL, _ask("one")) is None
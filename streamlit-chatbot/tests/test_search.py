@@ -0,0 +1,96 @@
+import sqlite3
+
+import pytest
+
+from message_search import InvertedIndex, make_snippet, tokenize
+from storage import SQLiteConversationStore, fts_query, fts_terms
+from transcript import new_message
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteConversationStore(str(tmp_path / "chat.sqlite3"))
+    yield store
+    store.close()
+
+
+def _say(store, user_id, content, subject_id="general", kind="chat"):
+    message = new_message("user", content)
+    store.append_message(user_id, subject_id, message, kind)
+    return message
+
+
+def test_tokenize_and_snippet():
+    assert tokenize("Photo-synthesis, in PLANTS!") == ["photo", "synthesis", "in", "plants"]
+    assert make_snippet("Plants make food by photosynthesis", ["photo"]) == "Plants make food by **photosynthesis**"
+
+
+def test_inverted_index_ranks_and_isolates_learners():
+    index = InvertedIndex()
+    index.add("learner-1", "general", "chat", 0, "user", "photosynthesis photosynthesis in plants")
+    index.add("learner-1", "general", "chat", 1, "user", "plants grow in soil with a little photosynthesis")
+    index.add("class-learner-1", "general", "chat", 0, "user", "photosynthesis in algae")
+    hits = index.search("learner-1", "photo")
+    assert [hit["seq"] for hit in hits] == [0, 1]
+    index.remove_user("learner-1")
+    assert index.search("learner-1", "photo") == []
+    assert len(index.search("class-learner-1", "photo")) == 1
+
+
+def test_fts_query_quotes_every_term_as_a_prefix_of_the_learners_words():
+    owner = fts_terms("learner-1", "x")[:-1]
+    assert fts_query("learner-1", "Photo synthesis") == f'terms : ("{owner}photo"* "{owner}synthesis"*)'
+    assert fts_query("learner-1", 'say "hi" OR snake_case') == \
+        f'terms : ("{owner}say"* "{owner}hi"* "{owner}or"* "{owner}snake"* "{owner}case"*)'
+    assert fts_query("learner-1", "  ?! ") is None
+    assert fts_terms("class-learner-1", "x") != fts_terms("learner-1", "x")
+
+
+def test_index_holds_only_learner_scoped_words(store):
+    _say(store, "learner-1", "Photosynthèse in plants")
+    _say(store, "class-learner-1", "photosynthesis in algae")
+    store.flush()
+    connection = sqlite3.connect(store.path)
+    connection.execute("CREATE VIRTUAL TABLE temp.vocabulary USING fts5vocab(main, messages_fts, 'row')")
+    words = {term for term, in connection.execute("SELECT term FROM temp.vocabulary")}
+    connection.close()
+    owner = fts_terms("learner-1", "x")[:-1]
+    assert {word for word in words if word.startswith(owner)} == {owner + "photosynthese", owner + "in", owner + "plants"}
+    assert len(words) == 6
+    assert len(store.search_messages("learner-1", "photosynthèse")) == 1
+
+
+def test_index_from_before_learner_prefixes_is_rebuilt(tmp_path):
+    path = str(tmp_path / "chat.sqlite3")
+    SQLiteConversationStore(path).close()
+    connection = sqlite3.connect(path)
+    connection.executescript(
+        "DROP TRIGGER messages_fts_insert; DROP TABLE messages_fts;"
+        "CREATE VIRTUAL TABLE messages_fts USING fts5(content, user_id UNINDEXED, subject_id UNINDEXED, "
+        "kind UNINDEXED, seq UNINDEXED, role UNINDEXED);"
+        "INSERT INTO messages VALUES ('learner-1', 'general', 'chat', 0, 'a', 'user', 'photosynthesis', 0);")
+    connection.close()
+    store = SQLiteConversationStore(path)
+    try:
+        assert [hit["seq"] for hit in store.search_messages("learner-1", "photo")] == [0]
+    finally:
+        store.close()
+
+
+def test_search_only_returns_the_learners_own_messages(store):
+    _say(store, "learner-1", "photosynthesis in plants")
+    _say(store, "class-learner-1", "photosynthesis in algae")
+    store.flush()
+    hits = store.search_messages("learner-1", "photo")
+    assert len(hits) == 1
+    assert "plants" in hits[0]["snippet"]
+    assert len(store.search_messages("class-learner-1", "photo")) == 1
+
+
+def test_clear_learning_data_leaves_other_learners_searchable(store):
+    _say(store, "learner-1", "photosynthesis in plants")
+    _say(store, "class-learner-1", "photosynthesis in algae")
+    store.clear_learning_data("learner-1")
+    assert store.search_messages("learner-1", "photo") == []
+    assert len(store.search_messages("class-learner-1", "photo")) == 1
+    assert store.count_messages("learner-1", "general") == 0
@@ -0,0 +1,80 @@
+import pytest
+
+from session_memory import SPILL_MARKER, SessionMemoryGovernor, estimate_bytes
+
+
+class _State(dict):
+    """Stands in for Streamlit's session state, which the governor measures through filtered_state."""
+
+    @property
+    def filtered_state(self):
+        return self
+
+
+@pytest.fixture
+def governor(tmp_path):
+    return SessionMemoryGovernor(session_budget=10_000, process_budget=0, idle_seconds=0, sweep_interval=0,
+                                 spill_dir=str(tmp_path), measure_interval=0)
+
+
+def _session(governor, session_id="session-1"):
+    state = _State(game={"board": [0] * 9}, chat_histories_in_session={"general": ["hello"] * 10}, user_avatar="🦊")
+    governor.touch(session_id, state)
+    governor.track(session_id, state)
+    return state
+
+
+def test_estimate_bytes_counts_shared_objects_once():
+    shared = "x" * 1000
+    assert estimate_bytes([shared, shared]) < 2 * estimate_bytes(shared)
+
+
+def test_evicted_state_is_spilled_and_rehydrated(governor):
+    state = _session(governor)
+    assert governor.evict("session-1") > 0
+    assert "game" not in state and "chat_histories_in_session" not in state
+    assert state["user_avatar"] == "🦊" and SPILL_MARKER in state
+    assert governor.rehydrate("session-1", state)
+    assert state["game"] == {"board": [0] * 9}
+    assert SPILL_MARKER not in state
+    assert not governor.rehydrate("session-1", state)
+
+
+def test_running_session_is_never_evicted(governor):
+    state = _session(governor)
+    governor.touch("session-1", state)  # A run started and has not ended yet
+    assert governor.evict("session-1") == 0
+    governor.sweep()
+    assert "game" in state
+    assert governor.stats()["skipped_running"] == 1
+    governor.track("session-1", state)
+    governor.sweep()
+    assert "game" not in state
+
+
+def test_sessions_over_budget_drop_their_caches(governor):
+    state = _session(governor)
+    state["chat_histories_in_session"] = {"general": [f"{i:0100}" for i in range(200)]}
+    governor.track("session-1", state)
+    assert "chat_histories_in_session" not in state
+    assert state["game"] == {"board": [0] * 9}
+    assert governor.stats()["trims"] == 1
+
+
+def test_runs_are_measured_at_most_once_per_interval(tmp_path):
+    governor = SessionMemoryGovernor(sweep_interval=0, spill_dir=str(tmp_path), measure_interval=60)
+    state = _State(user_avatar="🦊")
+    for _ in range(5):
+        governor.touch("session-1", state)
+        governor.track("session-1", state)
+    assert governor.stats()["measurements"] == 1
+
+
+def test_ended_sessions_are_forgotten(tmp_path):
+    active = {"session-1"}
+    governor = SessionMemoryGovernor(sweep_interval=0, spill_dir=str(tmp_path), is_active=active.__contains__)
+    _session(governor, "session-1")
+    _session(governor, "session-2")
+    governor.sweep()
+    assert governor.stats()["sessions"] == 1
+    assert governor.stats()["ended_sessions"] == 1
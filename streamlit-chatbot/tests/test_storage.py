@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+from storage import MemoryConversationStore, SQLiteConversationStore
+from transcript import new_message
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteConversationStore(str(tmp_path / "chat.sqlite3"))
+    yield store
+    store.close()
+
+
+def _say(store, user_id, content, subject_id="general", kind="chat"):
+    message = new_message("user", content)
+    store.append_message(user_id, subject_id, message, kind)
+    return message
+
+
+@pytest.fixture
+def held_writer(store, monkeypatch):
+    """Holds every write batch until the returned event is set; reads must not flush meanwhile."""
+    release = threading.Event()
+    write_batch = store._write_batch
+
+    def held(connection, batch):
+        release.wait(5)
+        write_batch(connection, batch)
+
+    monkeypatch.setattr(store, "_write_batch", held)
+    monkeypatch.setattr(store, "flush", lambda: pytest.fail("reads must not wait for the writer"))
+    yield release
+    release.set()
+
+
+def test_queued_messages_are_read_from_the_pending_buffer(store, held_writer):
+    for i in range(5):
+        _say(store, "learner-1", f"message {i}")
+    assert [m["content"] for m in store.load_messages("learner-1", "general", limit=3)] == \
+        ["message 2", "message 3", "message 4"]
+    assert [m["seq"] for m in store.load_messages("learner-1", "general", before_seq=2)] == [0, 1]
+    assert store.count_messages("learner-1", "general") == 5
+    assert sorted(hit["seq"] for hit in store.search_messages("learner-1", "mess")) == list(range(5))
+
+
+def test_pending_and_committed_messages_merge_without_gaps(store):
+    for i in range(3):
+        _say(store, "learner-1", f"message {i}")
+    store.flush()
+    for i in range(3, 6):
+        _say(store, "learner-1", f"message {i}")
+    assert [m["seq"] for m in store.load_messages("learner-1", "general")] == list(range(6))
+    store.flush()
+    assert store._pending == {}
+
+
+def test_concurrent_appends_get_dense_sequence_numbers(store):
+    def chat(thread):
+        for i in range(50):
+            _say(store, "learner-1", f"thread {thread} message {i}")
+
+    threads = [threading.Thread(target=chat, args=(t,)) for t in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [m["seq"] for m in store.load_messages("learner-1", "general")] == list(range(200))
+    assert store.count_messages("learner-1", "general") == 200
+
+
+@pytest.mark.parametrize("make_store", [MemoryConversationStore, None])
+def test_iter_messages_reads_each_message_once(make_store, store):
+    store = make_store() if make_store else store
+    messages = [new_message("user", f"message {i}") for i in range(23)]
+    store.append_messages("learner-1", "general", messages)
+    assert [m["seq"] for m in store.iter_messages("learner-1", "general", batch_size=5)] == list(range(23))
+
+
+def test_a_failing_statement_only_drops_itself(store, monkeypatch, caplog):
+    monkeypatch.setattr("storage.WRITE_FLUSH_INTERVAL", 1.0)  # Gathers everything below into one batch
+    _say(store, "learner-1", "first")
+    # Another worker, sharing the file without shared=True, already wrote seq 0 of this conversation
+    store._enqueue("INSERT INTO messages (user_id, subject_id, kind, seq, id, role, content, created_at) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", ("learner-1", "general", "chat", 0, "x", "user", "clash", 0.0))
+    _say(store, "learner-2", "second")
+    store.flush()
+    assert [m["content"] for m in store.load_messages("learner-1", "general")] == ["first"]
+    assert [m["content"] for m in store.load_messages("learner-2", "general")] == ["second"]
+    assert store._pending == {}
+    assert "Dropped a queued statement" in caplog.text
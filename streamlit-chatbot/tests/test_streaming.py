@@ -0,0 +1,56 @@
+from streaming import STREAM_CURSOR, StreamRenderer, format_stream_stats
+
+
+class _Placeholder:
+    def __init__(self):
+        self.drawn = []
+
+    def markdown(self, text):
+        self.drawn.append(text)
+
+
+def test_chunks_are_drawn_in_batches_of_tokens():
+    placeholder = _Placeholder()
+    renderer = StreamRenderer(placeholder, flush_interval_ms=60_000, flush_every_tokens=4)
+    assert renderer.render(f"w{i} " for i in range(10)) == "".join(f"w{i} " for i in range(10))
+    assert placeholder.drawn[0] == "w0 w1 w2 w3 " + STREAM_CURSOR
+    assert placeholder.drawn[-1] == "".join(f"w{i} " for i in range(10))  # The final draw has no cursor
+    assert renderer.stats["flushes"] == len(placeholder.drawn) == 3
+
+
+def test_slow_streams_are_drawn_on_the_interval(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("streaming.time.perf_counter", lambda: clock[0])
+    placeholder = _Placeholder()
+    renderer = StreamRenderer(placeholder, flush_interval_ms=80, flush_every_tokens=1000)
+    renderer.write("a")
+    clock[0] += 0.05
+    renderer.write("b")
+    assert placeholder.drawn == []
+    clock[0] += 0.05
+    renderer.write("c")
+    assert placeholder.drawn == ["abc" + STREAM_CURSOR]
+
+
+def test_empty_chunks_are_ignored():
+    renderer = StreamRenderer(_Placeholder())
+    renderer.write("")
+    renderer.write(None)
+    assert renderer.tokens == 0
+    assert renderer.stats["ttft"] is None
+    assert format_stream_stats(renderer.stats) == ""
+
+
+def test_stats_measure_time_to_first_token_and_throughput(monkeypatch):
+    clock = [10.0]
+    monkeypatch.setattr("streaming.time.perf_counter", lambda: clock[0])
+    renderer = StreamRenderer(_Placeholder())
+    clock[0] += 0.5
+    renderer.write("Hello")
+    clock[0] += 1.0
+    for _ in range(19):
+        renderer.write(" world")
+    renderer.finish()
+    stats = renderer.stats
+    assert (stats["ttft"], stats["total"], stats["tokens"], stats["tokens_per_sec"]) == (0.5, 1.5, 20, 20.0)
+    assert format_stream_stats(stats) == "First token in 0.50s · 20 tokens/s"
@@ -0,0 +1,38 @@
+import types
+
+import pytest
+
+import transcript
+from transcript import MARKDOWN_CACHE_SIZE, cached_markdown, compact_messages, new_message, prepare_markdown
+
+
+class _SessionState(dict):
+    __getattr__ = dict.__getitem__
+    __setattr__ = dict.__setitem__
+
+
+@pytest.fixture
+def session_state(monkeypatch):
+    state = _SessionState()
+    monkeypatch.setattr(transcript, "st", types.SimpleNamespace(session_state=state))
+    return state
+
+
+def test_prepare_markdown_keeps_dollar_signs():
+    assert prepare_markdown("It costs $5 and $10.\r\n\r\n") == "It costs $5 and $10."
+    assert prepare_markdown("$$x^2$$") == "$$x^2$$"
+
+
+def test_markdown_memo_is_bounded_and_keeps_recently_drawn_messages(session_state):
+    first = new_message("assistant", "first")
+    cached_markdown(first)
+    for i in range(MARKDOWN_CACHE_SIZE * 2):
+        cached_markdown(new_message("assistant", f"message {i}"))
+        cached_markdown(first)  # Still on screen
+    assert len(session_state.rendered_markdown) == MARKDOWN_CACHE_SIZE
+    assert first["id"] in session_state.rendered_markdown
+
+
+def test_messages_loaded_from_storage_keep_their_ids():
+    messages = compact_messages([{"role": "user", "content": "hi", "id": "abc", "seq": 3}])
+    assert (messages[0]["id"], messages[0]["seq"], messages[0]["content"]) == ("abc", 3, "hi")
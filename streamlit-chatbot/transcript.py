@@ -0,0 +1,126 @@
+import sys
+import uuid
+from collections import OrderedDict
+
+import streamlit as st
+
+# --- Incremental Transcript Rendering ---
+# Only the most recent messages of a conversation are drawn on each run; older
+# ones are paged in on demand. Prepared markdown is memoized per message id, for the
+# most recently drawn messages only.
+
+DEFAULT_VISIBLE_MESSAGES = 30  # Messages shown when a conversation is opened
+PAGE_SIZE = 30                 # Extra messages revealed by "Show earlier messages"
+ASSISTANT_AVATAR = "🫒"
+MARKDOWN_CACHE_SIZE = 4 * DEFAULT_VISIBLE_MESSAGES  # Memoized messages per session, least recently drawn dropped first
+
+
+class Message:
+    """A chat message kept in session state. Slotted, with interned role strings, so long histories stay small.
+
+    Supports the dict-style access used for storage records (message["role"], .get("seq"), "seq" in message);
+    a field that is None counts as missing.
+    """
+
+    __slots__ = ("id", "seq", "role", "content", "tokens")  # "tokens" is memoized by the context window
+
+    def __init__(self, role, content, id=None, seq=None):
+        self.id = id
+        self.seq = seq
+        self.role = sys.intern(role)
+        self.content = content
+        self.tokens = None
+
+    def __getitem__(self, key):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        setattr(self, key, sys.intern(value) if key == "role" else value)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and getattr(self, key) is not None
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+
+def new_message(role, content):
+    """Creates a chat message record with a stable id used for render caching."""
+    return Message(role, content, id=uuid.uuid4().hex)
+
+
+def compact_messages(records):
+    """Turns message dicts loaded from storage into Message records."""
+    return [Message(r["role"], r["content"], id=r.get("id"), seq=r.get("seq")) for r in records]
+
+
+def prepare_markdown(content):
+    """Turns raw model output into the markdown that is sent to the browser."""
+    return content.replace("\r\n", "\n").rstrip()
+
+
+def _markdown_cache():
+    if not isinstance(st.session_state.get("rendered_markdown"), OrderedDict):
+        st.session_state.rendered_markdown = OrderedDict()
+    return st.session_state.rendered_markdown
+
+
+def cached_markdown(message):
+    """Returns the prepared markdown for a message, computing it only once while it stays on screen."""
+    if "id" not in message:
+        message["id"] = uuid.uuid4().hex  # Messages created before ids were introduced
+    cache = _markdown_cache()
+    rendered = cache.get(message["id"])
+    if rendered is None:
+        rendered = cache[message["id"]] = prepare_markdown(message["content"])
+        while len(cache) > MARKDOWN_CACHE_SIZE:
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(message["id"])
+    return rendered
+
+
+def forget_rendered_messages():
+    """Drops memoized markdown, e.g. after histories were wiped."""
+    st.session_state.rendered_markdown = OrderedDict()
+    st.session_state.transcript_visible = {}
+
+
+def render_transcript(messages, conversation_key, user_avatar, total_messages=None, load_older=None):
+    """Renders the tail of a conversation, with a button to page in older messages.
+
+    `messages` may be only the in-memory tail of a longer conversation; in that case
+    `total_messages` is its full length and `load_older(count)` returns the list with
+    up to `count` older messages prepended.
+    """
+    if "transcript_visible" not in st.session_state:
+        st.session_state.transcript_visible = {}
+    visible = st.session_state.transcript_visible.get(conversation_key, DEFAULT_VISIBLE_MESSAGES)
+    total = len(messages) if total_messages is None else max(total_messages, len(messages))
+
+    hidden = total - visible
+    if hidden > 0:
+        if st.button(f"Show {min(PAGE_SIZE, hidden)} earlier messages ({hidden} hidden)", key=f"show_earlier_{conversation_key}"):
+            visible += PAGE_SIZE
+            st.session_state.transcript_visible[conversation_key] = visible
+    if visible > len(messages) and total > len(messages) and load_older is not None:
+        messages = load_older(min(visible, total) - len(messages))
+
+    for message in messages[-visible:] if visible < len(messages) else messages:
+        avatar = ASSISTANT_AVATAR if message["role"] == "assistant" else user_avatar
+        with st.chat_message(message["role"], avatar=avatar):
+            st.markdown(cached_markdown(message))
+
+
+def render_message_context(messages, highlight_seq, user_avatar):
+    """Renders a few messages around a search hit, marking the hit itself."""
+    for message in messages:
+        avatar = ASSISTANT_AVATAR if message["role"] == "assistant" else user_avatar
+        with st.chat_message(message["role"], avatar=avatar):
+            if message["seq"] == highlight_seq:
+                st.caption("🔎 Found it!")
+            st.markdown(cached_markdown(message))